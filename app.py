@@ -1,13 +1,203 @@
 
+from datetime import datetime
+from pathlib import Path
+import json
+from typing import Optional
+
 import typer
 from typing_extensions import Annotated
 
 from src import config
+from src.archive import ManifestArchive
+from src.budget import CursorStore, RunBudget
 from src.engine import RuleEngine
+from src.history import HistoryStore
+from src.linking import LinkMode
+from src.locking import TargetLeases
+from src.parallel import ParallelRuleEngine
+from src.plan import read_plan, unchanged_actions, write_plan
 from src.processor import FileProcessor
+from src.pruning import EmptyDirectoryPruner
+from src.profiling import RuleProfiler
+from src.reporting import LogFormat, Reporter, make_reporter
+from src.snapshot import Snapshot, SnapshotWriter
+from src.stability import settled
+from src.throttle import IOThrottle, set_idle_priority
 from src.undo import UndoManager
 
 app = typer.Typer()
+history_app = typer.Typer(help="Query the history of previous runs.")
+app.add_typer(history_app, name="history")
+
+VerboseOption = Annotated[
+    bool,
+    typer.Option("--verbose", "-v", help="Print a line for every file moved or reverted."),
+]
+MaxOpsOption = Annotated[
+    Optional[float],
+    typer.Option("--max-ops", help="Limit file operations (stats and moves) per second."),
+]
+MaxBytesOption = Annotated[
+    Optional[int],
+    typer.Option("--max-bytes-per-sec", help="Limit bytes copied per second by cross-device moves."),
+]
+IdleOption = Annotated[
+    bool,
+    typer.Option("--idle", help="Run at idle CPU and I/O priority."),
+]
+SettleOption = Annotated[
+    Optional[float],
+    typer.Option(
+        "--settle",
+        help="Leave files modified in the last SECONDS for the next run unless they stop changing.",
+    ),
+]
+LinkModeOption = Annotated[
+    Optional[LinkMode],
+    typer.Option(
+        "--link-mode",
+        help="Leave files in place and create links to them in the rule destinations instead.",
+    ),
+]
+VerifyOption = Annotated[
+    bool,
+    typer.Option(
+        "--verify",
+        help="Hash every file moved, check copies across devices and record the hash for undo.",
+    ),
+]
+MaxFilesOption = Annotated[
+    Optional[int],
+    typer.Option("--max-files", min=1, help="Stop after moving this many files; the next run resumes."),
+]
+MaxSizeOption = Annotated[
+    Optional[int],
+    typer.Option("--max-size", min=1, help="Stop after moving this many bytes; the next run resumes."),
+]
+MaxDepthOption = Annotated[
+    Optional[int],
+    typer.Option("--max-depth", min=0, help="Scan at most this many directory levels below each target."),
+]
+MaxSecondsOption = Annotated[
+    Optional[float],
+    typer.Option("--max-seconds", help="Stop scanning and moving after this many seconds; the next run resumes."),
+]
+LogFormatOption = Annotated[
+    LogFormat,
+    typer.Option(
+        "--log-format",
+        help="Output format: 'text' for people, 'jsonl' for one JSON event per line.",
+    ),
+]
+
+
+def setup_throttle(
+    cfg: config.Config,
+    max_ops: Optional[float],
+    max_bytes: Optional[int],
+    idle: bool,
+    reporter: Reporter,
+) -> Optional[IOThrottle]:
+    """Applies the CLI throttle overrides to the config and returns the shared throttle."""
+    if max_ops is not None:
+        cfg.throttle.ops_per_second = max_ops
+    if max_bytes is not None:
+        cfg.throttle.bytes_per_second = max_bytes
+    if idle:
+        cfg.throttle.idle_priority = True
+
+    if cfg.throttle.idle_priority and not set_idle_priority():
+        reporter.warning("Idle I/O priority is not supported here; only CPU priority was lowered.")
+    return IOThrottle.from_config(cfg.throttle)
+
+
+def setup_budget(
+    cfg: config.Config,
+    max_files: Optional[int],
+    max_size: Optional[int],
+    max_depth: Optional[int],
+    max_seconds: Optional[float],
+    cursors: CursorStore,
+) -> RunBudget:
+    """Applies the CLI budget overrides to the config and returns the run's budget."""
+    if max_files is not None:
+        cfg.budget.max_files = max_files
+    if max_size is not None:
+        cfg.budget.max_bytes = max_size
+    if max_depth is not None:
+        cfg.budget.max_depth = max_depth
+    if max_seconds is not None:
+        cfg.budget.max_seconds = max_seconds
+    budget = RunBudget.from_config(cfg.budget)
+    if budget.active:
+        budget.resume_from = cursors.load()
+    return budget
+
+
+def save_cursor(
+    budget: RunBudget,
+    engine: RuleEngine,
+    unfinished: list,
+    cursors: CursorStore,
+    reporter: Reporter,
+    left: list = (),
+) -> None:
+    """
+    Saves where a bounded run stopped, or clears the cursor once it got through.
+
+    `left` are sources the run passed over (still being written, or failed
+    to move); when the run stopped early it resumes from the first of them.
+    """
+    if budget.stopped:
+        unfinished = list(unfinished) + list(left)
+    for source in unfinished:
+        cursor = engine.cursor_for(source)
+        if cursor is not None:
+            budget.stop(cursor)
+    cursors.save(budget.stop_at)
+    if budget.stop_at is not None:
+        reporter.info(f"\nStopped early: {budget.stopped}. The next run resumes from here.")
+
+
+def configured_object_storage() -> Optional[config.ObjectStorage]:
+    """The object storage settings from config.yaml, if there is a readable one."""
+    try:
+        return config.read_config().object_storage
+    except Exception:
+        return None
+
+
+def open_snapshot(path: Path, reporter: Reporter) -> Snapshot:
+    try:
+        return Snapshot(path)
+    except (OSError, ValueError) as e:
+        reporter.info(f"Error reading snapshot: {e}")
+        raise typer.Exit(code=1)
+
+
+def report_deferred(deferred: list, reporter: Reporter) -> None:
+    for action in deferred:
+        reporter.warning(f"Deferred (still being written): {action[0]}")
+    if deferred:
+        reporter.info(f"\n{len(deferred)} file(s) still being written were left for the next run.")
+
+
+def lease_targets(cfg: config.Config, leases: TargetLeases, reporter: Reporter) -> list:
+    """Returns the targets this instance could lease, warning about the others."""
+    leased = []
+    for target in cfg.targets():
+        target_dir = Path(target.path).expanduser()
+        try:
+            acquired = not target_dir.is_dir() or leases.acquire(target_dir)
+        except OSError as e:
+            reporter.warning(f"Skipping '{target_dir}': could not create its lease file: {e}")
+            continue
+        if acquired:
+            leased.append(target)
+        else:
+            reporter.warning(f"Skipping '{target_dir}': another instance holds its lease.")
+    return leased
+
 
 @app.command()
 def clean(
@@ -17,55 +207,371 @@ def clean(
             "--dry-run",
             help="Preview the file operations without making any changes."
         ),
-    ] = False
+    ] = False,
+    processes: Annotated[
+        int,
+        typer.Option(
+            "--processes",
+            min=1,
+            help="Scan and classify in this many worker processes."
+        ),
+    ] = 1,
+    plan: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--plan",
+            help="Preview the file operations and save them to a plan file for 'apply'. Implies --dry-run."
+        ),
+    ] = None,
+    snapshot: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--snapshot",
+            help="Classify the files recorded by 'fylum scan --snapshot' instead of scanning. Implies --dry-run."
+        ),
+    ] = None,
+    lease: Annotated[
+        bool,
+        typer.Option(
+            "--lease",
+            help="Skip target directories another running instance is working on, and claim the rest."
+        ),
+    ] = False,
+    max_ops: MaxOpsOption = None,
+    max_bytes_per_sec: MaxBytesOption = None,
+    idle: IdleOption = False,
+    settle: SettleOption = None,
+    link_mode: LinkModeOption = None,
+    verify: VerifyOption = False,
+    max_files: MaxFilesOption = None,
+    max_size: MaxSizeOption = None,
+    max_depth: MaxDepthOption = None,
+    max_seconds: MaxSecondsOption = None,
+    prune_empty_dirs: Annotated[
+        bool,
+        typer.Option(
+            "--prune-empty-dirs",
+            help="Remove the folders left empty by the moves; undo recreates them."
+        ),
+    ] = False,
+    verbose: VerboseOption = False,
+    log_format: LogFormatOption = LogFormat.text,
 ):
     """Organizes files in the target directories based on the rules in config.yaml."""
     cfg = config.load_config()
-    typer.echo("Configuration loaded successfully.")
-    
-    if dry_run:
-        typer.echo("--- DRY RUN MODE ---")
-        typer.echo("No files will be moved or renamed.")
-
-    # Instantiate and run the engine
-    engine = RuleEngine(config=cfg, dry_run=dry_run)
-    actions = engine.process_directories()
-
-    if not actions:
-        typer.echo("\nNo files found that match the configured rules.")
-        typer.echo("This could mean:")
-        typer.echo("  - All files are already organized")
-        typer.echo("  - Target directories are empty")
-        typer.echo("  - No files match the rule extensions in config.yaml")
-        raise typer.Exit()
+    reporter = make_reporter(verbose, log_format)
+    echo = reporter.info
+    echo("Configuration loaded successfully.")
+    throttle = setup_throttle(cfg, max_ops, max_bytes_per_sec, idle, reporter)
+    cursors = CursorStore()
+    budget = setup_budget(cfg, max_files, max_size, max_depth, max_seconds, cursors)
+    if budget.active and processes > 1:
+        echo("Error: run limits need an ordered scan and cannot be combined with --processes.")
+        raise typer.Exit(code=1)
 
-    typer.echo(f"\nFound {len(actions)} file(s) to process.")
+    # Leases are held until the run is over; releasing them removes their files.
+    with TargetLeases() as leases:
+        if lease:
+            cfg.target_directories = lease_targets(cfg, leases, reporter)
 
-    processor = FileProcessor(rename_format=cfg.rename_format, dry_run=dry_run)
-    processed = processor.process_actions(actions)
+        # A snapshot may be stale or from another machine, so it is never acted on.
+        if plan is not None or snapshot is not None:
+            dry_run = True
 
-    if dry_run:
-        typer.echo(f"\n[DRY RUN] Would have processed {processed} file(s).")
-    else:
-        typer.echo(f"\nSuccessfully processed {processed} file(s).")
-        typer.echo("Manifests created/updated:")
-        typer.echo("  - _fylum_index.md (human-readable)")
-        typer.echo("  - _fylum_index.json (machine-readable)")
-    
-    typer.echo("\nDone.")
+        if dry_run:
+            echo("--- DRY RUN MODE ---")
+            echo("No files will be moved or renamed.")
+
+        # Instantiate and run the engine
+        if snapshot is not None:
+            engine = RuleEngine(config=cfg, dry_run=dry_run, reporter=reporter)
+            with open_snapshot(snapshot, reporter) as files:
+                actions = engine.process_files(files)
+        else:
+            if processes > 1:
+                engine = ParallelRuleEngine(config=cfg, processes=processes, dry_run=dry_run, reporter=reporter)
+            else:
+                engine = RuleEngine(config=cfg, dry_run=dry_run, throttle=throttle, reporter=reporter, budget=budget)
+            actions = engine.process_directories()
+
+        # Dry runs leave the cursor alone, so they never move the next real run on.
+        bounded = budget.active and snapshot is None and not dry_run
+        if not actions:
+            if bounded:
+                save_cursor(budget, engine, [], cursors, reporter)
+            echo("\nNo files found that match the configured rules.")
+            echo("This could mean:")
+            echo("  - All files are already organized")
+            echo("  - Target directories are empty")
+            echo("  - No files match the rule extensions in config.yaml")
+            raise typer.Exit()
+
+        echo(f"\nFound {len(actions)} file(s) to process.")
+
+        processor = FileProcessor(
+            rename_format=cfg.rename_format,
+            dry_run=dry_run,
+            rotation=cfg.manifest_rotation,
+            reporter=reporter,
+            throttle=throttle,
+            verify=verify,
+            link_mode=link_mode,
+            object_storage=cfg.object_storage,
+            plugins=cfg.plugins,
+        )
+        deferred = []
+        if settle is not None:
+            cfg.settle_seconds = settle
+        if prune_empty_dirs:
+            cfg.prune_empty_dirs = True
+        # Emptied folders are worked out from the scan, so a snapshot cannot prune.
+        pruner = None
+        if cfg.prune_empty_dirs and snapshot is None:
+            pruner = EmptyDirectoryPruner(engine.directory_counts, [target.path for target in cfg.targets()])
+        if dry_run:
+            processed = processor.process_actions(actions)
+        else:
+            processed = processor.process_actions(settled(actions, cfg.settle_seconds, deferred), budget, pruner)
+            report_deferred(deferred, reporter)
+            if processor.removed_directories:
+                echo(f"Removed {len(processor.removed_directories)} empty folder(s).")
+        if bounded:
+            left = [action[0] for action in deferred] + processor.failed
+            save_cursor(budget, engine, processor.unfinished, cursors, reporter, left)
+
+        if plan is not None:
+            write_plan(plan, actions, cfg.rename_format)
+            echo(f"\n[DRY RUN] Would have processed {processed} file(s).")
+            echo(f"Plan written to {plan}. Run 'fylum apply {plan}' to execute it.")
+        elif dry_run:
+            echo(f"\n[DRY RUN] Would have processed {processed} file(s).")
+        else:
+            echo(f"\nSuccessfully processed {processed} file(s).")
+            echo("Manifests created/updated:")
+            echo("  - _fylum_index.md (human-readable)")
+            echo("  - _fylum_index.json (machine-readable)")
+
+        echo("\nDone.")
 
 @app.command()
-def undo():
-    """Reverts the last cleaning operation."""
-    typer.echo("Looking for the index manifest to undo the last operation...")
-    
-    undo_manager = UndoManager()
-    reverted_count = undo_manager.revert_last_run()
+def apply(
+    plan: Annotated[Path, typer.Argument(help="Plan file written by 'clean --plan'.")],
+    max_ops: MaxOpsOption = None,
+    max_bytes_per_sec: MaxBytesOption = None,
+    idle: IdleOption = False,
+    settle: SettleOption = None,
+    link_mode: LinkModeOption = None,
+    verify: VerifyOption = False,
+    verbose: VerboseOption = False,
+    log_format: LogFormatOption = LogFormat.text,
+):
+    """Executes a saved plan without rescanning, skipping files that changed since."""
+    cfg = config.load_config()
+    reporter = make_reporter(verbose, log_format)
+    echo = reporter.info
+    throttle = setup_throttle(cfg, max_ops, max_bytes_per_sec, idle, reporter)
+
+    try:
+        header, planned = read_plan(plan)
+    except (OSError, ValueError) as e:
+        echo(f"Error reading plan: {e}")
+        raise typer.Exit(code=1)
+
+    echo(f"Applying plan from {header['created']} ({header['actions']} file(s))...")
+
+    skipped = []
+    processor = FileProcessor(
+        rename_format=header["rename_format"],
+        rotation=cfg.manifest_rotation,
+        reporter=reporter,
+        throttle=throttle,
+        verify=verify,
+        link_mode=link_mode,
+        object_storage=cfg.object_storage,
+        plugins=cfg.plugins,
+    )
+    deferred = []
+    if settle is not None:
+        cfg.settle_seconds = settle
+    # Read in full, so the processor can schedule the whole plan and report an ETA.
+    actions = list(unchanged_actions(planned, skipped))
+    processed = processor.process_actions(settled(actions, cfg.settle_seconds, deferred))
+
+    for action in skipped:
+        reporter.warning(f"Skipped (changed since planning): {action.source}")
+    report_deferred(deferred, reporter)
+
+    echo(f"\nSuccessfully processed {processed} file(s), skipped {len(skipped)}.")
+    echo("\nDone.")
+
+@app.command()
+def undo(
+    run: Annotated[
+        Optional[int],
+        typer.Option("--run", help="Only undo the moves made by this run id."),
+    ] = None,
+    since: Annotated[
+        Optional[datetime],
+        typer.Option("--since", help="Only undo moves from runs at or after this timestamp."),
+    ] = None,
+    rule: Annotated[
+        Optional[str],
+        typer.Option("--rule", help="Only undo moves made by this rule."),
+    ] = None,
+    path_prefix: Annotated[
+        Optional[str],
+        typer.Option("--path-prefix", help="Only undo moves from or to paths under this prefix."),
+    ] = None,
+    verbose: VerboseOption = False,
+    log_format: LogFormatOption = LogFormat.text,
+):
+    """Reverts the last cleaning operation, or only the moves matching the given filters."""
+    reporter = make_reporter(verbose, log_format)
+    echo = reporter.info
+    undo_manager = UndoManager(reporter=reporter, object_storage=configured_object_storage())
+
+    if run is None and since is None and rule is None and path_prefix is None:
+        echo("Looking for the index manifest to undo the last operation...")
+        reverted_count = undo_manager.revert_last_run()
+    else:
+        if path_prefix is not None:
+            path_prefix = str(Path(path_prefix).expanduser())
+        reverted_count = undo_manager.revert(
+            run_id=run, since=since, rule=rule, path_prefix=path_prefix
+        )
     
     if reverted_count > 0:
-        typer.echo(f"Successfully reverted {reverted_count} files to their original locations.")
+        echo(f"Successfully reverted {reverted_count} files to their original locations.")
+    else:
+        echo("No files were reverted.")
+
+
+@app.command()
+def scan(
+    snapshot: Annotated[
+        Path,
+        typer.Option("--snapshot", help="File to write the snapshot to."),
+    ],
+):
+    """Records every file in the target directories with its metadata, for 'clean --snapshot' and 'profile --snapshot'."""
+    cfg = config.load_config()
+    engine = RuleEngine(config=cfg, dry_run=True)
+    with SnapshotWriter(snapshot) as writer:
+        for target in cfg.targets():
+            target_dir = Path(target.path).expanduser()
+            if not target_dir.is_dir():
+                engine.reporter.warning(f"Target directory '{target_dir}' does not exist or is not a directory.")
+                continue
+            writer.add_all(engine.scan(target_dir))
+    engine.reporter.finish()
+    typer.echo(f"Wrote {writer.count} file(s) to {snapshot}.")
+
+
+@app.command()
+def profile(
+    snapshot: Annotated[
+        Optional[Path],
+        typer.Option("--snapshot", help="Profile the files recorded by 'fylum scan --snapshot' instead of scanning."),
+    ] = None,
+    json_output: Annotated[
+        bool,
+        typer.Option("--json", help="Print the results as JSON."),
+    ] = False,
+):
+    """Measures the cost and matches of every rule and ignore pattern without moving anything."""
+    cfg = config.load_config()
+    engine = RuleEngine(config=cfg, dry_run=True)
+    profiler = RuleProfiler(engine)
+    if snapshot is not None:
+        with open_snapshot(snapshot, engine.reporter) as files:
+            profiler.profile_files(engine.with_scopes(files))
+    else:
+        profiler.profile_directories()
+    engine.reporter.finish()
+    results = profiler.results()
+
+    if json_output:
+        typer.echo(json.dumps({
+            "files": profiler.files,
+            "scan_seconds": profiler.scan_seconds,
+            "results": [stats.to_dict() for stats in results],
+        }, indent=2))
+        return
+
+    typer.echo(f"Profiled {profiler.files} file(s); scanning took {profiler.scan_seconds:.3f}s.\n")
+    typer.echo(f"{'Kind':<8} {'Name':<32} {'Evals':>9} {'Matches':>9} {'Shadowed':>9} {'Time (ms)':>10}  Verdict")
+    for stats in results:
+        typer.echo(
+            f"{stats.kind:<8} {stats.name[:32]:<32} {stats.evaluations:>9} {stats.matches:>9} "
+            f"{stats.shadowed:>9} {stats.seconds * 1000:>10.2f}  {stats.verdict}"
+        )
+
+    dead = [stats for stats in results if stats.verdict]
+    if dead:
+        typer.echo("\nNever decided a file (consider removing or reordering):")
+        for stats in dead:
+            reason = "only matches files decided earlier" if stats.verdict == "shadowed" else "matches nothing"
+            typer.echo(f"  - {stats.kind} '{stats.name}': {reason}")
+
+
+@history_app.command("find")
+def history_find(
+    path: Annotated[str, typer.Argument(help="Original or new path of a file.")]
+):
+    """Shows every recorded move to or from a path."""
+    history = HistoryStore()
+
+    candidates = [path, str(Path(path).expanduser().resolve())]
+    matches = []
+    for candidate in dict.fromkeys(candidates):
+        matches = history.find(candidate)
+        if matches:
+            break
+
+    if not matches:
+        typer.echo(f"No history found for '{path}'.")
+        raise typer.Exit()
+
+    for match in matches:
+        typer.echo(f"Run {match['run_id']} ({match['timestamp']}): {match['source']} -> {match['destination']}")
+
+
+@history_app.command("show")
+def history_show(
+    run_id: Annotated[int, typer.Argument(help="Id of the run to show.")],
+    archived: Annotated[
+        bool,
+        typer.Option("--archived", help="Read the run from the archived manifest segments."),
+    ] = False,
+):
+    """Lists the moves made by a single run."""
+    if archived:
+        run = ManifestArchive().find_run(run_id)
     else:
-        typer.echo("No files were reverted.")
+        run = HistoryStore().get_run(run_id)
+
+    if run is None:
+        typer.echo(f"Run {run_id} not found.")
+        raise typer.Exit(code=1)
+
+    typer.echo(f"Run {run['run_id']} - {run['timestamp']} ({len(run['actions'])} file(s))")
+    for action in run["actions"]:
+        typer.echo(f"  {action['source']} -> {action['destination']}")
+
+
+@history_app.command("segments")
+def history_segments():
+    """Lists the archived manifest segments and the runs they hold."""
+    segments = ManifestArchive().segments()
+    if not segments:
+        typer.echo("No archived manifest segments.")
+        raise typer.Exit()
+
+    for entry in segments:
+        typer.echo(
+            f"{entry['segment']}: runs {entry['first_run_id']}-{entry['last_run_id']} "
+            f"({entry['first_timestamp']} to {entry['last_timestamp']}, {entry['compression']})"
+        )
 
 
 @app.callback()
@@ -32,6 +32,9 @@ setup(
         "pydantic>=2.0.0",
         "PyYAML>=6.0",
     ],
+    extras_require={
+        "zstd": ["zstandard>=0.21.0"],
+    },
     entry_points={
         "console_scripts": [
             "fylum=app:app",
@@ -0,0 +1,147 @@
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Union
+import time
+
+from src.config import LOCAL_CONFIG_FILE_NAME, Config, read_config
+from src.engine import FileMatch, RuleEngine, RuleScope
+from src.history import HistoryStore
+from src.linking import LinkMode
+from src.plan import read_plan, unchanged_actions
+from src.processor import FileProcessor
+from src.reporting import Reporter
+from src.stability import settled
+from src.throttle import IOThrottle
+from src.undo import UndoManager
+
+
+class Fylum:
+    """
+    Programmatic entry point for embedding fylum in another process.
+
+    Takes a `Config` directly and reports through the given `Reporter`
+    (silent by default) instead of printing. The compiled rules, history
+    connection and throttle are created once and reused by every call, so
+    a long-lived instance classifies and moves batches of files without
+    any per-call setup.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        reporter: Optional[Reporter] = None,
+        history: Optional[HistoryStore] = None,
+        throttle: Optional[IOThrottle] = None,
+        verify: bool = False,
+        link_mode: Optional[LinkMode] = None,
+    ):
+        self.config = config
+        self.reporter = reporter or Reporter()
+        self.history = history or HistoryStore()
+        self.verify = verify
+        self.link_mode = link_mode
+        self.engine = RuleEngine(config=config, throttle=throttle, reporter=self.reporter)
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path], **kwargs) -> "Fylum":
+        """Builds an instance from a config file, raising on invalid config."""
+        return cls(read_config(str(path)), **kwargs)
+
+    def close(self) -> None:
+        self.history.close()
+
+    def __enter__(self) -> "Fylum":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def scan(self) -> List[FileMatch]:
+        """Scans every target directory, like `fylum clean --dry-run`."""
+        return self.engine.process_directories()
+
+    def classify(self, paths: Iterable[Union[str, Path]]) -> List[FileMatch]:
+        """
+        Classifies individual files without scanning their directories.
+
+        Each file gets the rules and ignore patterns of the target and
+        `.fylum.yaml` files it sits under; files outside every target get
+        the top-level ones. Files that match no rule are left out, and
+        files that cannot be stat'ed are reported as errors. `classify`
+        plugins see the matches, as they do in `scan`.
+        """
+        now = time.time()
+        scopes: Dict[Path, RuleScope] = {}
+        matches = []
+        for path in paths:
+            path = Path(path).expanduser().absolute()
+            if path.name == LOCAL_CONFIG_FILE_NAME:
+                continue
+            directory = path.parent
+            scope = scopes.get(directory)
+            if scope is None:
+                scope = scopes[directory] = self.engine.scope_for_directory(directory)
+            try:
+                match = self.engine.classify(path, None, now, scope)
+            except OSError as e:
+                self.reporter.error(path, e)
+                continue
+            if match is not None:
+                matches.append(match)
+        return self.engine.plugins.classify(matches)
+
+    def execute(self, plan: Union[Iterable, str, Path], dry_run: bool = False) -> int:
+        """
+        Carries out planned moves and returns how many were made.
+
+        `plan` is what `classify` or `scan` returned, any iterable of
+        (source, destination) pairs, or the path of a plan file written by
+        `fylum clean --plan`; files that changed since a plan file was
+        written, and files still being written (see `settle_seconds`), are
+        skipped with a warning.
+        """
+        rename_format = self.config.rename_format
+        skipped = []
+        if isinstance(plan, (str, Path)):
+            header, planned = read_plan(Path(plan))
+            rename_format = header["rename_format"]
+            # Read in full, so the processor can schedule the whole plan.
+            plan = list(unchanged_actions(planned, skipped))
+
+        processor = FileProcessor(
+            rename_format=rename_format,
+            dry_run=dry_run,
+            history=self.history,
+            rotation=self.config.manifest_rotation,
+            reporter=self.reporter,
+            throttle=self.engine.throttle,
+            verify=self.verify,
+            link_mode=self.link_mode,
+            object_storage=self.config.object_storage,
+            plugins=self.config.plugins,
+        )
+        deferred = []
+        if not dry_run:
+            plan = settled(plan, self.config.settle_seconds, deferred)
+        processed = processor.process_actions(plan)
+
+        for action in skipped:
+            self.reporter.warning(f"Skipped (changed since planning): {action.source}")
+        for action in deferred:
+            self.reporter.warning(f"Deferred (still being written): {action[0]}")
+        return processed
+
+    def undo(
+        self,
+        run_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        rule: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+    ) -> int:
+        """Reverts the last run, or only the recorded moves matching the filters."""
+        undo_manager = UndoManager(
+            history=self.history, reporter=self.reporter, object_storage=self.config.object_storage
+        )
+        if run_id is None and since is None and rule is None and path_prefix is None:
+            return undo_manager.revert_last_run()
+        return undo_manager.revert(run_id=run_id, since=since, rule=rule, path_prefix=path_prefix)
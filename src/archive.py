@@ -0,0 +1,164 @@
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import gzip
+import json
+import os
+import re
+import shutil
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency: pip install fylum[zstd]
+    zstandard = None
+
+from src.config import ManifestRotation
+
+
+ARCHIVE_DIR = "_fylum_archive"
+ARCHIVE_INDEX = "index.json"
+
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+_TIMESTAMP_PATTERN = re.compile(rb'"timestamp":\s*"([^"]+)"')
+
+
+def _open_compressed(path: Path, mode: str, compression: str):
+    if compression == "zstd":
+        if "w" in mode:
+            return zstandard.ZstdCompressor().stream_writer(open(path, "wb"), closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return gzip.open(path, mode)
+
+
+class ManifestArchive:
+    """
+    Rotates the manifests into compressed segments in `_fylum_archive/`.
+
+    The current `_fylum_index.md` / `_fylum_index.json` pair is left
+    uncompressed; once it outgrows the configured size or age it is
+    compressed into a numbered segment and a fresh pair is started. A small
+    index maps run ids and timestamps to segments, so a lookup only ever
+    decompresses the segment that holds the run.
+    """
+
+    def __init__(self, archive_dir: Path = Path(ARCHIVE_DIR)):
+        self.archive_dir = Path(archive_dir)
+        self.index_path = self.archive_dir / ARCHIVE_INDEX
+
+    def segments(self) -> List[Dict]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return []
+
+    def needs_rotation(self, md_path: Path, json_path: Path, rotation: ManifestRotation) -> bool:
+        if not json_path.exists():
+            return False
+
+        if rotation.max_bytes is not None:
+            size = json_path.stat().st_size
+            if md_path.exists():
+                size = max(size, md_path.stat().st_size)
+            if size >= rotation.max_bytes:
+                return True
+
+        if rotation.max_age_days is not None:
+            # Runs are appended in order, so the first timestamp is the oldest.
+            with open(json_path, "rb") as f:
+                match = _TIMESTAMP_PATTERN.search(f.read(4096))
+            if match:
+                try:
+                    oldest = datetime.fromisoformat(match.group(1).decode("utf-8"))
+                except ValueError:
+                    return False
+                if datetime.now() - oldest >= timedelta(days=rotation.max_age_days):
+                    return True
+
+        return False
+
+    def rotate_if_needed(self, md_path: Path, json_path: Path, rotation: ManifestRotation) -> Optional[Dict]:
+        if self.needs_rotation(md_path, json_path, rotation):
+            return self.rotate(md_path, json_path, rotation.compression)
+        return None
+
+    def rotate(self, md_path: Path, json_path: Path, compression: str = "gzip") -> Optional[Dict]:
+        """Compresses the current manifests into a new segment and removes them."""
+        if not json_path.exists() and not md_path.exists():
+            return None
+
+        if compression == "zstd" and zstandard is None:
+            # Config validation rejects zstd without zstandard installed.
+            raise RuntimeError("zstd compression needs zstandard; install it with 'pip install fylum[zstd]'")
+
+        runs = []
+        if json_path.exists():
+            try:
+                with open(json_path, "r", encoding="utf-8") as f:
+                    runs = json.load(f)
+            except (json.JSONDecodeError, IOError):
+                runs = []
+
+        run_ids = [run["run_id"] for run in runs if isinstance(run, dict) and "run_id" in run]
+        timestamps = [run["timestamp"] for run in runs if isinstance(run, dict) and "timestamp" in run]
+
+        segments = self.segments()
+        name = f"segment-{len(segments) + 1:06d}"
+        extension = EXTENSIONS[compression]
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+
+        entry = {
+            "segment": name,
+            "compression": compression,
+            "first_run_id": min(run_ids) if run_ids else None,
+            "last_run_id": max(run_ids) if run_ids else None,
+            "first_timestamp": min(timestamps) if timestamps else None,
+            "last_timestamp": max(timestamps) if timestamps else None,
+            "runs": len(runs),
+        }
+        for key, source in (("json", json_path), ("md", md_path)):
+            if not source.exists():
+                continue
+            target = self.archive_dir / f"{name}{source.suffix}{extension}"
+            with open(source, "rb") as src, _open_compressed(target, "wb", compression) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            entry[key] = target.name
+
+        segments.append(entry)
+        temp_index = self.index_path.with_suffix(".tmp")
+        with open(temp_index, "w", encoding="utf-8") as f:
+            json.dump(segments, f, indent=2)
+        os.replace(temp_index, self.index_path)
+
+        json_path.unlink(missing_ok=True)
+        md_path.unlink(missing_ok=True)
+        return entry
+
+    def segment_for_run(self, run_id: int) -> Optional[Dict]:
+        for entry in self.segments():
+            first, last = entry.get("first_run_id"), entry.get("last_run_id")
+            if first is not None and first <= run_id <= last:
+                return entry
+        return None
+
+    def read_segment(self, entry: Dict) -> List[Dict]:
+        if "json" not in entry:
+            return []
+        with _open_compressed(self.archive_dir / entry["json"], "rb", entry["compression"]) as f:
+            return json.loads(f.read().decode("utf-8"))
+
+    def find_run(self, run_id: int) -> Optional[Dict]:
+        """Returns an archived run, decompressing only the segment that holds it."""
+        entry = self.segment_for_run(run_id)
+        if entry is None:
+            return None
+        # A run that overlapped another is split into several entries.
+        found = None
+        for run in self.read_segment(entry):
+            if run.get("run_id") == run_id:
+                if found is None:
+                    found = run
+                else:
+                    found["actions"].extend(run.get("actions", []))
+        return found
@@ -0,0 +1,200 @@
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+import json
+import os
+import struct
+import tarfile
+
+
+ARCHIVE_CACHE_PATH = "_fylum_archive_cache.json"
+
+# Upper bounds on the work spent listing one archive. Larger archives are
+# judged by the members read until a bound is hit.
+MAX_MEMBERS = 10000
+MAX_READ_BYTES = 4 * 1024 * 1024
+
+ZIP_EOCD = struct.Struct("<4s4H2LH")
+ZIP_EOCD_SIGNATURE = b"PK\x05\x06"
+ZIP_ENTRY = struct.Struct("<4s6H3L5H2L")
+ZIP_ENTRY_SIGNATURE = b"PK\x01\x02"
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+ARCHIVE_SUFFIXES = TAR_SUFFIXES + (".zip", ".gz")
+
+# {member extension: count}
+Contents = Dict[str, int]
+
+
+def _zip_member_names(path: Path) -> Iterator[str]:
+    """Reads member names from the zip central directory, never the members."""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        # The end record is followed by a comment of at most 64 KiB.
+        tail_start = max(0, end - ZIP_EOCD.size - 65535)
+        f.seek(tail_start)
+        tail = f.read()
+        position = tail.rfind(ZIP_EOCD_SIGNATURE)
+        if position < 0 or len(tail) - position < ZIP_EOCD.size:
+            return
+        _, _, _, _, entries, size, offset, _ = ZIP_EOCD.unpack_from(tail, position)
+        if offset == 0xFFFFFFFF or offset + size > end:
+            # Zip64 archives and damaged files are treated as unknown.
+            return
+
+        f.seek(offset)
+        directory = f.read(min(size, MAX_READ_BYTES))
+        position = 0
+        for _ in range(min(entries, MAX_MEMBERS)):
+            if position + ZIP_ENTRY.size > len(directory):
+                return
+            fields = ZIP_ENTRY.unpack_from(directory, position)
+            if fields[0] != ZIP_ENTRY_SIGNATURE:
+                return
+            name_length, extra_length, comment_length = fields[10], fields[11], fields[12]
+            start = position + ZIP_ENTRY.size
+            name = directory[start:start + name_length]
+            # Bit 11 marks UTF-8 names; older tools use code page 437.
+            yield name.decode("utf-8" if fields[3] & 0x800 else "cp437", "replace")
+            position = start + name_length + extra_length + comment_length
+
+
+class _BoundedReader:
+    """File wrapper that reports end-of-file after `limit` bytes."""
+
+    def __init__(self, f, limit: int):
+        self.f = f
+        self.remaining = limit
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+def _tar_member_names(path: Path) -> Iterator[str]:
+    """Streams tar headers; member data is skipped, or decompressed and discarded."""
+    with open(path, "rb") as f:
+        try:
+            with tarfile.open(fileobj=_BoundedReader(f, MAX_READ_BYTES), mode="r|*") as archive:
+                for count, member in enumerate(archive):
+                    if count >= MAX_MEMBERS:
+                        return
+                    if member.isfile():
+                        yield member.name
+        except (tarfile.TarError, EOFError, OSError):
+            # Hitting the read bound mid-member ends the listing early.
+            return
+
+
+def read_contents(path: Path) -> Optional[Contents]:
+    """
+    Counts the members of an archive by extension without extracting it.
+
+    Zip files are judged from their central directory and tar files from
+    their member headers; a `.gz` that is not a tarball holds one file
+    named like itself. Returns None for anything else.
+    """
+    name = path.name.lower()
+    if name.endswith(TAR_SUFFIXES):
+        names = _tar_member_names(path)
+    elif name.endswith(".zip"):
+        names = _zip_member_names(path)
+    elif name.endswith(".gz"):
+        names = iter([path.name[:-3]])
+    else:
+        return None
+
+    contents: Contents = {}
+    try:
+        for member in names:
+            if member.endswith("/") or member.startswith("__MACOSX/"):
+                continue
+            extension = os.path.splitext(member)[1].lower()
+            contents[extension] = contents.get(extension, 0) + 1
+    except OSError:
+        return None
+    return contents
+
+
+class ArchiveIndex:
+    """
+    Archive contents, cached by file identity.
+
+    Entries are keyed by device and inode and reused while the archive's
+    size and mtime are unchanged, so an archive is opened at most once
+    however often it is classified. Only archives that could be read are
+    cached. The cache is kept in `_fylum_archive_cache.json` between runs,
+    and entries for archives that have since been moved or deleted are
+    dropped when it is saved.
+    """
+
+    def __init__(self, cache_path: Optional[Path] = Path(ARCHIVE_CACHE_PATH)):
+        self.cache_path = cache_path
+        self._entries: Optional[Dict[str, list]] = None
+        self._dirty = False
+
+    def contents(self, path: Path, stat: os.stat_result) -> Optional[Contents]:
+        if not path.name.lower().endswith(ARCHIVE_SUFFIXES):
+            return None
+        entries = self._load()
+        key = f"{stat.st_dev}:{stat.st_ino}"
+        entry = entries.get(key)
+        # [mtime_ns, size, contents, path]
+        if entry is not None and len(entry) == 4 and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            if entry[3] != str(path):
+                entry[3] = str(path)
+                self._dirty = True
+            return entry[2]
+
+        contents = read_contents(path)
+        if contents is None:
+            return None
+        entries[key] = [stat.st_mtime_ns, stat.st_size, contents, str(path)]
+        self._dirty = True
+        return contents
+
+    def share(self, path: Path, stat: os.stat_result, extensions: set) -> float:
+        """The fraction of the archive's files with one of `extensions`."""
+        contents = self.contents(path, stat)
+        if not contents:
+            return 0.0
+        total = sum(contents.values())
+        return sum(count for extension, count in contents.items() if extension in extensions) / total
+
+    def save(self) -> None:
+        if self._entries is None or self.cache_path is None:
+            return
+        stale = [key for key, entry in self._entries.items() if not self._is_current(key, entry)]
+        for key in stale:
+            del self._entries[key]
+        if not self._dirty and not stale:
+            return
+        temp_path = self.cache_path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(temp_path, self.cache_path)
+        self._dirty = False
+
+    @staticmethod
+    def _is_current(key: str, entry: list) -> bool:
+        """Whether the archive an entry was made for is still at its path."""
+        if len(entry) != 4:
+            return False
+        try:
+            stat = os.stat(entry[3])
+        except OSError:
+            return False
+        return f"{stat.st_dev}:{stat.st_ino}" == key
+
+    def _load(self) -> Dict[str, list]:
+        if self._entries is None:
+            self._entries = {}
+            if self.cache_path is not None:
+                try:
+                    with open(self.cache_path, "r", encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError):
+                    pass
+        return self._entries
@@ -0,0 +1,116 @@
+from pathlib import Path
+from typing import Optional, Tuple
+import json
+import os
+import time
+
+from src.config import Budget
+
+
+CURSOR_PATH = "_fylum_cursor.json"
+
+# Where a run stopped: the target directory, and the path (as parts
+# relative to the target) of the first file it did not get to.
+Cursor = Tuple[str, Tuple[str, ...]]
+
+
+class RunBudget:
+    """
+    Limits on how much a single run may do.
+
+    `max_files` and `max_bytes` bound the files selected for moving,
+    `max_depth` how far below a target the scan descends, and
+    `max_seconds` the wall time of the scan and the moves together. When a
+    limit is hit the run stops cleanly and `stop_at` records where, so the
+    next run can pick up from there.
+    """
+
+    def __init__(
+        self,
+        max_files: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_depth: Optional[int] = None,
+        max_seconds: Optional[float] = None,
+        resume_from: Optional[Cursor] = None,
+    ):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_depth = max_depth
+        self.max_seconds = max_seconds
+        self.resume_from = resume_from
+        self.files = 0
+        self.bytes = 0
+        self.started_at = time.monotonic()
+        self.stopped: Optional[str] = None
+        self.stop_at: Optional[Cursor] = None
+        # The targets in scan order, so cursors in different targets compare.
+        self.targets: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_config(cls, budget: Budget, resume_from: Optional[Cursor] = None) -> "RunBudget":
+        return cls(
+            max_files=budget.max_files,
+            max_bytes=budget.max_bytes,
+            max_depth=budget.max_depth,
+            max_seconds=budget.max_seconds,
+            resume_from=resume_from,
+        )
+
+    @property
+    def active(self) -> bool:
+        return any(
+            limit is not None
+            for limit in (self.max_files, self.max_bytes, self.max_depth, self.max_seconds)
+        )
+
+    def out_of_time(self) -> bool:
+        if self.max_seconds is not None and time.monotonic() - self.started_at >= self.max_seconds:
+            self.stopped = self.stopped or f"time limit of {self.max_seconds:g}s reached"
+            return True
+        return False
+
+    def take(self, size: int) -> bool:
+        """Counts a file selected for moving; False if it would exceed a limit."""
+        if self.max_files is not None and self.files + 1 > self.max_files:
+            self.stopped = f"file limit of {self.max_files} reached"
+            return False
+        if self.max_bytes is not None and self.bytes + size > self.max_bytes and self.files:
+            self.stopped = f"size limit of {self.max_bytes} bytes reached"
+            return False
+        self.files += 1
+        self.bytes += size
+        return True
+
+    def stop(self, cursor: Cursor) -> None:
+        """Records that the run stops at `cursor`, keeping the earliest stop point."""
+        if self.stop_at is None or _order(cursor, self.targets) < _order(self.stop_at, self.targets):
+            self.stop_at = cursor
+
+
+def _order(cursor: Cursor, targets: Tuple[str, ...]):
+    target, parts = cursor
+    return (targets.index(target) if target in targets else len(targets), parts)
+
+
+class CursorStore:
+    """The resume cursor left by a run that stopped early, kept in `_fylum_cursor.json`."""
+
+    def __init__(self, path: Path = Path(CURSOR_PATH)):
+        self.path = Path(path)
+
+    def load(self) -> Optional[Cursor]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data["target"], tuple(data["resume_from"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, cursor: Optional[Cursor]) -> None:
+        if cursor is None:
+            self.path.unlink(missing_ok=True)
+            return
+        temp_path = self.path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"target": cursor[0], "resume_from": list(cursor[1])}, f)
+        os.replace(temp_path, self.path)
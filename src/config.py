@@ -1,22 +1,160 @@
 
+import importlib
+import importlib.util
+import re
+
 import yaml
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Dict, Any, Literal, Optional, Union
 
 # --- Pydantic Models for Configuration Validation ---
 
 class Rule(BaseModel):
-    """Defines a rule for classifying and moving a file."""
+    """
+    Defines a rule for classifying and moving a file.
+
+    A file matches when it satisfies every condition that is set. Leaving
+    `extensions` unset matches any extension. Rules are tried from the
+    highest `priority` down, in config order for equal priorities.
+    """
     name: str
-    extensions: List[str]
+    extensions: Optional[List[str]] = None
     destination: str
+    priority: int = 0
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    older_than_days: Optional[float] = None
+    name_pattern: Optional[str] = None
+    path_prefix: Optional[str] = None
+    # Archives (zip, tar, gz) match only when at least `archive_min_share`
+    # of the files inside have one of these extensions.
+    archive_contents: Optional[List[str]] = None
+    archive_min_share: float = 0.8
+
+    @field_validator("name_pattern")
+    @classmethod
+    def _check_name_pattern(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None:
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise ValueError(f"invalid regular expression: {e}")
+        return value
+
+class ManifestRotation(BaseModel):
+    """When and how the manifests are rotated into compressed archive segments."""
+    max_bytes: Optional[int] = 50 * 1024 * 1024
+    max_age_days: Optional[int] = None
+    compression: Literal["gzip", "zstd"] = "gzip"
+
+    @field_validator("compression")
+    @classmethod
+    def _check_compression(cls, value: str) -> str:
+        if value == "zstd" and importlib.util.find_spec("zstandard") is None:
+            raise ValueError("zstd compression needs zstandard; install it with 'pip install fylum[zstd]'")
+        return value
+
+class Throttle(BaseModel):
+    """Limits on how hard a clean may hit the disks of a shared host."""
+    ops_per_second: Optional[float] = None
+    bytes_per_second: Optional[int] = None
+    idle_priority: bool = False
+
+class Budget(BaseModel):
+    """Per-run limits; a run that hits one stops cleanly and the next one resumes."""
+    max_files: Optional[int] = None
+    max_bytes: Optional[int] = None
+    max_depth: Optional[int] = None
+    max_seconds: Optional[float] = None
+
+class ObjectStorage(BaseModel):
+    """
+    Where `s3://bucket/prefix` rule destinations are stored.
+
+    `backend` is `s3` (needs boto3), `local` (a directory standing in for
+    the store, see `root`) or `module:factory` for a custom backend.
+    """
+    backend: str = "s3"
+    endpoint_url: Optional[str] = None
+    region: Optional[str] = None
+    root: Optional[str] = None
+    part_size: int = 8 * 1024 * 1024
+    # Files uploaded at once, and parts in flight per file.
+    max_concurrency: int = 8
+    max_pool_connections: int = 16
+
+class Plugin(BaseModel):
+    """
+    A hook called with batches of files.
+
+    `hook` is a `module:function` taking a list of records and `options`.
+    `classify` hooks see the files the rules matched before anything moves
+    and may skip or reroute them; `after_move` hooks see completed moves,
+    in the background. Up to `workers` batches run at once, in threads or,
+    with `processes: true`, in worker processes.
+    """
+    hook: str
+    stage: Literal["classify", "after_move"]
+    batch_size: int = Field(default=10000, ge=1)
+    workers: int = Field(default=1, ge=1)
+    processes: bool = False
+    # Only files matched by these rules are passed to the hook.
+    rules: Optional[List[str]] = None
+    options: Dict[str, Any] = Field(default_factory=dict)
+
+    @field_validator("hook")
+    @classmethod
+    def _check_hook(cls, value: str) -> str:
+        module_name, _, attribute = value.partition(":")
+        if not module_name or not attribute:
+            raise ValueError("must be given as 'module:function'")
+        try:
+            hook = getattr(importlib.import_module(module_name), attribute)
+        except (ImportError, AttributeError) as e:
+            raise ValueError(f"cannot import '{value}': {e}")
+        if not callable(hook):
+            raise ValueError(f"'{value}' is not callable")
+        return value
+
+class DirectoryOverrides(BaseModel):
+    """
+    Rules and ignore patterns that apply only below one directory.
+
+    Used for entries of `target_directories` and for `.fylum.yaml` files
+    found inside them. Override rules are tried before the inherited ones
+    at equal priority; `inherit_rules: false` drops the inherited rules.
+    Ignore patterns are always added to the inherited ones.
+    """
+    rules: List[Rule] = Field(default_factory=list)
+    ignore_patterns: List[str] = Field(default_factory=list)
+    inherit_rules: bool = True
+
+class TargetDirectory(DirectoryOverrides):
+    """A target directory with its own overrides."""
+    path: str
 
 class Config(BaseModel):
     """Top-level configuration model."""
-    target_directories: List[str] = Field(default_factory=list)
+    target_directories: List[Union[str, TargetDirectory]] = Field(default_factory=list)
     ignore_patterns: List[str] = Field(default_factory=list)
     rename_format: str = "{date:%Y-%m-%d}_{original_filename}"
     rules: List[Rule] = Field(default_factory=list)
+    manifest_rotation: ManifestRotation = Field(default_factory=ManifestRotation)
+    throttle: Throttle = Field(default_factory=Throttle)
+    budget: Budget = Field(default_factory=Budget)
+    object_storage: ObjectStorage = Field(default_factory=ObjectStorage)
+    plugins: List[Plugin] = Field(default_factory=list)
+    # Files modified more recently than this are only moved once they stop changing.
+    settle_seconds: float = 0
+    # Remove the directories a run leaves empty.
+    prune_empty_dirs: bool = False
+
+    def targets(self) -> List[TargetDirectory]:
+        """The target directories, with plain paths given empty overrides."""
+        return [
+            TargetDirectory(path=target) if isinstance(target, str) else target
+            for target in self.target_directories
+        ]
 
 # --- Default Configuration ---
 
@@ -52,10 +190,16 @@ DEFAULT_CONFIG = {
             'extensions': ['.exe', '.msi', '.dmg'],
             'destination': '~/Documents/Fylum/Installers'
         }
-    ]
+    ],
+    'manifest_rotation': {
+        'max_bytes': 52428800,
+        'max_age_days': None,
+        'compression': 'gzip'
+    }
 }
 
 CONFIG_FILE_PATH = "config.yaml"
+LOCAL_CONFIG_FILE_NAME = ".fylum.yaml"
 
 # --- Configuration Management Functions ---
 
@@ -64,12 +208,16 @@ def create_default_config() -> None:
     with open(CONFIG_FILE_PATH, "w") as f:
         yaml.dump(DEFAULT_CONFIG, f, sort_keys=False)
 
+def read_config(path: str = CONFIG_FILE_PATH) -> Config:
+    """Reads and validates a config file. Errors are raised to the caller."""
+    with open(path, "r") as f:
+        config_data = yaml.safe_load(f)
+    return Config(**config_data)
+
 def load_config() -> Config:
     """Loads and validates the configuration from config.yaml."""
     try:
-        with open(CONFIG_FILE_PATH, "r") as f:
-            config_data = yaml.safe_load(f)
-        return Config(**config_data)
+        return read_config(CONFIG_FILE_PATH)
     except FileNotFoundError:
         print(f"Configuration file not found at '{CONFIG_FILE_PATH}'.")
         print("Creating a default config.yaml for you...")
@@ -82,3 +230,9 @@ def load_config() -> Config:
         # Exit gracefully on validation errors
         raise SystemExit()
 
+def load_directory_overrides(path: str) -> DirectoryOverrides:
+    """Loads a `.fylum.yaml` file. Errors are raised to the caller."""
+    with open(path, "r") as f:
+        data = yaml.safe_load(f) or {}
+    return DirectoryOverrides(**data)
+
@@ -1,37 +1,496 @@
-
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import os
+import re
+import time
+
+from src.archive_contents import ArchiveIndex
+from src.budget import Cursor, RunBudget
+from src.config import (
+    LOCAL_CONFIG_FILE_NAME,
+    Config,
+    DirectoryOverrides,
+    Rule,
+    TargetDirectory,
+    load_directory_overrides,
+)
+from src.locking import LEASE_FILE_NAME
+from src.plugins import PluginPipeline
+from src.reporting import ConsoleReporter, Reporter
+from src.throttle import IOThrottle
+
+
+def make_stat(size: int, mtime_ns: int, ino: int, dev: int, mode: int) -> os.stat_result:
+    """Rebuilds a stat result holding only the fields fylum uses."""
+    return os.stat_result(
+        (mode, ino, dev, 0, 0, 0, size, 0, mtime_ns // 1_000_000_000, 0),
+        {"st_mtime": mtime_ns / 1e9, "st_mtime_ns": mtime_ns},
+    )
+
+
+class FileMatch(tuple):
+    """
+    A planned (source, destination) move.
+
+    Unpacks like the plain pair the engine has always returned, and also
+    carries the name of the rule that matched and the source's stat from
+    the scan, so later stages don't have to stat the file again.
+    `final_name` is set when the rename format has already been applied.
+    """
+
+    def __new__(
+        cls,
+        source: Path,
+        destination: Path,
+        rule: Optional[str] = None,
+        stat: Optional[os.stat_result] = None,
+        final_name: Optional[str] = None,
+    ):
+        match = super().__new__(cls, (source, destination))
+        match.rule = rule
+        match.stat = stat
+        match.final_name = final_name
+        return match
+
+    def __getnewargs__(self):
+        return (self[0], self[1], self.rule, self.stat, self.final_name)
+
+    def to_record(self) -> tuple:
+        """A compact, picklable/JSON-able form keeping only the stat fields fylum uses."""
+        stat = self.stat
+        fields = (
+            (stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev, stat.st_mode)
+            if stat is not None else (None,) * 5
+        )
+        return (str(self[0]), str(self[1]), self.rule, self.final_name) + fields
+
+    @classmethod
+    def from_record(cls, record) -> "FileMatch":
+        source, destination, rule, final_name, size, mtime_ns, ino, dev, mode = record
+        stat = None if size is None else make_stat(size, mtime_ns, ino, dev, mode)
+        return cls(Path(source), Path(destination), rule, stat, final_name)
+
+    @property
+    def source(self) -> Path:
+        return self[0]
+
+    @property
+    def destination(self) -> Path:
+        return self[1]
+
+
+class CompiledRule:
+    """A rule with its destination resolved and its conditions turned into checks."""
+
+    def __init__(self, rule: Rule, archive_index: Optional[ArchiveIndex] = None):
+        self.rule = rule
+        self.name = rule.name
+        self.destination_dir = Path(rule.destination).expanduser()
+        self.extensions = None if rule.extensions is None else {e.lower() for e in rule.extensions}
+        self.checks = self._build_checks(rule, archive_index)
+
+    @staticmethod
+    def _build_checks(rule: Rule, archive_index: Optional[ArchiveIndex]) -> List[Callable]:
+        # Ordered cheapest first: stat fields, then string prefix, then regex,
+        # then opening archives.
+        checks = []
+        if rule.min_size is not None:
+            min_size = rule.min_size
+            checks.append(lambda path, stat, now: stat.st_size >= min_size)
+        if rule.max_size is not None:
+            max_size = rule.max_size
+            checks.append(lambda path, stat, now: stat.st_size <= max_size)
+        if rule.older_than_days is not None:
+            min_age = rule.older_than_days * 86400
+            checks.append(lambda path, stat, now: now - stat.st_mtime >= min_age)
+        if rule.path_prefix is not None:
+            prefix = os.path.join(str(Path(rule.path_prefix).expanduser()), "")
+            checks.append(lambda path, stat, now: str(path).startswith(prefix))
+        if rule.name_pattern is not None:
+            search = re.compile(rule.name_pattern).search
+            checks.append(lambda path, stat, now: search(path.name) is not None)
+        if rule.archive_contents is not None:
+            index = archive_index or ArchiveIndex(cache_path=None)
+            contents = {e.lower() for e in rule.archive_contents}
+            min_share = rule.archive_min_share
+            checks.append(lambda path, stat, now: index.share(path, stat, contents) >= min_share)
+        return checks
+
+    def matches(self, path: Path, stat: os.stat_result, now: float) -> bool:
+        for check in self.checks:
+            if not check(path, stat, now):
+                return False
+        return True
+
+
+def _last_suffix(extension: str) -> str:
+    return extension[extension.rfind("."):]
+
+
+class CompiledRules:
+    """
+    The rule set compiled into an extension-keyed decision table.
+
+    Each extension, including two-part ones such as `.tar.gz`, maps to the rules that can possibly match it, already in
+    priority order, so classifying a file costs one dict lookup plus the
+    remaining checks of the few candidates for its extension, however many
+    rules the config holds.
+    """
+
+    def __init__(self, rules: List[Rule], archive_index: Optional[ArchiveIndex] = None):
+        ordered = sorted(enumerate(rules), key=lambda item: (-item[1].priority, item[0]))
+        self.rules = [CompiledRule(rule, archive_index) for _, rule in ordered]
+
+        # Rules without `extensions` apply to every extension.
+        self.any_extension = [rule for rule in self.rules if rule.extensions is None]
+        extensions = set().union(*(rule.extensions for rule in self.rules if rule.extensions))
+        # A multi-part extension such as `.tar.gz` also matches the rules
+        # for its last part, `.gz`.
+        self.by_extension: Dict[str, List[CompiledRule]] = {
+            extension: [
+                rule for rule in self.rules
+                if rule.extensions is None
+                or extension in rule.extensions
+                or _last_suffix(extension) in rule.extensions
+            ]
+            for extension in extensions
+        }
+        self.multi_part = any(extension.count(".") > 1 for extension in extensions)
+
+    def candidates(self, path: Path) -> List[CompiledRule]:
+        if self.multi_part:
+            rules = self.by_extension.get("".join(path.suffixes[-2:]).lower())
+            if rules is not None:
+                return rules
+        return self.by_extension.get(path.suffix.lower(), self.any_extension)
+
+    def match(self, path: Path, stat: os.stat_result, now: float) -> Optional[CompiledRule]:
+        for rule in self.candidates(path):
+            if rule.matches(path, stat, now):
+                return rule
+        return None
+
+
+class RuleScope:
+    """The rules and ignore patterns in effect for a directory subtree, compiled once."""
+
+    def __init__(self, rules: List[Rule], ignore_patterns: List[str], archive_index: Optional[ArchiveIndex] = None):
+        self.rules = rules
+        self.ignore_patterns = ignore_patterns
+        self.archive_index = archive_index
+        self.compiled_rules = CompiledRules(rules, archive_index)
+
+    def extend(self, overrides: DirectoryOverrides) -> "RuleScope":
+        rules = list(overrides.rules)
+        if overrides.inherit_rules:
+            rules += self.rules
+        return RuleScope(rules, self.ignore_patterns + list(overrides.ignore_patterns), self.archive_index)
 
-from src.config import Config
 
 class RuleEngine:
-    def __init__(self, config: Config, dry_run: bool = False):
+    def __init__(
+        self,
+        config: Config,
+        dry_run: bool = False,
+        throttle: Optional[IOThrottle] = None,
+        reporter: Optional[Reporter] = None,
+        budget: Optional[RunBudget] = None,
+    ):
         self.config = config
         self.dry_run = dry_run
+        self.budget = budget
+        self.reporter = reporter or ConsoleReporter()
+        self.archive_index = ArchiveIndex()
+        self.root_scope = RuleScope(config.rules, config.ignore_patterns, self.archive_index)
+        self.compiled_rules = self.root_scope.compiled_rules
+        self.throttle = throttle or IOThrottle.from_config(config.throttle)
+        # Scopes are compiled once per target and per `.fylum.yaml` (keyed by
+        # its mtime) and shared by every file below them.
+        self._scopes: Dict[tuple, RuleScope] = {}
+        self._target_roots: Optional[List[Tuple[Path, TargetDirectory]]] = None
+        self._root_names: Optional[Set[str]] = None
+        # Entries seen in each scanned directory, so directories emptied by
+        # the moves can be found without walking them again.
+        self.directory_counts: Dict[str, int] = {}
+        self.plugins = PluginPipeline(config.plugins, self.reporter)
+
+    def classify(
+        self,
+        file_path: Path,
+        stat: Optional[os.stat_result] = None,
+        now: Optional[float] = None,
+        scope: Optional[RuleScope] = None,
+    ) -> Optional[FileMatch]:
+        """Applies the ignore patterns and rules to a single file."""
+        scope = scope or self.root_scope
+        if any(file_path.match(pattern) for pattern in scope.ignore_patterns):
+            return None
+
+        if stat is None:
+            stat = file_path.stat()
+        rule = scope.compiled_rules.match(file_path, stat, time.time() if now is None else now)
+        if rule is None:
+            return None
+        return FileMatch(file_path, rule.destination_dir / file_path.name, rule.name, stat)
 
-    def process_directories(self) -> List[Tuple[Path, Path]]:
+    def process_directories(self) -> List[FileMatch]:
         """Scans target directories and applies rules to find files to move."""
+        if self.budget is not None and self.budget.active:
+            return self.plugins.classify(self._process_within_budget(self.budget))
+
         actions = []
-        for target_dir_str in self.config.target_directories:
-            target_dir = Path(target_dir_str).expanduser()
+        now = time.time()
+        for target in self.config.targets():
+            target_dir = Path(target.path).expanduser()
             if not target_dir.is_dir():
-                print(f"Warning: Target directory '{target_dir}' does not exist or is not a directory.")
+                self.reporter.warning(f"Target directory '{target_dir}' does not exist or is not a directory.")
                 continue
 
-            for file_path in target_dir.rglob('*'):
-                if not file_path.is_file():
-                    continue
+            for file_path, stat, scope in self.walk(target_dir, self.target_scope(target)):
+                match = self.classify(file_path, stat, now, scope)
+                if match is not None:
+                    actions.append(match)
+        self.archive_index.save()
+        return self.plugins.classify(actions)
 
-                # Check against ignore patterns
-                if any(file_path.match(pattern) for pattern in self.config.ignore_patterns):
-                    continue
+    def _process_within_budget(self, budget: RunBudget) -> List[FileMatch]:
+        """
+        Like `process_directories`, stopping where the budget runs out.
+
+        Targets are walked in a fixed, sorted order so that a stop point is
+        a cursor the next run can resume from: it starts at the cursor's
+        target and skips every file and subtree that sorts before it.
+        """
+        actions = []
+        now = time.time()
+        targets = self.config.targets()
+        roots = [str(Path(target.path).expanduser()) for target in targets]
+        budget.targets = tuple(roots)
+
+        first, resume_from = 0, None
+        if budget.resume_from is not None and budget.resume_from[0] in roots:
+            first, resume_from = roots.index(budget.resume_from[0]), budget.resume_from[1]
 
-                # Check against rules
-                for rule in self.config.rules:
-                    if file_path.suffix.lower() in rule.extensions:
-                        destination_dir = Path(rule.destination).expanduser()
-                        destination_path = destination_dir / file_path.name
-                        actions.append((file_path, destination_path))
-                        break # Move to next file once a rule has matched
+        for index in range(first, len(targets)):
+            root = roots[index]
+            if not os.path.isdir(root):
+                self.reporter.warning(f"Target directory '{root}' does not exist or is not a directory.")
+                continue
+            files = self._walk_sorted(
+                root, root, (), self.target_scope(targets[index]), budget,
+                resume_from if index == first else None,
+            )
+            for file_path, stat, scope, parts in files:
+                match = self.classify(file_path, stat, now, scope)
+                if match is not None and not budget.take(stat.st_size):
+                    budget.stop((root, parts))
+                    break
+                if match is not None:
+                    actions.append(match)
+            if budget.stopped:
+                break
+        self.archive_index.save()
         return actions
 
+    def _walk_sorted(
+        self,
+        root: str,
+        directory: str,
+        parts: Tuple[str, ...],
+        parent_scope: RuleScope,
+        budget: RunBudget,
+        resume_from: Optional[Tuple[str, ...]],
+    ) -> Iterator[Tuple[Path, os.stat_result, RuleScope, Tuple[str, ...]]]:
+        scanned = self._scan_directory(directory, parent_scope)
+        if scanned is None:
+            return
+        entries, scope = scanned
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            entry_parts = parts + (entry.name,)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if budget.max_depth is not None and len(entry_parts) > budget.max_depth:
+                        continue
+                    # Skip subtrees that sort entirely before the cursor.
+                    if resume_from is not None and entry_parts < resume_from[:len(entry_parts)]:
+                        continue
+                    yield from self._walk_sorted(root, entry.path, entry_parts, scope, budget, resume_from)
+                    if budget.stopped:
+                        return
+                elif self._is_walked_file(entry, directory):
+                    if resume_from is not None and entry_parts < resume_from:
+                        continue
+                    if budget.out_of_time():
+                        budget.stop((root, entry_parts))
+                        return
+                    yield Path(entry.path), self._stat(entry), scope, entry_parts
+            except OSError:
+                continue
+
+    def cursor_for(self, path: Path) -> Optional[Cursor]:
+        """The resume cursor pointing at `path`, if it is inside a target."""
+        for root, _ in self._roots():
+            if root in path.parents:
+                return str(root), path.relative_to(root).parts
+        return None
+
+    def process_files(self, files: Iterable[Tuple[Path, os.stat_result]]) -> List[FileMatch]:
+        """Classifies already-scanned files, e.g. from a snapshot, as if they were walked."""
+        actions = []
+        now = time.time()
+        for file_path, stat, scope in self.with_scopes(files):
+            match = self.classify(file_path, stat, now, scope)
+            if match is not None:
+                actions.append(match)
+        self.archive_index.save()
+        return self.plugins.classify(actions)
+
+    def with_scopes(
+        self, files: Iterable[Tuple[Path, os.stat_result]]
+    ) -> Iterator[Tuple[Path, os.stat_result, RuleScope]]:
+        """Pairs already-scanned files with their scopes, looked up once per directory."""
+        scopes: Dict[Path, RuleScope] = {}
+        for file_path, stat in files:
+            directory = file_path.parent
+            scope = scopes.get(directory)
+            if scope is None:
+                scope = scopes[directory] = self.scope_for_directory(directory)
+            yield file_path, stat, scope
+
+    def scope_for_directory(self, directory: Path) -> RuleScope:
+        """
+        The scope in effect for files directly inside `directory`.
+
+        Uses the deepest target containing it; directories outside every
+        target get the top-level rules and ignore patterns.
+        """
+        for root, target in self._roots():
+            if directory == root or root in directory.parents:
+                return self.directory_scope(directory, target)
+        return self.root_scope
+
+    def _roots(self) -> List[Tuple[Path, TargetDirectory]]:
+        """Target roots, deepest first so nested targets win over their parents."""
+        if self._target_roots is None:
+            self._target_roots = sorted(
+                ((Path(target.path).expanduser(), target) for target in self.config.targets()),
+                key=lambda item: len(item[0].parts),
+                reverse=True,
+            )
+        return self._target_roots
+
+    def _is_target_root(self, directory: str) -> bool:
+        """Whether `directory` is a target root, where `.fylum.lock` is the lease file."""
+        if self._root_names is None:
+            self._root_names = {str(root) for root, _ in self._roots()}
+        return directory in self._root_names
+
+    def target_scope(self, target: TargetDirectory) -> RuleScope:
+        key = ("target", target.path)
+        scope = self._scopes.get(key)
+        if scope is None:
+            scope = self._scopes[key] = self.root_scope.extend(target)
+        return scope
+
+    def inherited_scope(self, directory: Path, target: TargetDirectory) -> RuleScope:
+        """
+        The scope `directory` inherits from its ancestors up to the target root.
+
+        Its own `.fylum.yaml`, if any, is applied when it is walked.
+        """
+        current = Path(target.path).expanduser()
+        scope = self.target_scope(target)
+        for part in directory.relative_to(current).parts:
+            scope = self._directory_scope(scope, str(current))
+            current = current / part
+        return scope
+
+    def directory_scope(self, directory: Path, target: TargetDirectory) -> RuleScope:
+        """The scope in effect for files directly inside `directory`."""
+        return self._directory_scope(self.inherited_scope(directory, target), str(directory))
+
+    def _directory_scope(self, parent: RuleScope, directory: str, has_local_config: bool = True) -> RuleScope:
+        if not has_local_config:
+            return parent
+        local_config = os.path.join(directory, LOCAL_CONFIG_FILE_NAME)
+        try:
+            mtime_ns = os.stat(local_config).st_mtime_ns
+        except OSError:
+            return parent
+
+        key = (id(parent), directory, mtime_ns)
+        scope = self._scopes.get(key)
+        if scope is None:
+            try:
+                scope = parent.extend(load_directory_overrides(local_config))
+            except Exception as e:
+                self.reporter.warning(f"Ignoring invalid '{local_config}': {e}")
+                scope = parent
+            self._scopes[key] = scope
+        return scope
+
+    def scan(self, target_dir: Path, recursive: bool = True) -> Iterator[Tuple[Path, os.stat_result]]:
+        """
+        Yields every file below `target_dir` with its stat.
+
+        Uses `os.scandir` so each file is stat'ed once and the result reused
+        for classification and renaming. Symlinks to files are included;
+        symlinked directories are not descended into. With `recursive=False`
+        only the files directly inside `target_dir` are yielded.
+        """
+        for file_path, stat, _ in self.walk(target_dir, self.root_scope, recursive):
+            yield file_path, stat
+
+    def walk(
+        self, target_dir: Path, scope: RuleScope, recursive: bool = True
+    ) -> Iterator[Tuple[Path, os.stat_result, RuleScope]]:
+        """Like `scan`, also yielding the scope in effect for each file."""
+        pending = [(str(target_dir), scope)]
+        while pending:
+            directory, parent_scope = pending.pop()
+            scanned = self._scan_directory(directory, parent_scope)
+            if scanned is None:
+                continue
+            entries, directory_scope = scanned
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            pending.append((entry.path, directory_scope))
+                    elif self._is_walked_file(entry, directory):
+                        yield Path(entry.path), self._stat(entry), directory_scope
+                except OSError:
+                    continue
+
+    def _scan_directory(
+        self, directory: str, parent_scope: RuleScope
+    ) -> Optional[Tuple[List[os.DirEntry], RuleScope]]:
+        """
+        Lists one directory for a walk, with the scope in effect inside it.
+
+        Counts the entries in `directory_counts` and applies the directory's
+        `.fylum.yaml`, if it has one. Returns None if it cannot be scanned.
+        """
+        if self.throttle is not None:
+            self.throttle.op()
+        try:
+            with os.scandir(directory) as iterator:
+                entries = list(iterator)
+        except OSError as e:
+            self.reporter.warning(f"Could not scan '{directory}': {e}")
+            return None
+        self.directory_counts[directory] = len(entries)
+
+        has_local_config = any(entry.name == LOCAL_CONFIG_FILE_NAME for entry in entries)
+        return entries, self._directory_scope(parent_scope, directory, has_local_config)
+
+    def _is_walked_file(self, entry: os.DirEntry, directory: str) -> bool:
+        """Whether a walk yields `entry`: files, except our own config and lease files."""
+        if not entry.is_file() or entry.name == LOCAL_CONFIG_FILE_NAME:
+            return False
+        return entry.name != LEASE_FILE_NAME or not self._is_target_root(directory)
+
+    def _stat(self, entry: os.DirEntry) -> os.stat_result:
+        if self.throttle is not None:
+            self.throttle.op()
+        return entry.stat()
@@ -0,0 +1,327 @@
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import os
+import sqlite3
+
+
+HISTORY_DB_PATH = "_fylum_history.db"
+
+# Where runs were recorded before the history store existed.
+LEGACY_MANIFEST_PATH = "_fylum_index.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    source TEXT NOT NULL,
+    destination TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runs_timestamp ON runs(timestamp);
+CREATE INDEX IF NOT EXISTS idx_actions_run_id ON actions(run_id);
+CREATE INDEX IF NOT EXISTS idx_actions_source ON actions(source);
+CREATE INDEX IF NOT EXISTS idx_actions_destination ON actions(destination);
+"""
+
+# Columns added to `actions` after the first release, applied to older
+# databases on open. Each entry is (column, type, indexed).
+ACTION_COLUMNS = [
+    ("rule", "TEXT", True),
+    ("hash", "TEXT", False),
+    ("mode", "TEXT", False),
+]
+
+ACTION_FIELDS = ["source", "destination"] + [column for column, _, _ in ACTION_COLUMNS]
+
+# Bookkeeping columns, which are not part of a recorded move. `pending` is
+# set on moves journaled before they are made and cleared once they are.
+STATE_COLUMNS = [
+    ("pending", "INTEGER", False),
+]
+
+# (source, destination, rule, hash, mode). Trailing fields may be left out.
+ActionRow = Tuple[Path, Path, Optional[str], Optional[str], Optional[str]]
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    """Smallest string greater than every string starting with `prefix`."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class HistoryStore:
+    """
+    SQLite-backed, indexed store of every run and the moves it made.
+
+    The runs in `legacy_manifest` are imported once, when the store's
+    schema is first created, whichever command that happens in.
+    """
+
+    def __init__(
+        self,
+        db_path: Path = Path(HISTORY_DB_PATH),
+        legacy_manifest: Optional[Path] = Path(LEGACY_MANIFEST_PATH),
+    ):
+        self.db_path = Path(db_path)
+        self.legacy_manifest = None if legacy_manifest is None else Path(legacy_manifest)
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Moves completed on the processor's copy lane are recorded from
+            # that thread; the processor serialises every write.
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            # Moves are journaled a batch per transaction. In WAL mode a
+            # commit still survives the process being killed without an
+            # fsync each time; only a power loss can drop the last ones.
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            created = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'runs'"
+            ).fetchone() is None
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+            if created and self.legacy_manifest is not None and self.legacy_manifest.exists():
+                self.import_json_manifest(self.legacy_manifest)
+        return self._conn
+
+    def _migrate(self) -> None:
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(actions)")}
+        with self._conn:
+            for column, column_type, indexed in ACTION_COLUMNS + STATE_COLUMNS:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE actions ADD COLUMN {column} {column_type}")
+                if indexed:
+                    self._conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS idx_actions_{column} ON actions({column})"
+                    )
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def exists(self) -> bool:
+        return self.db_path.exists()
+
+    def start_run(self, timestamp: Optional[datetime] = None) -> int:
+        """Creates a new run and returns its id."""
+        timestamp = timestamp or datetime.now()
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO runs (timestamp) VALUES (?)", (timestamp.isoformat(),)
+            )
+        return cursor.lastrowid
+
+    def begin_actions(
+        self, run_id: Optional[int], actions: Sequence[ActionRow], timestamp: Optional[datetime] = None
+    ) -> Tuple[int, List[int]]:
+        """
+        Journals moves that are about to be made, as pending actions, in one
+        transaction.
+
+        With no `run_id` a new run is created in the same transaction, so a
+        run is never committed without an action. Returns the run id and the
+        ids of the actions, in order.
+        """
+        width = len(ACTION_FIELDS)
+        insert = (
+            f"INSERT INTO actions (run_id, {', '.join(ACTION_FIELDS)}, pending) "
+            f"VALUES (?, {', '.join('?' * width)}, 1)"
+        )
+        with self.conn:
+            if run_id is None:
+                timestamp = timestamp or datetime.now()
+                run_id = self.conn.execute(
+                    "INSERT INTO runs (timestamp) VALUES (?)", (timestamp.isoformat(),)
+                ).lastrowid
+            action_ids = [
+                self.conn.execute(
+                    insert,
+                    (run_id, str(action[0]), str(action[1]), *action[2:], *(None,) * (width - len(action))),
+                ).lastrowid
+                for action in actions
+            ]
+        return run_id, action_ids
+
+    def complete_actions(self, completed: Iterable[Tuple[int, Optional[str]]]) -> None:
+        """Marks journaled actions as done, given (action id, hash) pairs."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE actions SET pending = NULL, hash = COALESCE(?, hash) WHERE id = ?",
+                ((file_hash, action_id) for action_id, file_hash in completed),
+            )
+
+    def add_actions(self, run_id: int, actions: Iterable[ActionRow]) -> None:
+        """Appends (source, destination, rule, hash, mode) rows to an existing run."""
+        width = len(ACTION_FIELDS)
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO actions (run_id, {', '.join(ACTION_FIELDS)}) "
+                f"VALUES (?, {', '.join('?' * width)})",
+                (
+                    (run_id, str(action[0]), str(action[1]), *action[2:], *(None,) * (width - len(action)))
+                    for action in actions
+                ),
+            )
+
+    def record_run(self, actions: Iterable[ActionRow], timestamp: Optional[datetime] = None) -> int:
+        run_id = self.start_run(timestamp)
+        self.add_actions(run_id, actions)
+        return run_id
+
+    def get_run(self, run_id: int) -> Optional[Dict]:
+        row = self.conn.execute("SELECT id, timestamp FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+
+        actions = self.conn.execute(
+            f"SELECT {', '.join(ACTION_FIELDS)} FROM actions WHERE run_id = ? ORDER BY id", (run_id,)
+        ).fetchall()
+        return {
+            "run_id": row["id"],
+            "timestamp": row["timestamp"],
+            "actions": [dict(action) for action in actions],
+        }
+
+    def get_last_run(self) -> Optional[Dict]:
+        """The newest run that recorded any action."""
+        row = self.conn.execute("SELECT MAX(run_id) AS id FROM actions").fetchone()
+        if row is None or row["id"] is None:
+            return None
+        return self.get_run(row["id"])
+
+    def find(self, path: str) -> List[Dict]:
+        """Returns every recorded move whose source or destination is `path`."""
+        rows = self.conn.execute(
+            """
+            SELECT actions.run_id, runs.timestamp, actions.source, actions.destination
+            FROM actions JOIN runs ON runs.id = actions.run_id
+            WHERE actions.source = ?
+            UNION
+            SELECT actions.run_id, runs.timestamp, actions.source, actions.destination
+            FROM actions JOIN runs ON runs.id = actions.run_id
+            WHERE actions.destination = ?
+            ORDER BY 1
+            """,
+            (path, path),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def select_actions(
+        self,
+        run_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        rule: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+    ) -> List[Dict]:
+        """
+        Returns the actions matching every given filter, oldest first.
+
+        `path_prefix` matches a source or destination path that is, or is
+        below, the given path. Each
+        filter is answered from an index, so the cost depends on the number of
+        matching actions rather than the size of the history. Actions with
+        `pending` set were journaled by a run that stopped before it could
+        confirm them, and may or may not have been made.
+        """
+        conditions = []
+        params: List = []
+        if run_id is not None:
+            conditions.append("actions.run_id = ?")
+            params.append(run_id)
+        if since is not None:
+            conditions.append("actions.run_id IN (SELECT id FROM runs WHERE timestamp >= ?)")
+            params.append(since.isoformat())
+        if rule is not None:
+            conditions.append("actions.rule = ?")
+            params.append(rule)
+        if path_prefix:
+            # Whole path components only: `/d/Pic` is not a prefix of `/d/Pictures`.
+            exact = path_prefix.rstrip(os.sep) or os.sep
+            below = exact if exact.endswith(os.sep) else exact + os.sep
+            upper = _prefix_upper_bound(below)
+            conditions.append(
+                "actions.id IN ("
+                "SELECT id FROM actions WHERE source = ? "
+                "UNION "
+                "SELECT id FROM actions WHERE source >= ? AND source < ? "
+                "UNION "
+                "SELECT id FROM actions WHERE destination = ? "
+                "UNION "
+                "SELECT id FROM actions WHERE destination >= ? AND destination < ?)"
+            )
+            params.extend([exact, below, upper, exact, below, upper])
+
+        query = (
+            "SELECT actions.id, actions.run_id, runs.timestamp, actions.pending, "
+            + ", ".join(f"actions.{field}" for field in ACTION_FIELDS)
+            + " FROM actions JOIN runs ON runs.id = actions.run_id"
+        )
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY actions.id"
+
+        return [dict(row) for row in self.conn.execute(query, params)]
+
+    def delete_actions(self, action_ids: Iterable[int]) -> None:
+        """Deletes individual actions, and any run left without actions."""
+        action_ids = list(action_ids)
+        with self.conn:
+            run_ids = set()
+            for start in range(0, len(action_ids), 500):
+                chunk = action_ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                run_ids.update(
+                    row["run_id"] for row in self.conn.execute(
+                        f"SELECT DISTINCT run_id FROM actions WHERE id IN ({placeholders})", chunk
+                    )
+                )
+                self.conn.execute(f"DELETE FROM actions WHERE id IN ({placeholders})", chunk)
+            for run_id in run_ids:
+                self.conn.execute(
+                    "DELETE FROM runs WHERE id = ? AND NOT EXISTS (SELECT 1 FROM actions WHERE run_id = ?)",
+                    (run_id, run_id),
+                )
+
+    def delete_run(self, run_id: int) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+
+    def import_json_manifest(self, json_manifest_path: Path) -> int:
+        """Loads runs from a legacy `_fylum_index.json` into the store."""
+        try:
+            with open(json_manifest_path, "r", encoding="utf-8") as f:
+                manifest_data = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return 0
+
+        imported = 0
+        run_ids: Dict[int, int] = {}
+        for run in manifest_data:
+            try:
+                timestamp = datetime.fromisoformat(run["timestamp"])
+            except (KeyError, ValueError):
+                timestamp = None
+            actions = [
+                (
+                    action["source"], action["destination"], action.get("rule"),
+                    action.get("hash"), action.get("mode"),
+                )
+                for action in run.get("actions", [])
+            ]
+            # Continued entries of a run that overlapped another are merged.
+            original_id = run.get("run_id")
+            if original_id is not None and original_id in run_ids:
+                self.add_actions(run_ids[original_id], actions)
+                continue
+            run_ids[original_id] = self.record_run(actions, timestamp)
+            imported += 1
+        return imported
@@ -0,0 +1,109 @@
+from pathlib import Path
+from typing import Optional
+import hashlib
+import mmap
+import os
+import shutil
+
+
+# Large enough that per-call overhead vanishes next to the copy itself.
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class VerificationError(OSError):
+    """Raised when a copied file does not match its source."""
+
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=32)
+
+
+def hash_file(path: Path) -> str:
+    """
+    Returns the hex digest of a file's contents.
+
+    Regular files are memory-mapped and hashed straight from the page cache
+    without copying them into Python buffers; anything that cannot be
+    mapped is read in large chunks into a reused buffer instead.
+    """
+    digest = _new_hash()
+    with open(path, "rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+                return digest.hexdigest()
+        except (ValueError, OSError):
+            # Empty files and special files cannot be mapped.
+            pass
+
+        buffer = bytearray(COPY_BUFFER_SIZE)
+        view = memoryview(buffer)
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            digest.update(view[:count])
+    return digest.hexdigest()
+
+
+def copy_and_hash(source: Path, destination: Path) -> str:
+    """
+    Copies `source` to `destination`, hashing the data as it is copied.
+
+    The source is read once: every chunk is hashed and written from the
+    same buffer. Permissions and timestamps are copied as `shutil.move`
+    would. Returns the digest of the source contents.
+    """
+    digest = _new_hash()
+    buffer = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(source, "rb") as src, open(destination, "xb") as dst:
+        while True:
+            count = src.readinto(buffer)
+            if not count:
+                break
+            chunk = view[:count]
+            digest.update(chunk)
+            dst.write(chunk)
+    shutil.copystat(source, destination)
+    return digest.hexdigest()
+
+
+def _same_device(source: Path, directory: Path) -> bool:
+    return os.stat(source).st_dev == os.stat(directory).st_dev
+
+
+def verified_move(source: Path, destination: Path, expected_hash: Optional[str] = None) -> Optional[str]:
+    """
+    Moves a file like `shutil.move`, checking that the data arrives intact.
+
+    Same-device moves are renames and only hash the file once. Cross-device
+    moves hash the source while copying it, hash the written copy back, and
+    only delete the source once the two match; on a mismatch the copy is
+    removed and `VerificationError` raised. If `expected_hash` is given the
+    source must also match it. Returns the digest, or None for symlinks,
+    which are moved as links.
+    """
+    source, destination = Path(source), Path(destination)
+    if os.path.islink(source):
+        shutil.move(str(source), str(destination))
+        return None
+
+    if _same_device(source, destination.parent):
+        file_hash = hash_file(source)
+        if expected_hash is not None and file_hash != expected_hash:
+            raise VerificationError(f"contents of '{source}' changed since they were recorded")
+        os.rename(source, destination)
+        return file_hash
+
+    source_hash = copy_and_hash(source, destination)
+    try:
+        if expected_hash is not None and source_hash != expected_hash:
+            raise VerificationError(f"contents of '{source}' changed since they were recorded")
+        if hash_file(destination) != source_hash:
+            raise VerificationError(f"copy of '{source}' at '{destination}' does not match the original")
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+    os.unlink(source)
+    return source_hash
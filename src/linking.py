@@ -0,0 +1,67 @@
+from pathlib import Path
+from enum import Enum
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows: reflinks are not supported.
+    fcntl = None
+
+
+# Linux FICLONE ioctl: share the source's extents with the destination.
+FICLONE = 0x40049409
+
+
+class LinkMode(str, Enum):
+    hardlink = "hardlink"
+    symlink = "symlink"
+    reflink = "reflink"
+
+
+def create_link(source: Path, destination: Path, mode: LinkMode) -> None:
+    """
+    Creates `destination` as a link to `source`, never copying file data.
+
+    Hard links and reflinks need both paths on the same filesystem, and
+    reflinks a filesystem that supports them (Btrfs, XFS); otherwise an
+    OSError is raised and nothing is left behind.
+    """
+    mode = LinkMode(mode)
+    if mode == LinkMode.hardlink:
+        os.link(source, destination)
+    elif mode == LinkMode.symlink:
+        os.symlink(os.path.abspath(source), destination)
+    else:
+        _reflink(source, destination)
+
+
+def _reflink(source: Path, destination: Path) -> None:
+    if fcntl is None:
+        raise OSError("reflinks are not supported on this platform")
+    with open(source, "rb") as src:
+        fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            fcntl.ioctl(fd, FICLONE, src.fileno())
+        except OSError as e:
+            os.close(fd)
+            os.unlink(destination)
+            raise OSError(e.errno, f"cannot reflink '{source}': {e.strerror}")
+        os.close(fd)
+    shutil.copystat(source, destination)
+
+
+def is_link_to(source: Path, destination: Path, mode: LinkMode) -> bool:
+    """Whether `destination` is still the untouched link created for `source`."""
+    mode = LinkMode(mode)
+    try:
+        if mode == LinkMode.symlink:
+            return os.path.islink(destination) and os.readlink(destination) == os.path.abspath(source)
+        if mode == LinkMode.hardlink:
+            return os.path.samefile(source, destination)
+        # A reflink is an independent file; it is untouched while it still
+        # has the size and mtime it was given from the source.
+        source_stat, link_stat = os.stat(source), os.stat(destination)
+        return (source_stat.st_size, source_stat.st_mtime_ns) == (link_stat.st_size, link_stat.st_mtime_ns)
+    except OSError:
+        return False
@@ -0,0 +1,110 @@
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Union
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: locking is skipped.
+    fcntl = None
+
+
+# Dropped into a target directory while an instance holds its lease.
+LEASE_FILE_NAME = ".fylum.lock"
+
+
+def _try_lock(path: Union[str, Path], blocking: bool):
+    """Opens `path` and takes an exclusive flock on it; returns the fd, or None if busy."""
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+    if fcntl is None:
+        return fd
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _same_file(fd: int, path: Path) -> bool:
+    """Whether `fd` is still the file at `path`."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    opened = os.fstat(fd)
+    return (stat.st_dev, stat.st_ino) == (opened.st_dev, opened.st_ino)
+
+
+@contextmanager
+def file_lock(path: Union[str, Path]) -> Iterator[None]:
+    """
+    Holds an exclusive advisory lock on `path` for the duration of the block.
+
+    The lock belongs to the open file, so it is released when the block
+    exits, or by the OS if the process dies while holding it.
+    """
+    fd = _try_lock(path, blocking=True)
+    try:
+        yield
+    finally:
+        os.close(fd)
+
+
+class TargetLeases:
+    """
+    Exclusive per-target leases, so concurrent instances split the targets.
+
+    A lease is a lock on a `.fylum.lock` file in the target directory and is
+    held until `release()`, which removes the file again. Targets leased by
+    another instance are not acquired, and that instance keeps working on
+    them undisturbed.
+    """
+
+    def __init__(self):
+        self._held: Dict[str, int] = {}
+
+    def __enter__(self) -> "TargetLeases":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+    def acquire(self, directory: Path) -> bool:
+        """
+        Takes the lease on `directory`; False if another instance holds it.
+
+        Raises OSError if the lease file cannot be created, e.g. in a
+        read-only directory.
+        """
+        key = str(directory)
+        if key in self._held:
+            return True
+        path = Path(directory) / LEASE_FILE_NAME
+        while True:
+            fd = _try_lock(path, blocking=False)
+            if fd is None:
+                return False
+            # The previous holder unlinks the file on release; a lock taken
+            # on the unlinked file would not exclude anyone, so take it again.
+            if _same_file(fd, path):
+                self._held[key] = fd
+                return True
+            os.close(fd)
+
+    @property
+    def held(self) -> List[str]:
+        return list(self._held)
+
+    def release(self) -> None:
+        for directory, fd in self._held.items():
+            # Unlinked while still locked, so no other instance can lock it in between.
+            try:
+                os.unlink(Path(directory) / LEASE_FILE_NAME)
+            except OSError:
+                pass
+            os.close(fd)
+        self._held = {}
@@ -0,0 +1,263 @@
+from pathlib import Path
+from datetime import datetime
+from typing import List, Optional, Tuple
+import json
+import os
+import time
+
+from src.archive import ManifestArchive
+from src.config import ManifestRotation
+from src.history import HistoryStore
+from src.locking import file_lock
+
+
+MD_MANIFEST_PATH = "_fylum_index.md"
+JSON_MANIFEST_PATH = "_fylum_index.json"
+
+# Everything after the last action of the open run. It is rewritten after
+# every flush so the JSON manifest is a valid document between batches.
+JSON_RUN_CLOSE = "\n    ]\n  }\n]\n"
+
+
+class ManifestWriter:
+    """
+    Streams the moves of a single run to the manifests as they complete.
+
+    Moves are journaled in the history store as pending with `begin`, a
+    batch at a time, before they are made, so a run that is killed part
+    way through still knows every move it may have made; the run itself
+    is only created together with its first moves. Completed moves are buffered and written
+    in batches to `_fylum_index.md` and `_fylum_index.json`, and marked
+    done in the history store, so memory use does not grow with the size
+    of the run and the manifests can be tailed while it is in progress.
+    Nothing is written to the manifests until the first batch, at which
+    point the previous manifests are archived if `rotation` says they are
+    due.
+
+    Each write to the manifest files holds an advisory lock on the JSON
+    manifest's `.lock` file for just that batch, so concurrent runs
+    interleave safely. If another run wrote to the manifests since our
+    last batch, the rest of our run continues in a new entry with the same
+    `run_id`.
+    """
+
+    def __init__(
+        self,
+        md_path: Path = Path(MD_MANIFEST_PATH),
+        json_path: Path = Path(JSON_MANIFEST_PATH),
+        history: Optional[HistoryStore] = None,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        rotation: Optional[ManifestRotation] = None,
+        archive: Optional[ManifestArchive] = None,
+    ):
+        self.md_path = Path(md_path)
+        self.json_path = Path(json_path)
+        # Runs that share the JSON manifest share its lock, wherever their md is.
+        self.lock_path = self.json_path.with_suffix(".lock")
+        self.history = history or HistoryStore()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotation = rotation
+        self.archive = archive or ManifestArchive()
+        self.run_id: Optional[int] = None
+        self.written_count = 0
+        # (action, id of its journaled history row, if any)
+        self._buffer: List[Tuple[object, Optional[int]]] = []
+        # This run's rows in the history store.
+        self._rows = 0
+        self._last_flush = 0.0
+        self._json_file = None
+        self._json_tail = 0
+        self._timestamp: Optional[datetime] = None
+
+    def __enter__(self) -> "ManifestWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    @property
+    def started(self) -> bool:
+        return self._timestamp is not None
+
+    def begin(self, actions: List) -> List[int]:
+        """
+        Journals moves about to be made, in one transaction, and returns
+        their history ids.
+
+        Pass each id to `add` once its move is made, or to `discard` if it
+        never happened.
+        """
+        if not self.started:
+            self._start()
+        self.run_id, action_ids = self.history.begin_actions(
+            self.run_id, [self._history_row(action) for action in actions], self._timestamp
+        )
+        self._rows += len(action_ids)
+        return action_ids
+
+    def discard(self, action_ids: List[int]) -> None:
+        """Forgets journaled moves that were never made."""
+        self.history.delete_actions(action_ids)
+        self._rows -= len(action_ids)
+        if not self._rows:
+            # The store dropped the run along with its last action.
+            self.run_id = None
+
+    def add(self, action, action_id: Optional[int] = None) -> None:
+        """
+        Queues a completed move (anything with source, destination and rule).
+
+        `action_id` is the id `begin` returned for it; actions that were
+        not journaled are added to the history store with the batch.
+        """
+        if not self.started:
+            self._start()
+        self._buffer.append((action, action_id))
+        if (
+            len(self._buffer) >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+
+        batch, self._buffer = self._buffer, []
+        self.history.complete_actions(
+            (action_id, getattr(action, "hash", None)) for action, action_id in batch if action_id is not None
+        )
+        unjournaled = [self._history_row(action) for action, action_id in batch if action_id is None]
+        if unjournaled:
+            self.run_id = self._add_unjournaled(unjournaled)
+
+        actions = [action for action, _ in batch]
+        lines = ",\n".join("      " + json.dumps(self._json_action(action)) for action in actions)
+        with file_lock(self.lock_path):
+            if self._json_file is None:
+                if self.rotation is not None:
+                    self.archive.rotate_if_needed(self.md_path, self.json_path, self.rotation)
+                self._start_entries()
+                continued = False
+            else:
+                continued = not self._json_is_current()
+                if continued:
+                    self._json_file.close()
+                    self._start_entries(continued=True)
+            with open(self.md_path, "a", encoding="utf-8") as f:
+                f.writelines(f"| {action.source} | {action.destination} |\n" for action in actions)
+            separator = ",\n" if self.written_count and not continued else "\n"
+            self._write_json_tail(separator + lines)
+
+        self.written_count += len(batch)
+        self._last_flush = time.monotonic()
+
+    def _add_unjournaled(self, rows: List) -> int:
+        self._rows += len(rows)
+        if self.run_id is None:
+            return self.history.record_run(rows, self._timestamp)
+        self.history.add_actions(self.run_id, rows)
+        return self.run_id
+
+    @staticmethod
+    def _history_row(action) -> tuple:
+        return (
+            action.source, action.destination, action.rule,
+            getattr(action, "hash", None), getattr(action, "mode", None),
+        )
+
+    @staticmethod
+    def _json_action(action) -> dict:
+        entry = {
+            "source": str(action.source),
+            "destination": str(action.destination),
+            "rule": action.rule,
+        }
+        for field in ("hash", "mode"):
+            value = getattr(action, field, None)
+            if value is not None:
+                entry[field] = value
+        return entry
+
+    def close(self) -> None:
+        if not self.started:
+            return
+        self.flush()
+        if self._json_file is not None:
+            self._json_file.close()
+            self._json_file = None
+        self.run_id = None
+        self._timestamp = None
+
+    def _start(self) -> None:
+        self._timestamp = datetime.now()
+        self.written_count = 0
+        self._rows = 0
+        self._last_flush = time.monotonic()
+
+    def _start_entries(self, continued: bool = False) -> None:
+        """Opens this run's entries in both manifests. Called with the lock held."""
+        title = f"Fylum Run - {self._timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
+        if continued:
+            title += " (continued)"
+        with open(self.md_path, "a", encoding="utf-8") as f:
+            f.write(f"\n## {title}\n\n")
+            f.write("| Original Path | New Path |\n")
+            f.write("|---------------|----------|\n")
+
+        self._json_file, self._json_tail, has_runs = self._open_json()
+        header = (
+            (",\n" if has_runs else "\n")
+            + "  {\n"
+            + f'    "run_id": {self.run_id},\n'
+            + f'    "timestamp": {json.dumps(self._timestamp.isoformat())},\n'
+            + '    "actions": ['
+        )
+        self._write_json_tail(header)
+
+    def _json_is_current(self) -> bool:
+        """Whether the JSON manifest still ends with our open entry."""
+        try:
+            on_disk = os.stat(self.json_path)
+        except OSError:
+            return False
+        ours = os.fstat(self._json_file.fileno())
+        return (
+            (on_disk.st_dev, on_disk.st_ino) == (ours.st_dev, ours.st_ino)
+            and on_disk.st_size == self._json_tail + len(JSON_RUN_CLOSE.encode("utf-8"))
+        )
+
+    def _open_json(self):
+        """
+        Opens the JSON manifest for in-place appending.
+
+        Returns the file, the offset of the closing bracket of the top-level
+        list (where the new run is written), and whether the list has entries.
+        A missing or unreadable manifest is started afresh.
+        """
+        if self.json_path.exists():
+            f = open(self.json_path, "r+b")
+            end = f.seek(0, os.SEEK_END)
+            tail_start = max(0, end - 4096)
+            f.seek(tail_start)
+            tail = f.read()
+            stripped = tail.rstrip()
+            if stripped.endswith(b"]"):
+                close_offset = tail_start + len(stripped) - 1
+                before = stripped[:-1].rstrip()
+                return f, close_offset, not before.endswith(b"[")
+            f.close()
+
+        f = open(self.json_path, "w+b")
+        f.write(b"[")
+        return f, 1, False
+
+    def _write_json_tail(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self._json_file.seek(self._json_tail)
+        self._json_file.write(data + JSON_RUN_CLOSE.encode("utf-8"))
+        self._json_file.truncate()
+        self._json_file.flush()
+        self._json_tail += len(data)
@@ -0,0 +1,96 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Set
+import os
+import unicodedata
+
+
+# Names seen in a run repeat a lot (collision candidates, destination
+# listings), so each one is normalized once and looked up after that.
+NAME_CACHE_SIZE = 65536
+
+# Longest file name, in encoded bytes, most filesystems accept.
+MAX_NAME_BYTES = 255
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def nfc(name: str) -> str:
+    """
+    `name` in Unicode NFC.
+
+    macOS writes names decomposed (NFD) and most other systems composed,
+    so the same visible name can arrive in either form. ASCII names are
+    the same in both and skip the normalization.
+    """
+    if name.isascii():
+        return name
+    return unicodedata.normalize("NFC", name)
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def collision_key(name: str) -> str:
+    """
+    The key under which two names clash on a case-insensitive destination.
+
+    Names equal after normalization and case folding (`Résumé.pdf` and
+    `résumé.PDF`) are the same file on APFS, NTFS and most SMB
+    shares.
+    """
+    return nfc(nfc(name).casefold())
+
+
+def fit_name(stem: str, suffix: str) -> str:
+    """`stem + suffix`, with the stem shortened if the name is too long to create."""
+    name = stem + suffix
+    # Four bytes per character at most, so short names need no encoding.
+    if len(name) * 4 <= MAX_NAME_BYTES:
+        return name
+    budget = MAX_NAME_BYTES - len(os.fsencode(suffix))
+    encoded = os.fsencode(stem)
+    if len(encoded) <= budget:
+        return name
+    # Cut on a character boundary.
+    return encoded[:budget].decode("utf-8", "ignore") + suffix
+
+
+class DestinationNames:
+    """
+    The collision keys of the names in each destination directory.
+
+    A directory is listed once, the first time a name is placed in it, and
+    every name placed after that is added, so checking a name is a set
+    lookup rather than a stat per candidate. The chosen name is still
+    checked on disk, in case something else created it since the listing.
+    """
+
+    def __init__(self):
+        self._keys: Dict[Path, Set[str]] = {}
+
+    def free_name(self, directory: Path, name: str) -> Path:
+        """
+        `directory / name`, or the first free `name_N` variant of it, reserved
+        for the caller. Names too long for the filesystem are shortened.
+        """
+        keys = self._keys_in(directory)
+        stem, suffix = os.path.splitext(name)
+        candidate = fit_name(stem, suffix)
+        counter = 1
+        while True:
+            key = collision_key(candidate)
+            if key not in keys:
+                keys.add(key)
+                if not os.path.lexists(directory / candidate):
+                    return directory / candidate
+            candidate = fit_name(stem, f"_{counter}{suffix}")
+            counter += 1
+
+    def _keys_in(self, directory: Path) -> Set[str]:
+        keys = self._keys.get(directory)
+        if keys is None:
+            try:
+                with os.scandir(directory) as entries:
+                    keys = {collision_key(entry.name) for entry in entries}
+            except FileNotFoundError:
+                keys = set()
+            self._keys[directory] = keys
+        return keys
@@ -0,0 +1,159 @@
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import os
+import time
+
+from src.config import Config, TargetDirectory
+from src.engine import FileMatch, RuleEngine
+from src.plugins import PluginPipeline
+from src.processor import render_name
+from src.reporting import ConsoleReporter, Reporter
+from src.throttle import IOThrottle
+
+
+# (directory, recursive, target). A non-recursive shard covers only the files
+# directly inside the directory; its subdirectories are shards of their own.
+# `target` indexes the directory list the shard was split from.
+Shard = Tuple[str, bool, int]
+
+# Shards per worker process; more, smaller shards keep the pool evenly
+# loaded when subtrees differ a lot in size.
+SHARDS_PER_PROCESS = 4
+MAX_SHARD_DEPTH = 3
+
+_worker_engine: Optional[RuleEngine] = None
+_worker_targets: List[TargetDirectory] = []
+
+
+class _ShardWarnings(Reporter):
+    """Collects a worker's warnings, which the coordinator reports in its own format."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages: List[str] = []
+
+    def warning(self, message: str) -> None:
+        self.messages.append(message)
+
+
+def _init_worker(config_data: dict, processes: int) -> None:
+    global _worker_engine, _worker_targets
+    config = Config(**config_data)
+    _worker_targets = config.targets()
+    # Each worker gets its share of the configured rate limits.
+    _worker_engine = RuleEngine(
+        config=config,
+        throttle=IOThrottle.from_config(config.throttle, share=processes),
+        reporter=_ShardWarnings(),
+    )
+
+
+def _classify_shard(shard: Shard, now: float) -> Tuple[List[tuple], Dict[str, int], List[str]]:
+    """
+    Scans and classifies one shard, returning compact FileMatch records,
+    the entry counts of the directories it scanned and its warnings.
+    """
+    directory, recursive, target = shard
+    engine = _worker_engine
+    engine.directory_counts = {}
+    engine.reporter.messages = []
+    scope = engine.inherited_scope(Path(directory), _worker_targets[target])
+    records = []
+    for file_path, stat, file_scope in engine.walk(Path(directory), scope, recursive):
+        match = engine.classify(file_path, stat, now, file_scope)
+        if match is None:
+            continue
+        final_name = render_name(engine.config.rename_format, file_path, stat)
+        records.append(
+            FileMatch(match.source, match.destination, match.rule, stat, final_name).to_record()
+        )
+    return records, engine.directory_counts, engine.reporter.messages
+
+
+def shard_directories(directories: List[Path], min_shards: int) -> List[Shard]:
+    """
+    Splits directory trees into subtree shards.
+
+    Recursive shards are split into their own files plus one recursive
+    shard per subdirectory, level by level, until there are at least
+    `min_shards` or the trees are split `MAX_SHARD_DEPTH` levels deep.
+    """
+    shards: List[Shard] = [(str(directory), True, index) for index, directory in enumerate(directories)]
+    for _ in range(MAX_SHARD_DEPTH):
+        if len(shards) >= min_shards:
+            break
+        expanded: List[Shard] = []
+        for directory, recursive, target in shards:
+            if not recursive:
+                expanded.append((directory, recursive, target))
+                continue
+            try:
+                with os.scandir(directory) as entries:
+                    subdirectories = [
+                        entry.path for entry in entries if entry.is_dir(follow_symlinks=False)
+                    ]
+            except OSError:
+                expanded.append((directory, recursive, target))
+                continue
+            expanded.append((directory, False, target))
+            expanded.extend((subdirectory, True, target) for subdirectory in sorted(subdirectories))
+        if len(expanded) == len(shards):
+            break
+        shards = expanded
+    return shards
+
+
+class ParallelRuleEngine:
+    """
+    Runs the RuleEngine scan and classification in a pool of processes.
+
+    Target directories are split into subtree shards that worker processes
+    scan, classify and rename independently, sending back compact records.
+    The result is the same list of FileMatch objects `RuleEngine` returns,
+    with names already rendered, so a single FileProcessor can resolve
+    destination collisions and write one manifest.
+    """
+
+    def __init__(self, config: Config, processes: int, dry_run: bool = False, reporter: Optional[Reporter] = None):
+        self.config = config
+        self.processes = processes
+        self.dry_run = dry_run
+        self.reporter = reporter or ConsoleReporter()
+        self.directory_counts: Dict[str, int] = {}
+
+    def process_directories(self) -> List[FileMatch]:
+        targets = self.config.targets()
+        directories = []
+        for target in targets:
+            directories.append(Path(target.path).expanduser())
+            if not directories[-1].is_dir():
+                self.reporter.warning(f"Target directory '{directories[-1]}' does not exist or is not a directory.")
+
+        # Missing targets are kept in the list, so shard indexes line up
+        # with `config.targets()` in the workers, but are not scanned.
+        shards = [
+            shard for shard in shard_directories(directories, self.processes * SHARDS_PER_PROCESS)
+            if directories[shard[2]].is_dir()
+        ]
+        if not shards:
+            return []
+
+        now = time.time()
+        actions = []
+        # Shards below one `.fylum.yaml` each look it up, so warnings repeat.
+        warned = set()
+        with ProcessPoolExecutor(
+            max_workers=self.processes,
+            initializer=_init_worker,
+            initargs=(self.config.model_dump(), self.processes),
+        ) as executor:
+            for records, counts, warnings in executor.map(_classify_shard, shards, [now] * len(shards)):
+                actions.extend(FileMatch.from_record(record) for record in records)
+                self.directory_counts.update(counts)
+                for message in warnings:
+                    if message not in warned:
+                        warned.add(message)
+                        self.reporter.warning(message)
+        # Classify plugins run once over all shards, in this process.
+        return PluginPipeline(self.config.plugins, self.reporter).classify(actions)
@@ -0,0 +1,75 @@
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+import json
+import os
+
+from src.engine import FileMatch
+
+
+PLAN_FORMAT_VERSION = 1
+
+
+def write_plan(plan_path: Path, actions: List[FileMatch], rename_format: str) -> None:
+    """
+    Writes the planned moves to a plan file.
+
+    The file is JSON Lines: a header object followed by one compact
+    `FileMatch` record per move, which includes the source's stat
+    fingerprint (size, mtime and inode) from the scan.
+    """
+    with open(plan_path, "w", encoding="utf-8") as f:
+        header = {
+            "fylum_plan": PLAN_FORMAT_VERSION,
+            "created": datetime.now().isoformat(),
+            "rename_format": rename_format,
+            "actions": len(actions),
+        }
+        f.write(json.dumps(header) + "\n")
+        for action in actions:
+            f.write(json.dumps(action.to_record(), separators=(",", ":")) + "\n")
+
+
+def read_plan(plan_path: Path) -> Tuple[Dict, Iterator[FileMatch]]:
+    """Returns the plan header and an iterator over its moves."""
+    f = open(plan_path, "r", encoding="utf-8")
+    try:
+        header = json.loads(f.readline())
+    except json.JSONDecodeError:
+        header = None
+    if not isinstance(header, dict) or header.get("fylum_plan") != PLAN_FORMAT_VERSION:
+        f.close()
+        raise ValueError(f"'{plan_path}' is not a fylum plan file.")
+
+    def actions() -> Iterator[FileMatch]:
+        with f:
+            for line in f:
+                if line.strip():
+                    yield FileMatch.from_record(json.loads(line))
+
+    return header, actions()
+
+
+def is_unchanged(action: FileMatch) -> bool:
+    """Whether the source still matches the stat fingerprint recorded in the plan."""
+    try:
+        current = os.stat(action.source)
+    except OSError:
+        return False
+    recorded = action.stat
+    if recorded is None:
+        return True
+    return (
+        current.st_size == recorded.st_size
+        and current.st_mtime_ns == recorded.st_mtime_ns
+        and current.st_ino == recorded.st_ino
+    )
+
+
+def unchanged_actions(actions: Iterator[FileMatch], skipped: List[FileMatch]) -> Iterator[FileMatch]:
+    """Yields the moves whose source is unchanged, collecting the rest in `skipped`."""
+    for action in actions:
+        if is_unchanged(action):
+            yield action
+        else:
+            skipped.append(action)
@@ -0,0 +1,167 @@
+from pathlib import Path
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import importlib
+
+from src.config import Plugin
+from src.reporting import Reporter
+
+
+# What a hook is called with: one dict per file.
+Record = Dict[str, Any]
+
+
+@lru_cache(maxsize=None)
+def load_hook(path: str) -> Callable:
+    """Imports a `module:function` hook."""
+    module_name, _, attribute = path.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"Plugin hook '{path}' must be given as 'module:function'")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def _call_hook(path: str, records: List[Record], options: Dict[str, Any]):
+    # Looked up by name in the worker, so a process pool only pickles the
+    # name and the records.
+    return load_hook(path)(records, options)
+
+
+class _PluginWorkers:
+    """One plugin and its worker pool, which is started on the first batch."""
+
+    def __init__(self, plugin: Plugin):
+        self.plugin = plugin
+        self._executor = None
+
+    def accepts(self, rule: Optional[str]) -> bool:
+        return self.plugin.rules is None or rule in self.plugin.rules
+
+    def submit(self, records: List[Record]) -> Future:
+        if self._executor is None:
+            executor_class = ProcessPoolExecutor if self.plugin.processes else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.plugin.workers)
+        return self._executor.submit(_call_hook, self.plugin.hook, records, self.plugin.options)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def _match_record(action) -> Record:
+    stat = getattr(action, "stat", None)
+    return {
+        "path": str(action[0]),
+        "destination": str(action[1].parent),
+        "rule": getattr(action, "rule", None),
+        "size": None if stat is None else stat.st_size,
+        "mtime": None if stat is None else stat.st_mtime,
+    }
+
+
+def _reroute(action, decision: Dict[str, Any]):
+    source = action[0]
+    destination = decision.get("destination")
+    destination = action[1] if destination is None else Path(destination).expanduser() / source.name
+    rule = decision.get("rule", getattr(action, "rule", None))
+    return action.__class__(source, destination, rule, getattr(action, "stat", None), getattr(action, "final_name", None))
+
+
+class PluginPipeline:
+    """
+    Calls the configured plugins with batches of up to `batch_size` records.
+
+    `classify` hooks return one decision per record: None or True keeps
+    the engine's choice, False leaves the file where it is, and a dict
+    with `destination` and/or `rule` reroutes it. All of a plugin's
+    batches are submitted at once and run on its workers; each classify
+    plugin sees what the one before it decided.
+
+    `after_move` hooks are handed completed moves as their batches fill
+    and run in the background, so a slow hook never holds up the moves;
+    `finish` waits for them at the end of the run. A failing hook is
+    reported as a warning and never fails a move.
+    """
+
+    def __init__(self, plugins: List[Plugin], reporter: Optional[Reporter] = None):
+        self.reporter = reporter or Reporter()
+        self.classifiers = [_PluginWorkers(plugin) for plugin in plugins if plugin.stage == "classify"]
+        self.listeners = [_PluginWorkers(plugin) for plugin in plugins if plugin.stage == "after_move"]
+        self._buffers: List[List[Record]] = [[] for _ in self.listeners]
+        self._pending: List[Tuple[_PluginWorkers, Future, int]] = []
+
+    def classify(self, actions: list) -> list:
+        for workers in self.classifiers:
+            actions = self._classify_with(workers, actions)
+        return actions
+
+    def _classify_with(self, workers: _PluginWorkers, actions: list) -> list:
+        actions = list(actions)
+        selected = [index for index, action in enumerate(actions) if workers.accepts(getattr(action, "rule", None))]
+        batch_size = workers.plugin.batch_size
+        batches = [
+            (indexes, workers.submit([_match_record(actions[index]) for index in indexes]))
+            for indexes in (selected[start:start + batch_size] for start in range(0, len(selected), batch_size))
+        ]
+
+        skipped = set()
+        try:
+            for indexes, future in batches:
+                try:
+                    decisions = future.result()
+                    if decisions is not None:
+                        decisions = list(decisions)
+                        if len(decisions) != len(indexes):
+                            raise ValueError(f"returned {len(decisions)} decisions for {len(indexes)} files")
+                except Exception as e:
+                    self.reporter.warning(
+                        f"Plugin '{workers.plugin.hook}' failed on {len(indexes)} file(s), which keep their rule: {e}"
+                    )
+                    continue
+                if decisions is None:
+                    continue
+                for index, decision in zip(indexes, decisions):
+                    if decision is False:
+                        skipped.add(index)
+                    elif isinstance(decision, dict):
+                        actions[index] = _reroute(actions[index], decision)
+        finally:
+            workers.shutdown()
+        return [action for index, action in enumerate(actions) if index not in skipped]
+
+    def moved(self, action, size: Optional[int] = None) -> None:
+        """Queues a completed move for the `after_move` hooks without waiting for them."""
+        for position, workers in enumerate(self.listeners):
+            if not workers.accepts(action.rule):
+                continue
+            buffer = self._buffers[position]
+            buffer.append({
+                "source": str(action.source),
+                "destination": str(action.destination),
+                "rule": action.rule,
+                "size": size,
+                "hash": getattr(action, "hash", None),
+                "mode": getattr(action, "mode", None),
+            })
+            if len(buffer) >= workers.plugin.batch_size:
+                self._send(position)
+
+    def _send(self, position: int) -> None:
+        batch, self._buffers[position] = self._buffers[position], []
+        workers = self.listeners[position]
+        self._pending.append((workers, workers.submit(batch), len(batch)))
+
+    def finish(self) -> None:
+        """Sends the last batches and waits for every `after_move` hook to return."""
+        for position, buffer in enumerate(self._buffers):
+            if buffer:
+                self._send(position)
+        pending, self._pending = self._pending, []
+        for workers, future, count in pending:
+            try:
+                future.result()
+            except Exception as e:
+                self.reporter.warning(f"Plugin '{workers.plugin.hook}' failed on {count} moved file(s): {e}")
+        for workers in self.listeners:
+            workers.shutdown()
@@ -1,103 +1,503 @@
 
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import errno
+import os
 import shutil
-import json
+import threading
+import uuid
+
+from src.budget import RunBudget
+from src.config import ManifestRotation, ObjectStorage, Plugin
+from src.history import HistoryStore
+from src.integrity import VerificationError, copy_and_hash, hash_file, verified_move
+from src.linking import LinkMode, create_link, is_link_to
+from src.manifest import JSON_MANIFEST_PATH, MD_MANIFEST_PATH, ManifestWriter
+from src.names import DestinationNames, nfc
+from src.plugins import PluginPipeline
+from src.pruning import REMOVED_DIRECTORY, EmptyDirectoryPruner
+from src.reporting import ConsoleReporter, Reporter
+from src.storage import StorageBackend, StorageConnection, is_remote, join_key, remote_url, split_remote
+from src.throttle import IOThrottle
+
+
+def render_name(rename_format: str, file_path: Path, stat: os.stat_result) -> str:
+    modification_time = datetime.fromtimestamp(stat.st_mtime)
+    original_stem = file_path.stem
+    extension = file_path.suffix
+    
+    new_name = rename_format.format(
+        date=modification_time,
+        original_filename=original_stem
+    )
+    
+    # Names from macOS arrive decomposed; every name is written composed.
+    return nfc(f"{new_name}{extension}")
+
+
+# Uploads confirmed before their sources are deleted together.
+UPLOAD_DELETE_BATCH = 100
+
+# Same-device moves journaled in one history transaction before any of
+# them is made.
+RENAME_BATCH = 500
+
+
+def _totals(actions) -> Tuple[Optional[int], Optional[int]]:
+    """File and byte totals for progress reporting, when known up front."""
+    if not isinstance(actions, list):
+        return None, None
+    total_bytes = 0
+    for action in actions:
+        stat = getattr(action, "stat", None)
+        if stat is None:
+            return len(actions), None
+        total_bytes += stat.st_size
+    return len(actions), total_bytes
 
 
 class FileAction:
-    def __init__(self, source: Path, destination: Path):
+    def __init__(
+        self,
+        source: Path,
+        destination: Path,
+        rule: Optional[str] = None,
+        hash: Optional[str] = None,
+        mode: Optional[str] = None,
+    ):
         self.source = source
         self.destination = destination
+        self.rule = rule
+        self.hash = hash
+        # Set when the destination is a link to the source rather than the moved file.
+        self.mode = mode
         self.timestamp = datetime.now()
 
 
 class FileProcessor:
-    def __init__(self, rename_format: str, dry_run: bool = False):
+    def __init__(
+        self,
+        rename_format: str,
+        dry_run: bool = False,
+        history: Optional[HistoryStore] = None,
+        rotation: Optional[ManifestRotation] = None,
+        reporter: Optional[Reporter] = None,
+        throttle: Optional[IOThrottle] = None,
+        verify: bool = False,
+        link_mode: Optional[LinkMode] = None,
+        object_storage: Optional[ObjectStorage] = None,
+        plugins: Optional[List[Plugin]] = None,
+    ):
         self.rename_format = rename_format
         self.dry_run = dry_run
-        self.manifest_path = Path("_fylum_index.md")
+        self.manifest_path = Path(MD_MANIFEST_PATH)
+        self.json_manifest_path = Path(JSON_MANIFEST_PATH)
+        self.history = history or HistoryStore()
+        self.rotation = rotation
+        self.reporter = reporter or ConsoleReporter()
+        self.throttle = throttle
+        # Verified moves hash every file and record the digest, so copies
+        # across devices are checked and undo can confirm what it restores.
+        self.verify = verify
+        # Link modes leave the sources in place and link them into the
+        # destinations instead, which never copies data.
+        self.link_mode = None if link_mode is None else LinkMode(link_mode)
         self.actions_log = []
+        self._directory_devices: Dict[Path, int] = {}
+        self._lock = threading.Lock()
+        self._manifest: Optional[ManifestWriter] = None
+        self._processed_count = 0
+        self._budget: Optional[RunBudget] = None
+        # Sources a budget stopped the run from moving, and sources that failed.
+        self.unfinished: List[Path] = []
+        self.failed: List[Path] = []
+        self._pruner: Optional[EmptyDirectoryPruner] = None
+        self.removed_directories: List[Path] = []
+        self._names = DestinationNames()
+        # Opened the first time an `s3://` destination comes up.
+        self.object_storage = object_storage
+        self._storage = StorageConnection(object_storage)
+        self._remote_names: Dict[Tuple[str, str], Set[str]] = {}
+        self._uploaded: List[Tuple["_Move", str, str, int]] = []
+        # `after_move` hooks; `classify` hooks run in the engine.
+        self._plugins = PluginPipeline(
+            [plugin for plugin in plugins or [] if plugin.stage == "after_move"], self.reporter
+        )
+
+    def apply_rename_format(self, file_path: Path, stat: Optional[os.stat_result] = None) -> str:
+        if stat is None:
+            stat = file_path.stat()
+        return render_name(self.rename_format, file_path, stat)
 
-    def apply_rename_format(self, file_path: Path) -> str:
-        modification_time = datetime.fromtimestamp(file_path.stat().st_mtime)
-        original_stem = file_path.stem
-        extension = file_path.suffix
-        
-        new_name = self.rename_format.format(
-            date=modification_time,
-            original_filename=original_stem
+    def process_actions(
+        self,
+        actions: Iterable,
+        budget: Optional[RunBudget] = None,
+        pruner: Optional[EmptyDirectoryPruner] = None,
+    ) -> int:
+        # Real moves are streamed to the manifests as they complete; only dry
+        # runs keep the planned actions in memory.
+        self._manifest = None if self.dry_run else ManifestWriter(
+            md_path=self.manifest_path, json_path=self.json_manifest_path,
+            history=self.history, rotation=self.rotation,
         )
-        
-        return f"{new_name}{extension}"
-
-    def process_actions(self, actions: List[Tuple[Path, Path]]) -> int:
-        processed_count = 0
-        
-        for source, destination_dir_path in actions:
-            renamed_filename = self.apply_rename_format(source)
-            final_destination = destination_dir_path.parent / renamed_filename
-            
+        self._processed_count = 0
+        self._budget = budget
+        self.unfinished = []
+        self.failed = []
+        self._pruner = pruner
+        self.removed_directories = []
+        # Destinations are listed afresh each run.
+        self._names = DestinationNames()
+        self._remote_names = {}
+        self.reporter.start(*_totals(actions))
+
+        try:
             if self.dry_run:
-                print(f"[DRY RUN] Would move: {source} -> {final_destination}")
-                self.actions_log.append(FileAction(source, final_destination))
-                processed_count += 1
+                for action in actions:
+                    self._preview(action)
             else:
+                self._execute(actions)
+                if pruner is not None:
+                    self._prune(pruner)
+        finally:
+            # Whatever completed before an interruption is still recorded.
+            if self._manifest is not None:
+                self._manifest.close()
+            self._storage.close()
+            # The moves are done; only the background hooks are waited for.
+            self._plugins.finish()
+            self.reporter.finish()
+
+        return self._processed_count
+
+    def _preview(self, action) -> None:
+        source, destination_dir_path = action
+        stat = getattr(action, "stat", None)
+        if stat is None:
+            stat = source.stat()
+        # Names may already have been rendered, e.g. by a worker process.
+        final_name = getattr(action, "final_name", None)
+        final_destination = destination_dir_path.parent / (final_name or self.apply_rename_format(source, stat))
+        if is_remote(final_destination):
+            final_destination = remote_url(*split_remote(final_destination))
+        self.reporter.would_move(source, final_destination, stat.st_size)
+        self.actions_log.append(FileAction(source, final_destination, getattr(action, "rule", None)))
+        self._processed_count += 1
+
+    def _execute(self, actions: Iterable) -> None:
+        """
+        Runs the moves in three lanes.
+
+        Same-device moves are renames and run on this thread, grouped by
+        destination device and directory when the whole plan is known up
+        front. Cross-device moves copy data, so they run on a separate copy
+        lane, where a large copy never holds up the cheap renames. Each
+        copy is written under a temporary name and only renamed into place,
+        under the same lock that serialises name collisions, manifest
+        writes and reporting, once it is complete. Moves to object storage
+        run on an upload lane of their own, several files at a time.
+
+        Every move is journaled in the history store before it is made, so
+        undo can find it even if the run is killed before the next batch.
+        Renames are journaled `RENAME_BATCH` at a time, copies and uploads,
+        which are dominated by their data transfer, one at a time.
+        """
+        jobs = (job for job in map(self._prepare, actions) if job is not None)
+        if isinstance(actions, list):
+            # Copies are queued first so the copy lane starts straight away.
+            jobs = sorted(jobs, key=lambda job: (not job.copy, job.destination_device, str(job.directory)))
+
+        copies = []
+        renames: List[_Move] = []
+        uploads = self.object_storage.max_concurrency if self.object_storage is not None else 1
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="fylum-copy") as copy_lane, \
+                ThreadPoolExecutor(max_workers=uploads, thread_name_prefix="fylum-upload") as upload_lane:
+            try:
+                for job in jobs:
+                    if self._out_of_time(job):
+                        continue
+                    if job.remote:
+                        copies.append(upload_lane.submit(self._run_upload, job))
+                    elif job.copy:
+                        copies.append(copy_lane.submit(self._run_copy, job))
+                    else:
+                        renames.append(job)
+                        if len(renames) >= RENAME_BATCH:
+                            self._run_renames(renames)
+                            renames = []
+                self._run_renames(renames)
+                for future in copies:
+                    future.result()
+            except BaseException:
+                # Only the copies and uploads in progress are finished on an
+                # interruption.
+                for future in copies:
+                    future.cancel()
+                raise
+            finally:
+                upload_lane.shutdown()
+                # Confirmed uploads are completed even on an interruption.
+                with self._lock:
+                    self._delete_uploaded()
+
+    def _out_of_time(self, job: "_Move") -> bool:
+        """Whether the budget's time ran out before `job` could start."""
+        if self._budget is None or not self._budget.out_of_time():
+            return False
+        with self._lock:
+            self.unfinished.append(job.source)
+        return True
+
+    def _prepare(self, action) -> Optional["_Move"]:
+        source, destination_dir_path = action
+        try:
+            stat = getattr(action, "stat", None)
+            if stat is None:
+                stat = source.stat()
+            final_name = getattr(action, "final_name", None) or self.apply_rename_format(source, stat)
+            directory = destination_dir_path.parent
+            if is_remote(directory):
+                if self.link_mode is not None:
+                    raise ValueError("files cannot be linked into object storage")
+                self._storage.get()
+                return _Move(source, directory, final_name, stat, getattr(action, "rule", None), -1, False, True)
+            device = self._device_of(directory)
+        except Exception as e:
+            self._failed(source, e)
+            return None
+        # Links and symlinked sources never copy data.
+        copy = self.link_mode is None and device != stat.st_dev and not source.is_symlink()
+        return _Move(source, directory, final_name, stat, getattr(action, "rule", None), device, copy)
+
+    def _run_renames(self, jobs: List["_Move"]) -> None:
+        """Makes a batch of same-device moves, journaled together before the first is made."""
+        planned = []
+        with self._lock:
+            for job in jobs:
                 try:
-                    final_destination.parent.mkdir(parents=True, exist_ok=True)
-                    
-                    if final_destination.exists():
-                        counter = 1
-                        while final_destination.exists():
-                            new_name = f"{final_destination.stem}_{counter}{final_destination.suffix}"
-                            final_destination = final_destination.parent / new_name
-                            counter += 1
-                    
-                    shutil.move(str(source), str(final_destination))
-                    print(f"Moved: {source} -> {final_destination}")
-                    self.actions_log.append(FileAction(source, final_destination))
-                    processed_count += 1
-                    
+                    final_destination = job.directory / job.final_name
+                    # Linked sources stay put, so later runs see them again.
+                    if self.link_mode is not None and is_link_to(job.source, final_destination, self.link_mode):
+                        continue
+                    final_destination = self._names.free_name(job.directory, job.final_name)
                 except Exception as e:
-                    print(f"Error moving {source}: {e}")
-        
-        if not self.dry_run and self.actions_log:
-            self._write_manifest()
-        
-        return processed_count
-
-    def _write_manifest(self) -> None:
-        with open(self.manifest_path, "a", encoding="utf-8") as f:
-            f.write(f"\n## Fylum Run - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            f.write("| Original Path | New Path |\n")
-            f.write("|---------------|----------|\n")
-            
-            for action in self.actions_log:
-                f.write(f"| {action.source} | {action.destination} |\n")
-            
-            f.write("\n")
-        
-        json_manifest_path = Path("_fylum_index.json")
-        manifest_data = []
-        if json_manifest_path.exists():
-            with open(json_manifest_path, "r", encoding="utf-8") as f:
+                    self._failed(job.source, e)
+                    continue
+                mode = None if self.link_mode is None else self.link_mode.value
+                planned.append((job, FileAction(job.source, final_destination, job.rule, mode=mode)))
+            if not planned:
+                return
+            try:
+                entries = self._manifest.begin([action for _, action in planned])
+            except Exception as e:
+                for job, _ in planned:
+                    self._failed(job.source, e)
+                return
+
+        for index, ((job, action), entry) in enumerate(zip(planned, entries)):
+            try:
+                self._run_rename(job, action, entry)
+            except BaseException:
+                # Moves of the batch that were never started are forgotten.
+                with self._lock:
+                    if entries[index + 1:]:
+                        self._manifest.discard(entries[index + 1:])
+                raise
+
+    def _run_rename(self, job: "_Move", action: FileAction, entry: int) -> None:
+        source, final_destination = job.source, action.destination
+        try:
+            try:
+                job.directory.mkdir(parents=True, exist_ok=True)
+                if self.throttle is not None:
+                    self.throttle.op()
+                # Hashed before taking the lock, which the other lanes need to
+                # commit their moves.
+                file_hash = None
+                if self.verify and self.link_mode is None and not source.is_symlink():
+                    file_hash = hash_file(source)
+                with self._lock:
+                    if self.link_mode is not None:
+                        create_link(source, final_destination, self.link_mode)
+                    elif self.verify:
+                        action.hash = self._verified_rename(source, final_destination, file_hash)
+                    else:
+                        shutil.move(str(source), str(final_destination))
+                    self._record(action, job.stat, entry)
+            except BaseException:
+                with self._lock:
+                    self._abandon(entry, final_destination)
+                raise
+        except Exception as e:
+            with self._lock:
+                self._failed(source, e)
+
+    @staticmethod
+    def _verified_rename(source: Path, destination: Path, file_hash: Optional[str]) -> Optional[str]:
+        """Renames a file already hashed, falling back to a verified copy across devices."""
+        try:
+            os.rename(source, destination)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            return verified_move(source, destination, file_hash)
+        return file_hash
+
+    def _run_copy(self, job: "_Move") -> None:
+        # Copies queued before the time ran out are left for the next run.
+        if self._out_of_time(job):
+            return
+        source = job.source
+        partial = job.directory / f".fylum-{uuid.uuid4().hex}.part"
+        try:
+            job.directory.mkdir(parents=True, exist_ok=True)
+            if self.throttle is not None:
+                self.throttle.op()
+                self.throttle.transfer(job.stat.st_size)
+            file_hash = None
+            if self.verify:
+                file_hash = copy_and_hash(source, partial)
+                if hash_file(partial) != file_hash:
+                    raise VerificationError(f"copy of '{source}' does not match the original")
+            else:
+                shutil.copy2(str(source), str(partial))
+
+            with self._lock:
+                final_destination = self._names.free_name(job.directory, job.final_name)
+                action = FileAction(source, final_destination, job.rule, file_hash)
+                [entry] = self._manifest.begin([action])
                 try:
-                    manifest_data = json.load(f)
-                except json.JSONDecodeError:
-                    manifest_data = []
-        
-        run_data = {
-            "timestamp": datetime.now().isoformat(),
-            "actions": [
-                {
-                    "source": str(action.source),
-                    "destination": str(action.destination)
-                }
-                for action in self.actions_log
-            ]
-        }
-        manifest_data.append(run_data)
-        
-        with open(json_manifest_path, "w", encoding="utf-8") as f:
-            json.dump(manifest_data, f, indent=2)
+                    os.rename(partial, final_destination)
+                    try:
+                        os.unlink(source)
+                    except OSError:
+                        os.unlink(final_destination)
+                        raise
+                except BaseException:
+                    self._abandon(entry, final_destination)
+                    raise
+                self._record(action, job.stat, entry)
+        except Exception as e:
+            partial.unlink(missing_ok=True)
+            with self._lock:
+                self._failed(source, e)
+
+    def _run_upload(self, job: "_Move") -> None:
+        if self._out_of_time(job):
+            return
+        source = job.source
+        backend = self._storage.get()
+        bucket, prefix = split_remote(job.directory)
+        try:
+            if self.throttle is not None:
+                self.throttle.op()
+                self.throttle.transfer(job.stat.st_size)
+            with self._lock:
+                key = self._free_key(backend, bucket, prefix, job.final_name)
+                [entry] = self._manifest.begin([FileAction(source, remote_url(bucket, key), job.rule)])
+        except Exception as e:
+            with self._lock:
+                self._failed(source, e)
+            return
+        try:
+            backend.upload(source, bucket, key)
+            # The source is only deleted once the whole object is there.
+            if backend.size(bucket, key) != job.stat.st_size:
+                backend.delete_many(bucket, [key])
+                raise VerificationError(f"upload of '{source}' to '{remote_url(bucket, key)}' is incomplete")
+            with self._lock:
+                self._uploaded.append((job, bucket, key, entry))
+                if len(self._uploaded) >= UPLOAD_DELETE_BATCH:
+                    self._delete_uploaded()
+        except Exception as e:
+            with self._lock:
+                self._manifest.discard([entry])
+                self._failed(source, e)
+
+    def _free_key(self, backend: StorageBackend, bucket: str, prefix: str, name: str) -> str:
+        """A key under `prefix` no object has, reserved for the caller. Called with the lock held."""
+        names = self._remote_names.get((bucket, prefix))
+        if names is None:
+            names = self._remote_names[(bucket, prefix)] = set(backend.list_names(bucket, prefix))
+        stem, suffix = os.path.splitext(name)
+        candidate = name
+        counter = 1
+        while candidate in names:
+            candidate = f"{stem}_{counter}{suffix}"
+            counter += 1
+        names.add(candidate)
+        return join_key(prefix, candidate)
+
+    def _delete_uploaded(self) -> None:
+        """Deletes the sources of confirmed uploads as one batch. Called with the lock held."""
+        batch, self._uploaded = self._uploaded, []
+        orphaned: Dict[str, List[str]] = {}
+        for job, bucket, key, entry in batch:
+            try:
+                os.unlink(job.source)
+            except OSError as e:
+                self._manifest.discard([entry])
+                self._failed(job.source, e)
+                orphaned.setdefault(bucket, []).append(key)
+                continue
+            self._record(FileAction(job.source, remote_url(bucket, key), job.rule), job.stat, entry)
+        # A source that could not be deleted stays the only copy.
+        for bucket, keys in orphaned.items():
+            try:
+                self._storage.get().delete_many(bucket, keys)
+            except Exception as e:
+                self.reporter.warning(f"Could not remove {len(keys)} duplicate upload(s) from '{bucket}': {e}")
+
+    def _failed(self, source: Path, error: Exception) -> None:
+        # Called with the lock held, or before the lanes have the job.
+        self.failed.append(source)
+        self.reporter.error(source, error)
+
+    def _abandon(self, entry: int, destination: Path) -> None:
+        """
+        Forgets a journaled move that failed, unless it got as far as its
+        destination, in which case it is left for undo. Called with the lock held.
+        """
+        if not os.path.lexists(destination):
+            self._manifest.discard([entry])
+
+    def _record(self, action: FileAction, stat: os.stat_result, entry: Optional[int] = None) -> None:
+        # Called with the lock held.
+        self.reporter.moved(action.source, action.destination, stat.st_size)
+        self._manifest.add(action, entry)
+        self._processed_count += 1
+        self._plugins.moved(action, stat.st_size)
+        # Linked sources stay where they are.
+        if self._pruner is not None and action.mode is None:
+            self._pruner.moved_out(action.source)
+
+    def _prune(self, pruner: EmptyDirectoryPruner) -> None:
+        """Removes the directories the moves emptied, recording them for undo."""
+        for directory in pruner.prune():
+            self._manifest.add(FileAction(directory, directory, mode=REMOVED_DIRECTORY))
+            self.removed_directories.append(directory)
+
+    def _device_of(self, directory: Path) -> int:
+        """The device `directory` is, or will be created, on."""
+        device = self._directory_devices.get(directory)
+        if device is None:
+            existing = directory
+            while not existing.exists() and existing.parent != existing:
+                existing = existing.parent
+            device = self._directory_devices[directory] = existing.stat().st_dev
+        return device
+
+
+
+class _Move(NamedTuple):
+    source: Path
+    directory: Path
+    final_name: str
+    stat: os.stat_result
+    rule: Optional[str]
+    destination_device: int
+    copy: bool
+    remote: bool = False
@@ -0,0 +1,133 @@
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import os
+import time
+
+from src.engine import RuleEngine, RuleScope
+
+
+class Stats:
+    """Counters for one rule or ignore pattern."""
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+        # Times it was evaluated during normal classification.
+        self.evaluations = 0
+        # Files it decided: moved by the rule, or skipped by the pattern.
+        self.matches = 0
+        # Files it would also match, but an earlier rule or pattern decided.
+        self.shadowed = 0
+        self.seconds = 0.0
+
+    @property
+    def verdict(self) -> str:
+        if self.matches:
+            return ""
+        if self.shadowed:
+            return "shadowed"
+        return "dead"
+
+    def to_dict(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "evaluations": self.evaluations,
+            "matches": self.matches,
+            "shadowed": self.shadowed,
+            "seconds": self.seconds,
+            "verdict": self.verdict,
+        }
+
+
+class RuleProfiler:
+    """
+    Measures what each rule and ignore pattern costs and what it matches.
+
+    Files are classified exactly as `RuleEngine.classify` does, timing every
+    evaluation. Afterwards the rules and patterns that were not reached for
+    a file are still tried, untimed, to find the ones that only ever match
+    files an earlier rule or pattern already decided.
+    """
+
+    def __init__(self, engine: RuleEngine):
+        self.engine = engine
+        self.files = 0
+        self.scan_seconds = 0.0
+        self._stats: Dict[Tuple[str, object], Stats] = {}
+        for pattern in engine.config.ignore_patterns:
+            self._pattern_stats(pattern)
+        for compiled in engine.compiled_rules.rules:
+            self._rule_stats(compiled)
+
+    def profile_directories(self) -> "RuleProfiler":
+        """Scans and profiles every target directory."""
+        for target in self.engine.config.targets():
+            target_dir = Path(target.path).expanduser()
+            if not target_dir.is_dir():
+                self.engine.reporter.warning(f"Target directory '{target_dir}' does not exist or is not a directory.")
+                continue
+            self.profile_files(self.engine.walk(target_dir, self.engine.target_scope(target)))
+        return self
+
+    def profile_files(self, files: Iterable[Tuple[Path, os.stat_result, RuleScope]]) -> "RuleProfiler":
+        now = time.time()
+        iterator = iter(files)
+        while True:
+            started = time.perf_counter()
+            item = next(iterator, None)
+            self.scan_seconds += time.perf_counter() - started
+            if item is None:
+                return self
+            self.profile_file(*item, now=now)
+
+    def profile_file(self, path: Path, stat: os.stat_result, scope: RuleScope, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        self.files += 1
+        decided = False
+        for pattern in scope.ignore_patterns:
+            stats = self._pattern_stats(pattern)
+            if decided:
+                if path.match(pattern):
+                    stats.shadowed += 1
+                continue
+            started = time.perf_counter()
+            matched = path.match(pattern)
+            stats.seconds += time.perf_counter() - started
+            stats.evaluations += 1
+            if matched:
+                stats.matches += 1
+                decided = True
+
+        for compiled in scope.compiled_rules.candidates(path):
+            stats = self._rule_stats(compiled)
+            if decided:
+                if compiled.matches(path, stat, now):
+                    stats.shadowed += 1
+                continue
+            started = time.perf_counter()
+            matched = compiled.matches(path, stat, now)
+            stats.seconds += time.perf_counter() - started
+            stats.evaluations += 1
+            if matched:
+                stats.matches += 1
+                decided = True
+
+    def results(self) -> List[Stats]:
+        """Every rule and pattern seen, most expensive first."""
+        return sorted(self._stats.values(), key=lambda stats: stats.seconds, reverse=True)
+
+    def _pattern_stats(self, pattern: str) -> Stats:
+        key = ("pattern", pattern)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = Stats("pattern", pattern)
+        return stats
+
+    def _rule_stats(self, compiled) -> Stats:
+        # Keyed by the config object, which every scope inheriting it shares.
+        key = ("rule", id(compiled.rule))
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = Stats("rule", compiled.name)
+        return stats
@@ -0,0 +1,56 @@
+from pathlib import Path
+from typing import Dict, Iterable, List
+import os
+
+
+# Recorded in the `mode` of a history action whose source is a directory
+# the run removed; undo recreates these before moving files back.
+REMOVED_DIRECTORY = "rmdir"
+
+
+class EmptyDirectoryPruner:
+    """
+    Removes the directories a run emptied, without walking them again.
+
+    Starts from the number of entries the scan saw in each directory and
+    counts down as files are moved out. A directory that reaches zero is
+    removed, which in turn counts down its parent. Target directories are
+    never removed, and `os.rmdir` refuses any directory that gained an
+    entry since the scan, so nothing new is ever lost.
+    """
+
+    def __init__(self, counts: Dict[str, int], roots: Iterable[Path]):
+        self.remaining = dict(counts)
+        self.roots = {str(Path(root).expanduser()) for root in roots}
+        self._emptied: List[str] = []
+
+    def moved_out(self, source: Path) -> None:
+        parent = str(source.parent)
+        remaining = self.remaining.get(parent)
+        if remaining is None:
+            return
+        self.remaining[parent] = remaining - 1
+        if remaining == 1:
+            self._emptied.append(parent)
+
+    def prune(self) -> List[Path]:
+        """Removes the emptied directories, deepest first, and returns them."""
+        removed = []
+        pending, self._emptied = self._emptied, []
+        while pending:
+            directory = pending.pop()
+            if directory in self.roots:
+                continue
+            try:
+                os.rmdir(directory)
+            except OSError:
+                # Not empty after all, or not ours to remove.
+                continue
+            removed.append(Path(directory))
+            parent = os.path.dirname(directory)
+            remaining = self.remaining.get(parent)
+            if remaining is not None:
+                self.remaining[parent] = remaining - 1
+                if remaining == 1:
+                    pending.append(parent)
+        return removed
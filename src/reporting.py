@@ -0,0 +1,262 @@
+from pathlib import Path
+from enum import Enum
+from typing import List, Optional, TextIO
+import json
+import sys
+import time
+
+
+class LogFormat(str, Enum):
+    text = "text"
+    jsonl = "jsonl"
+
+
+def _format_bytes(count: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024:
+            return f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} TB"
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+class Reporter:
+    """
+    Receives progress events from FileProcessor and UndoManager.
+
+    This base class tracks the counters every reporter needs and otherwise
+    ignores events, so it doubles as a silent reporter.
+    """
+
+    def __init__(self):
+        self.total: Optional[int] = None
+        self.total_bytes: Optional[int] = None
+        self.done = 0
+        self.done_bytes = 0
+        self.errors = 0
+        self.started_at = time.monotonic()
+
+    def start(self, total: Optional[int] = None, total_bytes: Optional[int] = None) -> None:
+        self.total = total
+        self.total_bytes = total_bytes
+        self.done = 0
+        self.done_bytes = 0
+        self.errors = 0
+        self.started_at = time.monotonic()
+
+    def moved(self, source: Path, destination: Path, size: Optional[int] = None) -> None:
+        self._advance(size)
+
+    def would_move(self, source: Path, destination: Path, size: Optional[int] = None) -> None:
+        self._advance(size)
+
+    def reverted(self, current: Path, original: Path, size: Optional[int] = None) -> None:
+        self._advance(size)
+
+    def warning(self, message: str) -> None:
+        pass
+
+    def error(self, path: Path, error: Exception) -> None:
+        self.errors += 1
+
+    def info(self, message: str) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+    def _advance(self, size: Optional[int]) -> None:
+        self.done += 1
+        if size:
+            self.done_bytes += size
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+
+class ConsoleReporter(Reporter):
+    """
+    Human-readable output with an in-place progress line.
+
+    Per-file lines for real moves and reverts are only written when
+    `verbose` is set; dry-run previews are always listed, since they are
+    the point of a dry run. Lines are buffered and written in chunks, and
+    the progress line is redrawn at most every `interval` seconds and only
+    on a terminal, so output never paces the run.
+    """
+
+    def __init__(self, verbose: bool = False, stream: Optional[TextIO] = None, interval: float = 0.2, buffer_lines: int = 1000):
+        super().__init__()
+        self.verbose = verbose
+        self.stream = stream
+        self.interval = interval
+        self.buffer_lines = buffer_lines
+        self._lines: List[str] = []
+        self._last_draw = time.monotonic()
+        self._progress_shown = False
+
+    @property
+    def out(self) -> TextIO:
+        # Resolved lazily so output captured by test runners is honoured.
+        return self.stream or sys.stdout
+
+    def start(self, total: Optional[int] = None, total_bytes: Optional[int] = None) -> None:
+        super().start(total, total_bytes)
+        self._last_draw = time.monotonic()
+
+    def moved(self, source: Path, destination: Path, size: Optional[int] = None) -> None:
+        super().moved(source, destination, size)
+        if self.verbose:
+            self._line(f"Moved: {source} -> {destination}")
+        self._tick()
+
+    def would_move(self, source: Path, destination: Path, size: Optional[int] = None) -> None:
+        super().would_move(source, destination, size)
+        self._line(f"[DRY RUN] Would move: {source} -> {destination}")
+
+    def reverted(self, current: Path, original: Path, size: Optional[int] = None) -> None:
+        super().reverted(current, original, size)
+        if self.verbose:
+            self._line(f"Reverted: {current} -> {original}")
+        self._tick()
+
+    def warning(self, message: str) -> None:
+        self._line(f"Warning: {message}")
+
+    def error(self, path: Path, error: Exception) -> None:
+        super().error(path, error)
+        self._line(f"Error: {path}: {error}")
+        self.flush()
+
+    def info(self, message: str) -> None:
+        self._line(message)
+        self.flush()
+
+    def finish(self) -> None:
+        self.flush()
+
+    def flush(self) -> None:
+        out = self.out
+        if self._progress_shown:
+            out.write("\r\033[K")
+            self._progress_shown = False
+        if self._lines:
+            out.write("\n".join(self._lines) + "\n")
+            self._lines = []
+        out.flush()
+
+    def progress_text(self) -> str:
+        elapsed = max(self.elapsed, 1e-6)
+        files_rate = self.done / elapsed
+        text = f"{self.done}"
+        if self.total:
+            text += f"/{self.total}"
+        text += f" files  {files_rate:.0f} files/s  {_format_bytes(self.done_bytes / elapsed)}/s"
+        if self.total and files_rate > 0:
+            text += f"  ETA {_format_duration((self.total - self.done) / files_rate)}"
+        return text
+
+    def _line(self, text: str) -> None:
+        self._lines.append(text)
+        if len(self._lines) >= self.buffer_lines:
+            self.flush()
+
+    def _tick(self) -> None:
+        now = time.monotonic()
+        if now - self._last_draw < self.interval:
+            return
+        self._last_draw = now
+        if self._lines:
+            self.flush()
+        if self.out.isatty():
+            self.out.write("\r\033[K" + self.progress_text())
+            self.out.flush()
+            self._progress_shown = True
+
+
+class JsonlReporter(Reporter):
+    """
+    Machine-readable output: one JSON object per event.
+
+    Every file event is written, along with periodic `progress` events and a
+    final `summary`. Events are buffered and written in chunks.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, interval: float = 1.0, buffer_lines: int = 1000):
+        super().__init__()
+        self.stream = stream
+        self.interval = interval
+        self.buffer_lines = buffer_lines
+        self._lines: List[str] = []
+        self._last_progress = 0.0
+
+    @property
+    def out(self) -> TextIO:
+        return self.stream or sys.stdout
+
+    def moved(self, source: Path, destination: Path, size: Optional[int] = None) -> None:
+        super().moved(source, destination, size)
+        self._emit("moved", source=str(source), destination=str(destination), size=size)
+
+    def would_move(self, source: Path, destination: Path, size: Optional[int] = None) -> None:
+        super().would_move(source, destination, size)
+        self._emit("would_move", source=str(source), destination=str(destination), size=size)
+
+    def reverted(self, current: Path, original: Path, size: Optional[int] = None) -> None:
+        super().reverted(current, original, size)
+        self._emit("reverted", source=str(current), destination=str(original), size=size)
+
+    def warning(self, message: str) -> None:
+        self._emit("warning", message=message)
+
+    def error(self, path: Path, error: Exception) -> None:
+        super().error(path, error)
+        self._emit("error", path=str(path), message=str(error))
+
+    def info(self, message: str) -> None:
+        self._emit("info", message=message.strip())
+        self.flush()
+
+    def finish(self) -> None:
+        self._emit(
+            "summary",
+            files=self.done,
+            bytes=self.done_bytes,
+            errors=self.errors,
+            seconds=round(self.elapsed, 3),
+        )
+        self.flush()
+
+    def flush(self) -> None:
+        if self._lines:
+            self.out.write("\n".join(self._lines) + "\n")
+            self._lines = []
+        self.out.flush()
+
+    def _emit(self, event: str, **fields) -> None:
+        record = {"event": event, "time": round(time.time(), 3)}
+        record.update(fields)
+        self._lines.append(json.dumps(record))
+
+        now = time.monotonic()
+        if event != "progress" and now - self._last_progress >= self.interval:
+            self._last_progress = now
+            self._emit(
+                "progress", files=self.done, total=self.total, bytes=self.done_bytes,
+                seconds=round(self.elapsed, 3),
+            )
+        if len(self._lines) >= self.buffer_lines:
+            self.flush()
+
+
+def make_reporter(verbose: bool = False, log_format: LogFormat = LogFormat.text) -> Reporter:
+    if log_format == LogFormat.jsonl:
+        return JsonlReporter()
+    return ConsoleReporter(verbose=verbose)
@@ -0,0 +1,172 @@
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+from src.engine import make_stat
+
+
+SNAPSHOT_MAGIC = b"FYLSNAP\0"
+SNAPSHOT_VERSION = 1
+
+# magic, version, reserved, record count, directory count, then the offsets
+# of the records, the directory offset table, the directory names and the
+# file names.
+HEADER = struct.Struct("<8sIIQQQQQQ")
+
+# directory index, name length, name offset, size, mtime_ns, inode, device,
+# mode, padding. Fixed width, so record i is at a computed offset.
+RECORD = struct.Struct("<IIQQqQQII")
+
+OFFSET = struct.Struct("<Q")
+
+
+class SnapshotWriter:
+    """
+    Writes scanned files to a snapshot as they arrive.
+
+    Records are streamed to the snapshot and file names to a temporary
+    file, so memory holds only the directory table. Each directory path is
+    stored once and referenced by index from its files' records.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.count = 0
+        self._directories: Dict[bytes, int] = {}
+        self._names_size = 0
+        self._file: Optional[BinaryIO] = None
+        self._names: Optional[BinaryIO] = None
+
+    def __enter__(self) -> "SnapshotWriter":
+        self._file = open(self.path, "wb")
+        self._file.write(b"\0" * HEADER.size)
+        self._names = tempfile.TemporaryFile()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self._finish()
+        finally:
+            self._names.close()
+            self._file.close()
+            if exc_type is not None:
+                self.path.unlink(missing_ok=True)
+
+    def add(self, path: Path, stat: os.stat_result) -> None:
+        directory = os.fsencode(path.parent)
+        index = self._directories.get(directory)
+        if index is None:
+            index = self._directories[directory] = len(self._directories)
+        name = os.fsencode(path.name)
+        self._file.write(RECORD.pack(
+            index, len(name), self._names_size, stat.st_size, stat.st_mtime_ns,
+            stat.st_ino, stat.st_dev, stat.st_mode, 0,
+        ))
+        self._names.write(name)
+        self._names_size += len(name)
+        self.count += 1
+
+    def add_all(self, files: Iterable[Tuple[Path, os.stat_result]]) -> int:
+        for path, stat in files:
+            self.add(path, stat)
+        return self.count
+
+    def _finish(self) -> None:
+        f = self._file
+        directory_offsets = f.tell()
+        position = 0
+        for directory in self._directories:
+            f.write(OFFSET.pack(position))
+            position += len(directory)
+        f.write(OFFSET.pack(position))
+
+        directory_names = f.tell()
+        f.writelines(self._directories)
+
+        file_names = f.tell()
+        self._names.seek(0)
+        shutil.copyfileobj(self._names, f, 1024 * 1024)
+
+        f.seek(0)
+        f.write(HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, self.count, len(self._directories),
+            HEADER.size, directory_offsets, directory_names, file_names,
+        ))
+
+
+class Snapshot:
+    """
+    A memory-mapped snapshot, read without loading it.
+
+    Opening only reads the header; records and names are decoded from the
+    mapping when they are accessed, so even very large snapshots open
+    instantly and iterate without a copy of the file in memory.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"'{path}' is not a fylum snapshot")
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise ValueError(f"'{path}' is not a fylum snapshot")
+
+        (
+            magic, version, _, self.count, self.directory_count,
+            self._records, self._directory_offsets, self._directory_names, self._file_names,
+        ) = HEADER.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError(f"'{path}' is not a fylum snapshot")
+        if version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported snapshot version {version}")
+        self._directory_cache: List[Optional[Path]] = [None] * self.directory_count
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        self._map.close()
+
+    def directory(self, index: int) -> Path:
+        path = self._directory_cache[index]
+        if path is None:
+            start, end = struct.unpack_from("<QQ", self._map, self._directory_offsets + index * OFFSET.size)
+            raw = self._map[self._directory_names + start:self._directory_names + end]
+            path = self._directory_cache[index] = Path(os.fsdecode(raw))
+        return path
+
+    def __getitem__(self, index: int) -> Tuple[Path, os.stat_result]:
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self._decode(RECORD.unpack_from(self._map, self._records + index * RECORD.size))
+
+    def __iter__(self) -> Iterator[Tuple[Path, os.stat_result]]:
+        # Unpacks a bounded slice at a time so iterating never copies the
+        # whole record table.
+        chunk = 65536 * RECORD.size
+        end = self._records + self.count * RECORD.size
+        for start in range(self._records, end, chunk):
+            for fields in RECORD.iter_unpack(self._map[start:min(start + chunk, end)]):
+                yield self._decode(fields)
+
+    def _decode(self, fields: tuple) -> Tuple[Path, os.stat_result]:
+        directory, name_length, name_offset, size, mtime_ns, ino, dev, mode, _ = fields
+        start = self._file_names + name_offset
+        name = os.fsdecode(self._map[start:start + name_length])
+        return self.directory(directory) / name, make_stat(size, mtime_ns, ino, dev, mode)
@@ -0,0 +1,58 @@
+from typing import Iterable, Iterator, List
+import os
+import time
+
+
+def settled(actions: Iterable, settle_seconds: float, deferred: List) -> Iterable:
+    """
+    Filters the planned moves down to files no longer being written.
+
+    A file is settled once it has not been modified for `settle_seconds`.
+    Files already that old when scanned are yielded straight away, so they
+    can be moved while the rest settle. The recently modified ones are then
+    stat'ed a second time, once for all of them, as soon as the newest has
+    had `settle_seconds` to change: those whose size and mtime are still
+    the same are yielded, the others are added to `deferred` for the next
+    run. Nothing ever waits longer than `settle_seconds` in total.
+    """
+    if settle_seconds <= 0:
+        # Returned as is, so a full plan can still be scheduled up front.
+        return actions
+    return _settled(actions, settle_seconds, deferred)
+
+
+def _settled(actions: Iterable, settle_seconds: float, deferred: List) -> Iterator:
+    now = time.time()
+    recent = []
+    for action in actions:
+        stat = getattr(action, "stat", None)
+        if stat is None:
+            try:
+                stat = os.stat(action[0])
+            except OSError:
+                # Left to the processor to report.
+                yield action
+                continue
+        if now - stat.st_mtime >= settle_seconds:
+            yield action
+        else:
+            recent.append((action, stat))
+
+    if not recent:
+        return
+
+    newest = max(stat.st_mtime for _, stat in recent)
+    wait = min(settle_seconds, newest + settle_seconds - time.time())
+    if wait > 0:
+        time.sleep(wait)
+
+    for action, stat in recent:
+        try:
+            current = os.stat(action[0])
+        except OSError:
+            deferred.append(action)
+            continue
+        if (current.st_size, current.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            yield action
+        else:
+            deferred.append(action)
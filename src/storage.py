@@ -0,0 +1,319 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import importlib
+import os
+import shutil
+import uuid
+
+from src.config import ObjectStorage
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # Only needed for S3 destinations.
+    boto3 = None
+
+
+REMOTE_SCHEME = "s3"
+
+# Object metadata holding the source's mtime, restored by undo.
+MTIME_METADATA = "fylum-mtime-ns"
+
+# S3 deletes at most this many objects per request.
+DELETE_BATCH_SIZE = 1000
+
+
+def is_remote(destination) -> bool:
+    """
+    Whether a destination is an object store URL.
+
+    `Path("s3://bucket/key")` collapses the double slash, so both forms
+    are accepted.
+    """
+    return str(destination).startswith(f"{REMOTE_SCHEME}:/")
+
+
+def split_remote(destination) -> Tuple[str, str]:
+    """(bucket, key) of an `s3://bucket/key` destination."""
+    rest = str(destination)[len(REMOTE_SCHEME) + 1:].lstrip("/")
+    bucket, _, key = rest.partition("/")
+    return bucket, key.strip("/")
+
+
+def remote_url(bucket: str, key: str) -> str:
+    return f"{REMOTE_SCHEME}://{bucket}/{key}"
+
+
+def join_key(prefix: str, name: str) -> str:
+    return f"{prefix}/{name}" if prefix else name
+
+
+class StorageBackend(ABC):
+    """
+    An object store files can be moved to.
+
+    Backends upload whole files, however they split them, and only make an
+    object visible once it is complete. They must be safe to call from
+    several threads at once. A backend missing any of the abstract
+    methods cannot be instantiated.
+    """
+
+    @abstractmethod
+    def upload(self, source: Path, bucket: str, key: str) -> None:
+        """Uploads `source` as `key`, keeping its mtime in the object's metadata."""
+
+    @abstractmethod
+    def size(self, bucket: str, key: str) -> Optional[int]:
+        """The size of an object, or None if it does not exist."""
+
+    @abstractmethod
+    def download(self, bucket: str, key: str, destination: Path) -> None:
+        """Writes an object to `destination`, with the mtime it was uploaded with."""
+
+    @abstractmethod
+    def delete_many(self, bucket: str, keys: List[str]) -> None:
+        """Deletes objects; keys that do not exist are ignored."""
+
+    @abstractmethod
+    def list_names(self, bucket: str, prefix: str) -> Iterator[str]:
+        """Names of the objects directly under `prefix`."""
+
+    def close(self) -> None:
+        pass
+
+
+class LocalObjectStore(StorageBackend):
+    """
+    An object store kept in a local directory, one folder per bucket.
+
+    A stand-in for S3 that needs no network: files larger than `part_size`
+    are uploaded as parts written concurrently, and an object only appears
+    under its key once every part is in.
+    """
+
+    def __init__(self, root: Path, part_size: int = 8 * 1024 * 1024, max_concurrency: int = 8):
+        self.root = Path(root).expanduser()
+        self.part_size = part_size
+        self._parts = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="fylum-part")
+
+    @classmethod
+    def from_config(cls, storage: ObjectStorage) -> "LocalObjectStore":
+        if storage.root is None:
+            raise ValueError("the 'local' object storage backend needs a 'root' directory")
+        return cls(storage.root, storage.part_size, storage.max_concurrency)
+
+    def _path(self, bucket: str, key: str) -> Path:
+        if not bucket or ".." in key.split("/") or ".." == bucket:
+            raise ValueError(f"invalid object key '{bucket}/{key}'")
+        return self.root / bucket / key
+
+    def upload(self, source: Path, bucket: str, key: str) -> None:
+        target = self._path(bucket, key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        staging = target.parent / f".upload-{uuid.uuid4().hex}"
+        size = os.path.getsize(source)
+        try:
+            with open(staging, "wb") as f:
+                f.truncate(size)
+            offsets = range(0, size, self.part_size) if size else []
+            for _ in self._parts.map(lambda offset: self._upload_part(source, staging, offset), offsets):
+                pass
+            shutil.copystat(source, staging)
+            os.replace(staging, target)
+        except BaseException:
+            staging.unlink(missing_ok=True)
+            raise
+
+    def _upload_part(self, source: Path, staging: Path, offset: int) -> None:
+        source_fd = os.open(source, os.O_RDONLY)
+        try:
+            data = os.pread(source_fd, self.part_size, offset)
+        finally:
+            os.close(source_fd)
+        staging_fd = os.open(staging, os.O_WRONLY)
+        try:
+            os.pwrite(staging_fd, data, offset)
+        finally:
+            os.close(staging_fd)
+
+    def size(self, bucket: str, key: str) -> Optional[int]:
+        try:
+            return self._path(bucket, key).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def download(self, bucket: str, key: str, destination: Path) -> None:
+        partial = destination.parent / f".fylum-{uuid.uuid4().hex}.part"
+        try:
+            shutil.copy2(self._path(bucket, key), partial)
+            os.replace(partial, destination)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+
+    def delete_many(self, bucket: str, keys: List[str]) -> None:
+        for key in keys:
+            self._path(bucket, key).unlink(missing_ok=True)
+
+    def list_names(self, bucket: str, prefix: str) -> Iterator[str]:
+        try:
+            with os.scandir(self._path(bucket, prefix)) as entries:
+                names = [entry.name for entry in entries if entry.is_file() and not entry.name.startswith(".upload-")]
+        except FileNotFoundError:
+            return iter([])
+        return iter(names)
+
+    def close(self) -> None:
+        self._parts.shutdown()
+
+
+class S3Backend(StorageBackend):
+    """
+    Amazon S3, or any S3-compatible store at `endpoint_url`.
+
+    Files over `part_size` are sent as multipart uploads with up to
+    `max_concurrency` parts in flight, over a connection pool shared by
+    every thread. Needs `boto3`.
+    """
+
+    def __init__(
+        self,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        part_size: int = 8 * 1024 * 1024,
+        max_concurrency: int = 8,
+        max_pool_connections: int = 16,
+    ):
+        if boto3 is None:
+            raise RuntimeError("S3 destinations need boto3; install it with 'pip install boto3'")
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=BotoConfig(max_pool_connections=max_pool_connections),
+        )
+        self.transfer = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=max_concurrency,
+        )
+
+    @classmethod
+    def from_config(cls, storage: ObjectStorage) -> "S3Backend":
+        return cls(
+            storage.endpoint_url, storage.region, storage.part_size,
+            storage.max_concurrency, storage.max_pool_connections,
+        )
+
+    def upload(self, source: Path, bucket: str, key: str) -> None:
+        mtime_ns = os.stat(source).st_mtime_ns
+        self.client.upload_file(
+            str(source), bucket, key,
+            ExtraArgs={"Metadata": {MTIME_METADATA: str(mtime_ns)}},
+            Config=self.transfer,
+        )
+
+    def _head(self, bucket: str, key: str) -> Optional[dict]:
+        try:
+            return self.client.head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def size(self, bucket: str, key: str) -> Optional[int]:
+        head = self._head(bucket, key)
+        return None if head is None else head["ContentLength"]
+
+    def download(self, bucket: str, key: str, destination: Path) -> None:
+        head = self._head(bucket, key)
+        if head is None:
+            raise FileNotFoundError(f"'{remote_url(bucket, key)}' does not exist")
+        partial = destination.parent / f".fylum-{uuid.uuid4().hex}.part"
+        try:
+            self.client.download_file(bucket, key, str(partial), Config=self.transfer)
+            mtime_ns = head.get("Metadata", {}).get(MTIME_METADATA)
+            if mtime_ns is not None:
+                os.utime(partial, ns=(int(mtime_ns), int(mtime_ns)))
+            os.replace(partial, destination)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+
+    def delete_many(self, bucket: str, keys: List[str]) -> None:
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            response = self.client.delete_objects(
+                Bucket=bucket,
+                Delete={"Objects": [{"Key": key} for key in keys[start:start + DELETE_BATCH_SIZE]], "Quiet": True},
+            )
+            errors = response.get("Errors")
+            if errors:
+                raise OSError(f"could not delete {len(errors)} object(s) from '{bucket}': {errors[0].get('Message')}")
+
+    def list_names(self, bucket: str, prefix: str) -> Iterator[str]:
+        prefix = f"{prefix}/" if prefix else ""
+        pages = self.client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix, Delimiter="/")
+        for page in pages:
+            for entry in page.get("Contents", []):
+                yield entry["Key"][len(prefix):]
+
+
+BackendFactory = Callable[[ObjectStorage], StorageBackend]
+
+BACKENDS: Dict[str, BackendFactory] = {
+    "s3": S3Backend.from_config,
+    "local": LocalObjectStore.from_config,
+}
+
+
+def register_backend(name: str, factory: BackendFactory) -> None:
+    """Makes a backend available as `object_storage: {backend: <name>}`."""
+    BACKENDS[name] = factory
+
+
+def open_backend(storage: ObjectStorage) -> StorageBackend:
+    """
+    Opens the configured backend.
+
+    `backend` is a registered name, or `module:factory` for a callable
+    that takes the `ObjectStorage` config and returns a `StorageBackend`.
+    """
+    factory = BACKENDS.get(storage.backend)
+    if factory is None and ":" in storage.backend:
+        module_name, _, attribute = storage.backend.partition(":")
+        factory = getattr(importlib.import_module(module_name), attribute)
+    if factory is None:
+        raise ValueError(f"Unknown object storage backend '{storage.backend}'")
+    return factory(storage)
+
+
+class StorageConnection:
+    """Opens the configured backend the first time a remote destination needs it."""
+
+    def __init__(self, storage: Optional[ObjectStorage]):
+        self.storage = storage
+        self._backend: Optional[StorageBackend] = None
+
+    def get(self) -> StorageBackend:
+        if self._backend is None:
+            if self.storage is None:
+                raise ValueError("no object storage is configured for s3:// destinations")
+            self._backend = open_backend(self.storage)
+        return self._backend
+
+    def close(self) -> None:
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
+
+
+def group_by_bucket(urls: Iterable[str]) -> Dict[str, List[str]]:
+    keys: Dict[str, List[str]] = {}
+    for url in urls:
+        bucket, key = split_remote(url)
+        keys.setdefault(bucket, []).append(key)
+    return keys
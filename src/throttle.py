@@ -0,0 +1,106 @@
+from typing import Optional
+import ctypes
+import os
+import platform
+import sys
+import threading
+import time
+
+from src.config import Throttle
+
+
+# ioprio_set(2) syscall numbers; Python has no wrapper for it.
+_IOPRIO_SET_SYSCALLS = {
+    "x86_64": 251,
+    "aarch64": 30,
+    "i686": 289,
+    "i386": 289,
+    "armv7l": 314,
+}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_IDLE = 3
+_IOPRIO_CLASS_SHIFT = 13
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, bursts up to `capacity`.
+
+    `acquire` blocks until enough tokens are available. Requests larger than
+    the capacity are allowed and simply leave the bucket in debt, so a single
+    large file still gets through at the configured average rate.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class IOThrottle:
+    """Operation and byte rate limits shared by scanning and moving."""
+
+    def __init__(self, ops_per_second: Optional[float] = None, bytes_per_second: Optional[int] = None):
+        self.ops = TokenBucket(ops_per_second) if ops_per_second else None
+        self.bytes = TokenBucket(bytes_per_second) if bytes_per_second else None
+
+    @classmethod
+    def from_config(cls, throttle: Throttle, share: int = 1) -> Optional["IOThrottle"]:
+        """
+        Builds a throttle from config, or None when no limit is set.
+
+        `share` splits the limits evenly, e.g. between worker processes.
+        """
+        if not throttle.ops_per_second and not throttle.bytes_per_second:
+            return None
+        return cls(
+            throttle.ops_per_second / share if throttle.ops_per_second else None,
+            throttle.bytes_per_second / share if throttle.bytes_per_second else None,
+        )
+
+    def op(self, count: int = 1) -> None:
+        if self.ops is not None:
+            self.ops.acquire(count)
+
+    def transfer(self, size: int) -> None:
+        if self.bytes is not None and size:
+            self.bytes.acquire(size)
+
+
+def set_idle_priority() -> bool:
+    """
+    Lowers this process to the lowest CPU priority and, on Linux, the idle
+    I/O class, so it only gets disk time nobody else wants. Child processes
+    inherit both. Returns whether the I/O priority could be set.
+    """
+    if hasattr(os, "nice"):
+        try:
+            os.nice(19)
+        except OSError:
+            pass
+
+    syscall_number = _IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if not sys.platform.startswith("linux") or syscall_number is None:
+        return False
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        result = libc.syscall(
+            syscall_number, _IOPRIO_WHO_PROCESS, 0, _IOPRIO_CLASS_IDLE << _IOPRIO_CLASS_SHIFT
+        )
+    except (OSError, AttributeError):
+        return False
+    return result == 0
@@ -1,68 +1,165 @@
-
 from pathlib import Path
-import json
+from datetime import datetime
+import os
 import shutil
 from typing import Optional, Dict, List
 
+from src.config import ObjectStorage
+from src.history import HistoryStore
+from src.integrity import VerificationError, verified_move
+from src.linking import is_link_to
+from src.pruning import REMOVED_DIRECTORY
+from src.reporting import ConsoleReporter, Reporter
+from src.storage import StorageConnection, group_by_bucket, is_remote, split_remote
+
 
 class UndoManager:
-    def __init__(self):
-        self.json_manifest_path = Path("_fylum_index.json")
+    def __init__(
+        self,
+        history: Optional[HistoryStore] = None,
+        reporter: Optional[Reporter] = None,
+        object_storage: Optional[ObjectStorage] = None,
+    ):
+        self.history = history or HistoryStore()
+        self.reporter = reporter or ConsoleReporter()
+        # Needed only to undo moves to `s3://` destinations.
+        self.object_storage = object_storage
 
     def get_last_run(self) -> Optional[Dict]:
-        if not self.json_manifest_path.exists():
-            return None
-        
-        try:
-            with open(self.json_manifest_path, "r", encoding="utf-8") as f:
-                manifest_data = json.load(f)
-            
-            if not manifest_data:
-                return None
-            
-            return manifest_data[-1]
-        except (json.JSONDecodeError, IOError):
-            return None
+        return self.history.get_last_run()
 
     def revert_last_run(self) -> int:
         last_run = self.get_last_run()
-        
+
         if not last_run:
-            print("No previous run found to undo.")
+            self.reporter.info("No previous run found to undo.")
+            return 0
+
+        return self.revert(run_id=last_run["run_id"])
+
+    def revert(
+        self,
+        run_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        rule: Optional[str] = None,
+        path_prefix: Optional[str] = None,
+    ) -> int:
+        """Reverts only the recorded moves matching every given filter."""
+        actions = self.history.select_actions(
+            run_id=run_id, since=since, rule=rule, path_prefix=path_prefix
+        )
+
+        if not actions:
+            self.reporter.info("No matching moves found to undo.")
             return 0
-        
-        actions = last_run.get("actions", [])
+
+        return self._revert_actions(actions)
+
+    def _revert_actions(self, actions: List[Dict]) -> int:
         reverted_count = 0
-        
-        for action in reversed(actions):
+        failed_ids = set()
+        moves = [action for action in actions if action.get("mode") != REMOVED_DIRECTORY]
+        self.reporter.start(len(moves))
+
+        # Directories the runs removed are recreated up front in one batch,
+        # parents first; files moved back into them then need no mkdir.
+        ensured = set()
+        for action in sorted(
+            (action for action in actions if action.get("mode") == REMOVED_DIRECTORY),
+            key=lambda action: action["source"],
+        ):
+            try:
+                os.makedirs(action["source"], exist_ok=True)
+                ensured.add(Path(action["source"]))
+            except OSError as e:
+                self.reporter.error(Path(action["source"]), e)
+                failed_ids.add(action["id"])
+
+        storage = StorageConnection(self.object_storage)
+        downloaded = []
+        # Newest first, so chained moves (a -> b, then b -> c) unwind correctly.
+        for action in reversed(moves):
             source = Path(action["source"])
             destination = Path(action["destination"])
-            
+            # Journaled by a run that stopped before confirming the move, so
+            # a missing destination means the move was never made.
+            pending = action.get("pending")
+
+            if is_remote(action["destination"]):
+                # Objects are downloaded one by one and deleted in batches.
+                try:
+                    backend = storage.get()
+                    bucket, key = split_remote(action["destination"])
+                    if backend.size(bucket, key) is None:
+                        if not pending:
+                            self.reporter.warning(f"Object not found at {action['destination']}, skipping...")
+                        continue
+                    if source.parent not in ensured:
+                        source.parent.mkdir(parents=True, exist_ok=True)
+                        ensured.add(source.parent)
+                    backend.download(bucket, key, source)
+                    downloaded.append(action)
+                    self.reporter.reverted(action["destination"], source)
+                    reverted_count += 1
+                except Exception as e:
+                    self.reporter.error(source, e)
+                    failed_ids.add(action["id"])
+                continue
+
+            if action.get("mode"):
+                # The source never moved; only the link is removed.
+                if not os.path.lexists(destination):
+                    if not pending:
+                        self.reporter.warning(f"Link not found at {destination}, skipping...")
+                    continue
+                if not is_link_to(source, destination, action["mode"]):
+                    self.reporter.warning(f"{destination} is no longer a {action['mode']} to {source}, skipping...")
+                    failed_ids.add(action["id"])
+                    continue
+                try:
+                    destination.unlink()
+                    self.reporter.reverted(destination, source)
+                    reverted_count += 1
+                except OSError as e:
+                    self.reporter.error(destination, e)
+                    failed_ids.add(action["id"])
+                continue
+
             if not destination.exists():
-                print(f"Warning: File not found at {destination}, skipping...")
+                if not pending:
+                    self.reporter.warning(f"File not found at {destination}, skipping...")
                 continue
-            
+
             try:
-                source.parent.mkdir(parents=True, exist_ok=True)
-                shutil.move(str(destination), str(source))
-                print(f"Reverted: {destination} -> {source}")
+                if source.parent not in ensured:
+                    source.parent.mkdir(parents=True, exist_ok=True)
+                    ensured.add(source.parent)
+                if action.get("hash"):
+                    # Only restore exactly what was moved.
+                    verified_move(destination, source, expected_hash=action["hash"])
+                else:
+                    shutil.move(str(destination), str(source))
+                self.reporter.reverted(destination, source)
                 reverted_count += 1
+            except VerificationError as e:
+                self.reporter.warning(f"{e}, skipping...")
+                failed_ids.add(action["id"])
             except Exception as e:
-                print(f"Error reverting {destination}: {e}")
-        
-        self._remove_last_run()
-        
-        return reverted_count
+                self.reporter.error(destination, e)
+                failed_ids.add(action["id"])
+
+        for bucket, keys in group_by_bucket(action["destination"] for action in downloaded).items():
+            try:
+                storage.get().delete_many(bucket, keys)
+            except Exception as e:
+                # The files are back; only the copies left in the store remain.
+                self.reporter.warning(f"Could not delete {len(keys)} restored object(s) from '{bucket}': {e}")
+        storage.close()
+        self.reporter.finish()
+
+        # Failed reverts stay in the history so they can be retried.
+        self.history.delete_actions(
+            action["id"] for action in actions if action["id"] not in failed_ids
+        )
 
-    def _remove_last_run(self) -> None:
-        try:
-            with open(self.json_manifest_path, "r", encoding="utf-8") as f:
-                manifest_data = json.load(f)
-            
-            if manifest_data:
-                manifest_data.pop()
-            
-            with open(self.json_manifest_path, "w", encoding="utf-8") as f:
-                json.dump(manifest_data, f, indent=2)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Warning: Could not update manifest: {e}")
+        return reverted_count
@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import pytest
+
+THROUGHPUT = pytest.StashKey[list]()
+
+
+MANIFEST_ARTIFACTS = [
+    "_fylum_history.db",
+    "_fylum_history.db-wal",
+    "_fylum_history.db-shm",
+    "_fylum_index.lock",
+    "_fylum_archive_cache.json",
+    "_fylum_cursor.json",
+]
+
+
+@pytest.fixture(autouse=True)
+def clean_manifest_artifacts():
+    """Ensures manifest artifacts written to the working directory don't leak between tests."""
+    for artifact in MANIFEST_ARTIFACTS:
+        Path(artifact).unlink(missing_ok=True)
+
+    yield
+
+    for artifact in MANIFEST_ARTIFACTS:
+        Path(artifact).unlink(missing_ok=True)
+
+
+def pytest_configure(config):
+    config.stash[THROUGHPUT] = []
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    figures = config.stash.get(THROUGHPUT, [])
+    if figures:
+        terminalreporter.section("throughput")
+        for line in figures:
+            terminalreporter.write_line(line)
+
+
+@pytest.fixture
+def throughput(request):
+    """Records a files-per-second figure, listed at the end of the test run."""
+    def record(name: str, files: int, seconds: float) -> None:
+        rate = files / seconds if seconds else float("inf")
+        request.config.stash[THROUGHPUT].append(f"{name}: {files} files in {seconds:.2f}s ({rate:,.0f} files/s)")
+    return record
@@ -0,0 +1,100 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src.api import Fylum
+from src.config import Config, Rule
+from src.history import HistoryStore
+from src.plan import write_plan
+from src.reporting import Reporter
+
+
+class RecordingReporter(Reporter):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def moved(self, source, destination, size=None):
+        super().moved(source, destination, size)
+        self.events.append(("moved", source, destination))
+
+    def warning(self, message):
+        self.events.append(("warning", message))
+
+    def error(self, path, error):
+        super().error(path, error)
+        self.events.append(("error", path))
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+    Path("_fylum_index.md").unlink(missing_ok=True)
+    Path("_fylum_index.json").unlink(missing_ok=True)
+
+
+@pytest.fixture
+def fylum(temp_dir):
+    inbox = temp_dir / "inbox"
+    (inbox / "scans").mkdir(parents=True)
+    (inbox / "scans" / ".fylum.yaml").write_text(
+        f"rules:\n  - {{name: Scans, extensions: ['.pdf'], destination: '{temp_dir / 'Scans'}'}}\n"
+    )
+    config = Config(
+        target_directories=[str(inbox)],
+        rename_format="{original_filename}",
+        rules=[Rule(name="Docs", extensions=[".pdf", ".txt"], destination=str(temp_dir / "Docs"))],
+    )
+    with Fylum(config, reporter=RecordingReporter(), history=HistoryStore(temp_dir / "history.db")) as instance:
+        yield instance
+
+
+def test_classify_uses_the_scope_of_each_file(fylum, temp_dir):
+    inbox = temp_dir / "inbox"
+    for path in (inbox / "a.pdf", inbox / "scans" / "b.pdf", temp_dir / "c.txt", inbox / "d.jpg"):
+        path.touch()
+
+    matches = fylum.classify([inbox / "a.pdf", inbox / "scans" / "b.pdf", temp_dir / "c.txt", inbox / "d.jpg", inbox / "missing.pdf"])
+
+    assert [(m.source.name, m.rule) for m in matches] == [("a.pdf", "Docs"), ("b.pdf", "Scans"), ("c.txt", "Docs")]
+    assert fylum.reporter.events == [("error", inbox / "missing.pdf")]
+
+
+def test_execute_and_undo_reuse_one_instance(fylum, temp_dir):
+    source = temp_dir / "inbox" / "report.txt"
+    source.write_text("report")
+
+    assert fylum.execute(fylum.classify([source])) == 1
+    assert (temp_dir / "Docs" / "report.txt").exists()
+    assert ("moved", source, temp_dir / "Docs" / "report.txt") in fylum.reporter.events
+
+    assert fylum.undo() == 1
+    assert source.exists()
+
+
+def test_execute_plan_file_skips_changed_files(fylum, temp_dir):
+    kept, changed = temp_dir / "inbox" / "kept.txt", temp_dir / "inbox" / "changed.txt"
+    kept.write_text("kept")
+    changed.write_text("changed")
+    plan = temp_dir / "plan.jsonl"
+    write_plan(plan, fylum.scan(), fylum.config.rename_format)
+    changed.write_text("changed again, and longer")
+
+    assert fylum.execute(plan) == 1
+    # The filtered plan is handed over whole, so its size is known up front.
+    assert fylum.reporter.total == 1
+    assert (temp_dir / "Docs" / "kept.txt").exists()
+    assert changed.exists()
+    assert any(event[0] == "warning" for event in fylum.reporter.events)
+
+
+def test_from_file_raises_on_invalid_config(temp_dir):
+    path = temp_dir / "config.yaml"
+    path.write_text("rules: [{name: Broken}]\n")
+
+    with pytest.raises(ValueError):
+        Fylum.from_file(path)
@@ -0,0 +1,85 @@
+import gzip
+import json
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from src.archive import ManifestArchive
+from src.config import ManifestRotation
+from src.history import HistoryStore
+from src.manifest import ManifestWriter
+from src.processor import FileAction
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+@pytest.fixture
+def paths(temp_dir):
+    return temp_dir / "index.md", temp_dir / "index.json"
+
+
+def write_runs(temp_dir, paths, count, rotation):
+    md_path, json_path = paths
+    history = HistoryStore(temp_dir / "history.db")
+    archive = ManifestArchive(temp_dir / "archive")
+    for i in range(count):
+        with ManifestWriter(md_path, json_path, history, rotation=rotation, archive=archive) as writer:
+            writer.add(FileAction(Path(f"/src/{i}.txt"), Path(f"/dst/{i}.txt")))
+    history.close()
+    return archive
+
+
+def test_no_rotation_below_limits(temp_dir, paths):
+    archive = write_runs(temp_dir, paths, 3, ManifestRotation(max_bytes=10 ** 9))
+
+    assert archive.segments() == []
+    assert len(json.loads(paths[1].read_text())) == 3
+
+
+def test_size_based_rotation(temp_dir, paths):
+    # Every run pushes the manifest over the limit, so each new run rotates the previous one.
+    archive = write_runs(temp_dir, paths, 3, ManifestRotation(max_bytes=1))
+
+    segments = archive.segments()
+    assert [entry["first_run_id"] for entry in segments] == [1, 2]
+    assert (temp_dir / "archive" / "segment-000001.json.gz").exists()
+    assert (temp_dir / "archive" / "segment-000001.md.gz").exists()
+
+    # The current segment only holds the latest run and stays uncompressed.
+    current = json.loads(paths[1].read_text())
+    assert [run["run_id"] for run in current] == [3]
+
+
+def test_find_run_opens_only_its_segment(temp_dir, paths):
+    archive = write_runs(temp_dir, paths, 3, ManifestRotation(max_bytes=1))
+
+    (temp_dir / "archive" / "segment-000001.json.gz").write_bytes(b"corrupt")
+
+    run = archive.find_run(2)
+    assert run["actions"][0]["source"] == "/src/1.txt"
+    assert archive.find_run(99) is None
+
+
+def test_age_based_rotation(temp_dir, paths):
+    md_path, json_path = paths
+    old = (datetime.now() - timedelta(days=40)).isoformat()
+    json_path.write_text(json.dumps([{"run_id": 1, "timestamp": old, "actions": []}], indent=2))
+    archive = ManifestArchive(temp_dir / "archive")
+
+    assert not archive.needs_rotation(md_path, json_path, ManifestRotation(max_bytes=None, max_age_days=60))
+    assert archive.needs_rotation(md_path, json_path, ManifestRotation(max_bytes=None, max_age_days=30))
+
+    entry = archive.rotate_if_needed(md_path, json_path, ManifestRotation(max_bytes=None, max_age_days=30))
+
+    assert entry["first_timestamp"] == old
+    assert not json_path.exists()
+    with gzip.open(temp_dir / "archive" / entry["json"], "rb") as f:
+        assert json.loads(f.read())[0]["run_id"] == 1
@@ -0,0 +1,116 @@
+import gzip
+import io
+import json
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from src import archive_contents
+from src.archive_contents import ArchiveIndex, read_contents
+from src.config import Config, Rule
+from src.engine import RuleEngine
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+def make_zip(path: Path, names):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name in names:
+            archive.writestr(name, b"x" * 100)
+
+
+def make_tar(path: Path, names):
+    with tarfile.open(path, "w:gz") as archive:
+        for name in names:
+            info = tarfile.TarInfo(name)
+            info.size = 3
+            archive.addfile(info, io.BytesIO(b"abc"))
+
+
+def test_read_contents_lists_members_by_extension(temp_dir):
+    make_zip(temp_dir / "photos.zip", ["trip/a.JPG", "trip/b.jpg", "trip/", "notes.txt", "__MACOSX/._a.JPG"])
+    make_tar(temp_dir / "backup.tar.gz", ["docs/a.pdf", "docs/b.pdf"])
+    with gzip.open(temp_dir / "dump.sql.gz", "wb") as f:
+        f.write(b"select 1;")
+
+    assert read_contents(temp_dir / "photos.zip") == {".jpg": 2, ".txt": 1}
+    assert read_contents(temp_dir / "backup.tar.gz") == {".pdf": 2}
+    assert read_contents(temp_dir / "dump.sql.gz") == {".sql": 1}
+    assert read_contents(temp_dir / "notes.txt") is None
+
+
+def test_damaged_archives_are_unknown(temp_dir):
+    (temp_dir / "broken.zip").write_bytes(b"PK\x05\x06" + b"\xff" * 18)
+    (temp_dir / "broken.tar").write_bytes(b"not a tarball")
+
+    assert read_contents(temp_dir / "broken.zip") == {}
+    assert read_contents(temp_dir / "broken.tar") == {}
+
+
+def test_index_opens_unchanged_archives_once(temp_dir, monkeypatch):
+    archive = temp_dir / "photos.zip"
+    make_zip(archive, ["a.jpg"])
+    opened = []
+    real_read_contents = archive_contents.read_contents
+    monkeypatch.setattr(archive_contents, "read_contents", lambda path: opened.append(path) or real_read_contents(path))
+
+    index = ArchiveIndex(cache_path=temp_dir / "cache.json")
+    for _ in range(3):
+        assert index.share(archive, archive.stat(), {".jpg"}) == 1.0
+    index.save()
+    assert ArchiveIndex(cache_path=temp_dir / "cache.json").share(archive, archive.stat(), {".jpg"}) == 1.0
+    assert len(opened) == 1
+
+    make_zip(archive, ["a.jpg", "b.txt", "c.txt"])
+    assert index.share(archive, archive.stat(), {".jpg"}) == pytest.approx(1 / 3)
+    assert len(opened) == 2
+
+
+def test_archives_are_routed_by_contents(temp_dir):
+    make_zip(temp_dir / "photos.zip", ["a.jpg", "b.png", "c.jpg", "d.jpg", "e.txt"])
+    make_zip(temp_dir / "mixed.zip", ["a.jpg", "b.txt"])
+    config = Config(
+        target_directories=[str(temp_dir)],
+        rules=[
+            Rule(name="Archives", extensions=[".zip"], destination=str(temp_dir / "Archives")),
+            Rule(
+                name="Photo archives", extensions=[".zip"], priority=10,
+                archive_contents=[".jpg", ".png"], destination=str(temp_dir / "Images"),
+            ),
+        ],
+    )
+
+    actions = RuleEngine(config=config).process_directories()
+
+    assert sorted((m.source.name, m.rule) for m in actions) == [
+        ("mixed.zip", "Archives"), ("photos.zip", "Photo archives"),
+    ]
+
+
+def test_cache_holds_only_archives_that_still_exist(temp_dir):
+    for number in range(5):
+        (temp_dir / f"notes{number}.txt").write_text("text")
+    make_zip(temp_dir / "kept.zip", ["a.jpg"])
+    make_zip(temp_dir / "deleted.zip", ["a.jpg"])
+    cache_path = temp_dir / "cache.json"
+
+    index = ArchiveIndex(cache_path=cache_path)
+    for path in temp_dir.iterdir():
+        index.share(path, path.stat(), {".jpg"})
+    index.save()
+    assert len(json.loads(cache_path.read_text())) == 2
+
+    (temp_dir / "deleted.zip").unlink()
+    index = ArchiveIndex(cache_path=cache_path)
+    index.share(temp_dir / "kept.zip", (temp_dir / "kept.zip").stat(), {".jpg"})
+    index.save()
+    assert [entry[3] for entry in json.loads(cache_path.read_text()).values()] == [str(temp_dir / "kept.zip")]
@@ -0,0 +1,97 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src.budget import CursorStore, RunBudget
+from src.config import Config, Rule
+from src.engine import RuleEngine
+from src.processor import FileProcessor
+from src.reporting import Reporter
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+@pytest.fixture
+def target(temp_dir):
+    target = temp_dir / "inbox"
+    (target / "sub").mkdir(parents=True)
+    for name in ("a.txt", "b.txt", "c.txt", "sub/d.txt"):
+        (target / name).write_text(name)
+    return target
+
+
+def make_config(temp_dir: Path, target: Path) -> Config:
+    return Config(
+        target_directories=[str(target)],
+        rules=[Rule(name="Docs", extensions=[".txt"], destination=str(temp_dir / "Docs"))],
+    )
+
+
+def scanned(actions) -> list:
+    return sorted(action[0].name for action in actions)
+
+
+def test_file_limit_stops_and_resumes(temp_dir, target):
+    cfg = make_config(temp_dir, target)
+
+    budget = RunBudget(max_files=2)
+    actions = RuleEngine(cfg, budget=budget).process_directories()
+    assert scanned(actions) == ["a.txt", "b.txt"]
+    assert budget.stopped == "file limit of 2 reached"
+    assert budget.stop_at == (str(target), ("c.txt",))
+
+    store = CursorStore(temp_dir / "cursor.json")
+    store.save(budget.stop_at)
+    budget = RunBudget(max_files=2, resume_from=store.load())
+    actions = RuleEngine(cfg, budget=budget).process_directories()
+    assert scanned(actions) == ["c.txt", "d.txt"]
+    assert budget.stop_at is None
+
+    store.save(budget.stop_at)
+    assert not store.path.exists()
+
+
+def test_time_limit_stops_before_the_first_file(temp_dir, target):
+    budget = RunBudget(max_seconds=0)
+    actions = RuleEngine(make_config(temp_dir, target), budget=budget).process_directories()
+    assert actions == []
+    assert budget.stop_at == (str(target), ("a.txt",))
+
+
+def test_depth_limit(temp_dir, target):
+    budget = RunBudget(max_depth=0)
+    actions = RuleEngine(make_config(temp_dir, target), budget=budget).process_directories()
+    assert scanned(actions) == ["a.txt", "b.txt", "c.txt"]
+    assert budget.stop_at is None
+
+
+def test_processor_leaves_unstarted_moves_when_out_of_time(temp_dir, target):
+    engine = RuleEngine(make_config(temp_dir, target))
+    actions = engine.process_directories()
+
+    processor = FileProcessor(rename_format="{original_filename}")
+    processor.manifest_path = temp_dir / "_fylum_index.md"
+    processor.json_manifest_path = temp_dir / "_fylum_index.json"
+    assert processor.process_actions(actions, RunBudget(max_seconds=0)) == 0
+    assert sorted(processor.unfinished) == sorted(action[0] for action in actions)
+    assert all(action[0].exists() for action in actions)
+    assert engine.cursor_for(target / "sub" / "d.txt") == (str(target), ("sub", "d.txt"))
+
+
+def test_processor_lists_failed_moves(temp_dir, target):
+    actions = RuleEngine(make_config(temp_dir, target)).process_directories()
+    # A file where the destination folder should be makes every move fail.
+    (temp_dir / "Docs").write_text("in the way")
+
+    processor = FileProcessor(rename_format="{original_filename}", reporter=Reporter())
+    processor.manifest_path = temp_dir / "_fylum_index.md"
+    processor.json_manifest_path = temp_dir / "_fylum_index.json"
+    assert processor.process_actions(actions) == 0
+    assert sorted(processor.failed) == sorted(action[0] for action in actions)
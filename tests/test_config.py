@@ -62,3 +62,33 @@ def test_load_config_exits_on_invalid_file(capsys):
     captured = capsys.readouterr()
     assert "Error loading or parsing configuration" in captured.out
 
+
+def test_load_config_exits_on_invalid_name_pattern(capsys):
+    """Tests that an invalid name_pattern regex is rejected when the config is loaded."""
+    invalid_config = {"rules": [{"name": "Bad", "name_pattern": "(", "destination": "~/x"}]}
+    with open(CONFIG_FILE_PATH, "w") as f:
+        yaml.dump(invalid_config, f)
+
+    with pytest.raises(SystemExit):
+        load_config()
+
+    captured = capsys.readouterr()
+    assert "invalid regular expression" in captured.out
+
+
+def test_load_config_exits_on_zstd_without_zstandard(capsys, monkeypatch):
+    """Tests that zstd compression is rejected up front when zstandard is not installed."""
+    import importlib.util
+    real_find_spec = importlib.util.find_spec
+    monkeypatch.setattr(
+        importlib.util, "find_spec",
+        lambda name, *args: None if name == "zstandard" else real_find_spec(name, *args),
+    )
+    with open(CONFIG_FILE_PATH, "w") as f:
+        yaml.dump({"manifest_rotation": {"compression": "zstd"}}, f)
+
+    with pytest.raises(SystemExit):
+        load_config()
+
+    captured = capsys.readouterr()
+    assert "pip install fylum[zstd]" in captured.out
@@ -1,9 +1,10 @@
 
 import os
+import time
 from pathlib import Path
 import pytest
 from src.config import Config, Rule
-from src.engine import RuleEngine
+from src.engine import CompiledRules, RuleEngine
 
 @pytest.fixture
 def create_test_files(tmp_path: Path):
@@ -52,6 +53,7 @@ def test_engine_identifies_actions(test_config: Config, create_test_files):
     assert source_path.name == "image1.jpg"
     assert dest_path.name == "image1.jpg"
     assert dest_path.parent.name == "Images"
+    assert actions_dict["image1.jpg"].rule == "Images"
 
     # Check document1.txt
     assert "document1.txt" in actions_dict
@@ -63,3 +65,105 @@ def test_engine_identifies_actions(test_config: Config, create_test_files):
     assert "unmatched.pdf" not in actions_dict
     assert "ignored.txt" not in actions_dict
 
+
+
+def test_rule_predicates_and_priority(tmp_path: Path):
+    """Tests size, age, name and path conditions, and that priority decides between rules."""
+    downloads = tmp_path / "Downloads"
+    (downloads / "invoices").mkdir(parents=True)
+    (downloads / "big.iso").write_bytes(b"x" * 2048)
+    (downloads / "small.iso").write_bytes(b"x" * 10)
+    (downloads / "invoices" / "march.pdf").write_text("pdf")
+    (downloads / "scan_001.pdf").write_text("pdf")
+    (downloads / "report.pdf").write_text("pdf")
+    old_file = downloads / "old.log"
+    old_file.write_text("log")
+    month_ago = time.time() - 30 * 86400
+    os.utime(old_file, (month_ago, month_ago))
+    (downloads / "new.log").write_text("log")
+
+    config = Config(
+        target_directories=[str(downloads)],
+        rules=[
+            Rule(name="Docs", extensions=[".pdf"], destination=str(tmp_path / "Docs")),
+            Rule(name="Invoices", extensions=[".pdf"], path_prefix=str(downloads / "invoices"),
+                 priority=10, destination=str(tmp_path / "Invoices")),
+            Rule(name="Scans", name_pattern=r"^scan_\d+", priority=5, destination=str(tmp_path / "Scans")),
+            Rule(name="BigFiles", min_size=1024, destination=str(tmp_path / "Big")),
+            Rule(name="OldLogs", extensions=[".log"], older_than_days=7, destination=str(tmp_path / "Logs")),
+        ],
+    )
+
+    actions = RuleEngine(config=config).process_directories()
+    rules = {action.source.name: action.rule for action in actions}
+
+    assert rules == {
+        "big.iso": "BigFiles",
+        "march.pdf": "Invoices",
+        "scan_001.pdf": "Scans",
+        "report.pdf": "Docs",
+        "old.log": "OldLogs",
+    }
+    assert all(action.stat is not None for action in actions)
+
+
+def test_compiled_rules_only_consider_candidates_for_extension():
+    """Tests that the decision table narrows each extension to its candidate rules."""
+    rules = [Rule(name=f"Ext{i}", extensions=[f".e{i}"], destination="/tmp/x") for i in range(200)]
+    rules.append(Rule(name="CatchAll", destination="/tmp/y", priority=-1))
+
+    compiled = CompiledRules(rules)
+
+    assert [rule.name for rule in compiled.candidates(Path("a.E7"))] == ["Ext7", "CatchAll"]
+    assert [rule.name for rule in compiled.candidates(Path("a.unknown"))] == ["CatchAll"]
+
+
+def test_compiled_rules_match_multi_part_extensions():
+    rules = [
+        Rule(name="Tarballs", extensions=[".TAR.GZ"], destination="/tmp/x", priority=1),
+        Rule(name="Gzip", extensions=[".gz"], destination="/tmp/y"),
+    ]
+
+    compiled = CompiledRules(rules)
+
+    assert [rule.name for rule in compiled.candidates(Path("pics.tar.gz"))] == ["Tarballs", "Gzip"]
+    assert [rule.name for rule in compiled.candidates(Path("notes.txt.gz"))] == ["Gzip"]
+    assert [rule.name for rule in compiled.candidates(Path("pics.tar"))] == []
+
+def test_per_target_and_directory_overrides(tmp_path: Path):
+    """Tests target overrides, `.fylum.yaml` files and scope reuse."""
+    downloads = tmp_path / "Downloads"
+    photos = downloads / "photos"
+    raw = photos / "raw"
+    raw.mkdir(parents=True)
+    desktop = tmp_path / "Desktop"
+    desktop.mkdir()
+    for path in (downloads / "a.txt", photos / "b.jpg", raw / "c.jpg", raw / "d.txt", desktop / "e.txt", desktop / "f.log"):
+        path.touch()
+    (photos / ".fylum.yaml").write_text(
+        "rules:\n"
+        f"  - {{name: Photos, extensions: ['.jpg'], destination: '{tmp_path / 'Photos'}'}}\n"
+    )
+    (raw / ".fylum.yaml").write_text("inherit_rules: false\nignore_patterns: ['*.txt']\n")
+
+    config = Config(
+        target_directories=[
+            str(downloads),
+            {"path": str(desktop), "ignore_patterns": ["*.log"],
+             "rules": [{"name": "Logs", "extensions": [".log"], "destination": str(tmp_path / "Logs")}]},
+        ],
+        rules=[
+            Rule(name="Images", extensions=[".jpg"], destination=str(tmp_path / "Images")),
+            Rule(name="Docs", extensions=[".txt"], destination=str(tmp_path / "Docs")),
+        ],
+    )
+    engine = RuleEngine(config=config)
+    actions = {match.source.name: match.rule for match in engine.process_directories()}
+
+    assert actions == {"a.txt": "Docs", "b.jpg": "Photos", "e.txt": "Docs"}
+
+    # Scopes are compiled once and reused until a `.fylum.yaml` changes.
+    target = config.targets()[0]
+    scope = engine.inherited_scope(raw, target)
+    assert engine.inherited_scope(raw, target) is scope
+    assert [rule.name for rule in scope.compiled_rules.rules] == ["Photos", "Images", "Docs"]
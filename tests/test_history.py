@@ -0,0 +1,236 @@
+import json
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from src.engine import FileMatch
+from src.history import HistoryStore
+from src.processor import FileProcessor
+from src.reporting import Reporter
+from src.undo import UndoManager
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+@pytest.fixture
+def history(temp_dir):
+    store = HistoryStore(temp_dir / "history.db")
+    yield store
+    store.close()
+
+
+def test_record_and_get_run(history):
+    run_id = history.record_run([(Path("/a/one.txt"), Path("/b/one.txt"), None)])
+
+    run = history.get_run(run_id)
+
+    assert run["run_id"] == run_id
+    assert run["actions"] == [{"source": "/a/one.txt", "destination": "/b/one.txt", "rule": None, "hash": None, "mode": None}]
+    assert history.get_run(run_id + 1) is None
+
+
+def test_get_last_run(history):
+    assert history.get_last_run() is None
+
+    history.record_run([(Path("/a/one.txt"), Path("/b/one.txt"), None)])
+    last_id = history.record_run([(Path("/a/two.txt"), Path("/b/two.txt"), None)])
+
+    assert history.get_last_run()["run_id"] == last_id
+
+
+def test_find_by_source_or_destination(history):
+    first = history.record_run([(Path("/a/one.txt"), Path("/b/one.txt"), None)])
+    second = history.record_run([(Path("/b/one.txt"), Path("/c/one.txt"), None)])
+
+    assert [m["run_id"] for m in history.find("/a/one.txt")] == [first]
+    assert [m["run_id"] for m in history.find("/b/one.txt")] == [first, second]
+    assert history.find("/nowhere.txt") == []
+
+
+def test_delete_run_removes_actions(history):
+    run_id = history.record_run([(Path("/a/one.txt"), Path("/b/one.txt"), None)])
+
+    history.delete_run(run_id)
+
+    assert history.get_run(run_id) is None
+    assert history.find("/a/one.txt") == []
+
+
+def test_import_json_manifest(history, temp_dir):
+    manifest = temp_dir / "_fylum_index.json"
+    manifest.write_text(json.dumps([
+        {"timestamp": "2024-03-15T14:30:22", "actions": [{"source": "/a/x.jpg", "destination": "/b/x.jpg"}]},
+        {"timestamp": "2024-03-16T09:00:00", "actions": [{"source": "/a/y.jpg", "destination": "/b/y.jpg"}]},
+    ]))
+
+    assert history.import_json_manifest(manifest) == 2
+    assert history.get_last_run()["actions"][0]["source"] == "/a/y.jpg"
+
+
+def test_legacy_manifest_is_imported_whichever_command_creates_the_store(temp_dir):
+    legacy = temp_dir / "_fylum_index.json"
+    legacy.write_text(json.dumps([
+        {"timestamp": "2024-03-15T14:30:22", "actions": [{"source": "/a/x.jpg", "destination": "/b/x.jpg"}]},
+    ]))
+    source_file = temp_dir / "source.txt"
+    source_file.write_text("test")
+
+    # The first command after an upgrade is a clean, not an undo.
+    history = HistoryStore(temp_dir / "history.db", legacy_manifest=legacy)
+    processor = FileProcessor(rename_format="{original_filename}", history=history)
+    processor.manifest_path = temp_dir / "index.md"
+    processor.json_manifest_path = temp_dir / "index.json"
+    processor.process_actions([(source_file, temp_dir / "destination" / "source.txt")])
+    history.close()
+
+    reopened = HistoryStore(temp_dir / "history.db", legacy_manifest=legacy)
+    assert [match["source"] for match in reopened.find("/b/x.jpg")] == ["/a/x.jpg"]
+    assert len(reopened.select_actions()) == 2
+    reopened.close()
+
+
+def test_processor_records_run_in_history(history, temp_dir):
+    source_file = temp_dir / "source.txt"
+    source_file.write_text("test")
+
+    processor = FileProcessor(rename_format="{original_filename}", history=history)
+    processor.process_actions([(source_file, temp_dir / "destination" / "source.txt")])
+
+    assert len(history.find(str(source_file))) == 1
+
+    Path("_fylum_index.md").unlink(missing_ok=True)
+    Path("_fylum_index.json").unlink(missing_ok=True)
+
+
+def test_undo_reads_from_history(history, temp_dir):
+    source_file = temp_dir / "source.txt"
+    source_file.write_text("test")
+
+    processor = FileProcessor(rename_format="{original_filename}", history=history)
+    processor.process_actions([(source_file, temp_dir / "destination" / "source.txt")])
+
+    reverted = UndoManager(history=history).revert_last_run()
+
+    assert reverted == 1
+    assert source_file.exists()
+    assert history.get_last_run() is None
+
+    Path("_fylum_index.md").unlink(missing_ok=True)
+    Path("_fylum_index.json").unlink(missing_ok=True)
+
+
+def test_select_actions_filters(history):
+    history.record_run([
+        (Path("/dl/a.jpg"), Path("/pics/a.jpg"), "Images"),
+        (Path("/dl/b.txt"), Path("/docs/b.txt"), "Documents"),
+    ], datetime(2024, 1, 1))
+    second = history.record_run([
+        (Path("/dl/sub/c.jpg"), Path("/pics/c.jpg"), "Images"),
+        (Path("/dlx/d.jpg"), Path("/pics/d.jpg"), "Images"),
+    ], datetime(2024, 2, 1))
+
+    def sources(**filters):
+        return [action["source"] for action in history.select_actions(**filters)]
+
+    assert sources(run_id=second) == ["/dl/sub/c.jpg", "/dlx/d.jpg"]
+    assert sources(since=datetime(2024, 1, 15)) == ["/dl/sub/c.jpg", "/dlx/d.jpg"]
+    assert sources(rule="Documents") == ["/dl/b.txt"]
+    assert sources(path_prefix="/dl/") == ["/dl/a.jpg", "/dl/b.txt", "/dl/sub/c.jpg"]
+    assert sources(path_prefix="/docs") == ["/dl/b.txt"]
+    # Matched on whole components, so `/dl` does not take in `/dlx`.
+    assert sources(path_prefix="/dl") == ["/dl/a.jpg", "/dl/b.txt", "/dl/sub/c.jpg"]
+    assert sources(path_prefix="/d") == []
+    assert sources(path_prefix="/dlx/d.jpg") == ["/dlx/d.jpg"]
+    assert sources(rule="Images", path_prefix="/dl/") == ["/dl/a.jpg", "/dl/sub/c.jpg"]
+
+
+def test_delete_actions_drops_emptied_runs(history):
+    first = history.record_run([(Path("/a/one.txt"), Path("/b/one.txt"), None)])
+    second = history.record_run([
+        (Path("/a/two.txt"), Path("/b/two.txt"), None),
+        (Path("/a/three.txt"), Path("/b/three.txt"), None),
+    ])
+
+    history.delete_actions(action["id"] for action in history.select_actions(path_prefix="/a/two.txt"))
+    history.delete_actions(action["id"] for action in history.select_actions(run_id=first))
+
+    assert history.get_run(first) is None
+    assert [a["source"] for a in history.get_run(second)["actions"]] == ["/a/three.txt"]
+
+
+def test_selective_undo_by_rule(history, temp_dir):
+    downloads = temp_dir / "Downloads"
+    downloads.mkdir()
+    (downloads / "photo.jpg").write_text("image")
+    (downloads / "notes.txt").write_text("text")
+
+    processor = FileProcessor(rename_format="{original_filename}", history=history)
+    processor.process_actions([
+        FileMatch(downloads / "photo.jpg", temp_dir / "Pictures" / "photo.jpg", "Images"),
+        FileMatch(downloads / "notes.txt", temp_dir / "Documents" / "notes.txt", "Documents"),
+    ])
+
+    reverted = UndoManager(history=history).revert(rule="Images")
+
+    assert reverted == 1
+    assert (downloads / "photo.jpg").exists()
+    assert (temp_dir / "Documents" / "notes.txt").exists()
+    assert [a["rule"] for a in history.get_last_run()["actions"]] == ["Documents"]
+
+    Path("_fylum_index.md").unlink(missing_ok=True)
+    Path("_fylum_index.json").unlink(missing_ok=True)
+
+
+def test_undo_older_run_by_id(history, temp_dir):
+    downloads = temp_dir / "Downloads"
+    downloads.mkdir()
+    (downloads / "first.txt").write_text("1")
+    (downloads / "second.txt").write_text("2")
+
+    FileProcessor(rename_format="{original_filename}", history=history).process_actions(
+        [(downloads / "first.txt", temp_dir / "Docs" / "first.txt")]
+    )
+    first_run = history.get_last_run()["run_id"]
+    FileProcessor(rename_format="{original_filename}", history=history).process_actions(
+        [(downloads / "second.txt", temp_dir / "Docs" / "second.txt")]
+    )
+
+    reverted = UndoManager(history=history).revert(run_id=first_run)
+
+    assert reverted == 1
+    assert (downloads / "first.txt").exists()
+    assert (temp_dir / "Docs" / "second.txt").exists()
+    assert history.get_run(first_run) is None
+
+    Path("_fylum_index.md").unlink(missing_ok=True)
+    Path("_fylum_index.json").unlink(missing_ok=True)
+
+
+def test_undo_of_pending_moves_checks_the_disk(history, temp_dir):
+    moved, never_moved = temp_dir / "moved.txt", temp_dir / "never_moved.txt"
+    never_moved.write_text("still here")
+    (temp_dir / "Docs").mkdir()
+    (temp_dir / "Docs" / "moved.txt").write_text("moved")
+    # A run killed after journaling both moves but making only the first.
+    history.begin_actions(None, [
+        (moved, temp_dir / "Docs" / "moved.txt", "Docs"),
+        (never_moved, temp_dir / "Docs" / "never_moved.txt", "Docs"),
+    ])
+
+    warnings = []
+    reporter = Reporter()
+    reporter.warning = warnings.append
+    assert UndoManager(history=history, reporter=reporter).revert_last_run() == 1
+
+    assert moved.read_text() == "moved"
+    assert never_moved.read_text() == "still here"
+    assert warnings == []
+    assert history.get_last_run() is None
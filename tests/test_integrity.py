@@ -0,0 +1,114 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src import integrity
+from src.history import HistoryStore
+from src.integrity import VerificationError, copy_and_hash, hash_file, verified_move
+from src.processor import FileProcessor
+from src.undo import UndoManager
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+@pytest.fixture
+def cross_device(monkeypatch):
+    monkeypatch.setattr(integrity, "_same_device", lambda source, directory: False)
+
+
+def expected_digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=32).hexdigest()
+
+
+def test_hash_file_matches_hashlib(temp_dir):
+    data = os.urandom(3 * integrity.COPY_BUFFER_SIZE + 17)
+    (temp_dir / "big.bin").write_bytes(data)
+    (temp_dir / "empty.bin").write_bytes(b"")
+
+    assert hash_file(temp_dir / "big.bin") == expected_digest(data)
+    assert hash_file(temp_dir / "empty.bin") == expected_digest(b"")
+
+
+def test_copy_and_hash_copies_in_one_pass(temp_dir):
+    data = os.urandom(integrity.COPY_BUFFER_SIZE + 5)
+    source = temp_dir / "source.bin"
+    source.write_bytes(data)
+    os.utime(source, (1_000_000, 1_000_000))
+
+    digest = copy_and_hash(source, temp_dir / "copy.bin")
+
+    assert digest == expected_digest(data)
+    assert (temp_dir / "copy.bin").read_bytes() == data
+    assert (temp_dir / "copy.bin").stat().st_mtime == 1_000_000
+
+
+def test_cross_device_move_is_verified(temp_dir, cross_device):
+    source = temp_dir / "source.txt"
+    source.write_text("payload")
+
+    digest = verified_move(source, temp_dir / "moved.txt")
+
+    assert digest == expected_digest(b"payload")
+    assert not source.exists()
+    assert (temp_dir / "moved.txt").read_text() == "payload"
+
+
+def test_corrupt_copy_keeps_the_source(temp_dir, cross_device, monkeypatch):
+    source = temp_dir / "source.txt"
+    source.write_text("payload")
+    monkeypatch.setattr(integrity, "hash_file", lambda path: "corrupt")
+
+    with pytest.raises(VerificationError):
+        verified_move(source, temp_dir / "moved.txt")
+
+    assert source.read_text() == "payload"
+    assert not (temp_dir / "moved.txt").exists()
+
+
+def test_undo_restores_only_unchanged_files(temp_dir):
+    history = HistoryStore(temp_dir / "history.db")
+    for name in ("kept.txt", "edited.txt"):
+        (temp_dir / name).write_text(name)
+    processor = FileProcessor(rename_format="{original_filename}", history=history, verify=True)
+    processor.manifest_path = temp_dir / "_fylum_index.md"
+    processor.json_manifest_path = temp_dir / "_fylum_index.json"
+    processor.process_actions([
+        (temp_dir / name, temp_dir / "out" / name) for name in ("kept.txt", "edited.txt")
+    ])
+    assert all(action["hash"] for action in history.get_last_run()["actions"])
+
+    (temp_dir / "out" / "edited.txt").write_text("changed after the move")
+    reverted = UndoManager(history=history).revert_last_run()
+
+    assert reverted == 1
+    assert (temp_dir / "kept.txt").exists()
+    assert not (temp_dir / "edited.txt").exists()
+    # The skipped move stays in the history so it can be dealt with later.
+    assert [a["source"] for a in history.get_last_run()["actions"]] == [str(temp_dir / "edited.txt")]
+
+
+def test_renames_are_hashed_outside_the_lock(temp_dir, monkeypatch):
+    from src import processor as processor_module
+
+    history = HistoryStore(temp_dir / "history.db")
+    (temp_dir / "big.bin").write_bytes(b"payload")
+    processor = FileProcessor(rename_format="{original_filename}", history=history, verify=True)
+    processor.manifest_path = temp_dir / "_fylum_index.md"
+    processor.json_manifest_path = temp_dir / "_fylum_index.json"
+
+    def unlocked_hash(path):
+        assert not processor._lock.locked()
+        return hash_file(path)
+
+    monkeypatch.setattr(processor_module, "hash_file", unlocked_hash)
+    assert processor.process_actions([(temp_dir / "big.bin", temp_dir / "out" / "big.bin")]) == 1
+    assert history.get_last_run()["actions"][0]["hash"] == expected_digest(b"payload")
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src.history import HistoryStore
+from src.linking import LinkMode, create_link
+from src.processor import FileProcessor
+from src.reporting import Reporter
+from src.undo import UndoManager
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+def link_run(temp_dir: Path, history: HistoryStore, mode: LinkMode) -> int:
+    processor = FileProcessor(
+        rename_format="{original_filename}", history=history, reporter=Reporter(), link_mode=mode
+    )
+    processor.manifest_path = temp_dir / "index.md"
+    processor.json_manifest_path = temp_dir / "index.json"
+    source = temp_dir / "movie.mkv"
+    return processor.process_actions([(source, temp_dir / "Videos" / "movie.mkv")])
+
+
+@pytest.mark.parametrize("mode", [LinkMode.hardlink, LinkMode.symlink])
+def test_links_leave_the_source_and_undo_removes_only_the_link(temp_dir, mode):
+    history = HistoryStore(temp_dir / "history.db")
+    source = temp_dir / "movie.mkv"
+    source.write_text("frames")
+
+    assert link_run(temp_dir, history, mode) == 1
+    link = temp_dir / "Videos" / "movie.mkv"
+    assert source.read_text() == "frames"
+    assert link.read_text() == "frames"
+    assert link.is_symlink() == (mode == LinkMode.symlink)
+    assert history.get_last_run()["actions"][0]["mode"] == mode.value
+
+    # The source is still in the target, but is not linked a second time.
+    assert link_run(temp_dir, history, mode) == 0
+    assert sorted(os.listdir(temp_dir / "Videos")) == ["movie.mkv"]
+
+    assert UndoManager(history=history, reporter=Reporter()).revert_last_run() == 1
+    assert not os.path.lexists(link)
+    assert source.read_text() == "frames"
+
+
+def test_undo_keeps_a_replaced_link(temp_dir):
+    history = HistoryStore(temp_dir / "history.db")
+    (temp_dir / "movie.mkv").write_text("frames")
+    link_run(temp_dir, history, LinkMode.symlink)
+    link = temp_dir / "Videos" / "movie.mkv"
+    link.unlink()
+    link.write_text("someone's own file")
+
+    assert UndoManager(history=history, reporter=Reporter()).revert_last_run() == 0
+    assert link.read_text() == "someone's own file"
+
+
+def test_failed_reflink_leaves_nothing_behind(temp_dir):
+    source = temp_dir / "movie.mkv"
+    source.write_text("frames")
+    try:
+        create_link(source, temp_dir / "clone.mkv", LinkMode.reflink)
+    except OSError:
+        # tmpfs and ext4 have no reflinks.
+        assert not (temp_dir / "clone.mkv").exists()
+    else:
+        assert (temp_dir / "clone.mkv").read_text() == "frames"
@@ -0,0 +1,90 @@
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src.config import Config, Rule
+from src.engine import RuleEngine
+from src.history import HistoryStore
+from src.locking import LEASE_FILE_NAME, TargetLeases
+from src.manifest import ManifestWriter
+from src.processor import FileAction
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+def make_writer(temp_dir: Path, history: HistoryStore) -> ManifestWriter:
+    return ManifestWriter(
+        md_path=temp_dir / "index.md", json_path=temp_dir / "index.json", history=history, batch_size=1
+    )
+
+
+def test_interleaved_runs_keep_every_move(temp_dir):
+    history = HistoryStore(temp_dir / "history.db")
+    first, second = make_writer(temp_dir, history), make_writer(temp_dir, history)
+
+    first.add(FileAction(Path("/a/1"), Path("/b/1"), "Docs"))
+    second.add(FileAction(Path("/a/2"), Path("/b/2"), "Docs"))
+    first.add(FileAction(Path("/a/3"), Path("/b/3"), "Docs"))
+    first_id, second_id = first.run_id, second.run_id
+    first.close()
+    second.close()
+
+    with open(temp_dir / "index.json", encoding="utf-8") as f:
+        entries = json.load(f)
+    moves = [(entry["run_id"], action["source"]) for entry in entries for action in entry["actions"]]
+    assert sorted(moves) == [(first_id, "/a/1"), (first_id, "/a/3"), (second_id, "/a/2")]
+    assert [entry["run_id"] for entry in entries] == [first_id, second_id, first_id]
+    assert "(continued)" in (temp_dir / "index.md").read_text()
+    history.close()
+
+
+def test_target_leases_are_exclusive(temp_dir):
+    with TargetLeases() as ours:
+        assert ours.acquire(temp_dir)
+        with TargetLeases() as theirs:
+            assert not theirs.acquire(temp_dir)
+    with TargetLeases() as theirs:
+        assert theirs.acquire(temp_dir)
+
+
+def test_lease_file_is_never_moved(temp_dir):
+    (temp_dir / LEASE_FILE_NAME).touch()
+    (temp_dir / "notes.lock").touch()
+    config = Config(
+        target_directories=[str(temp_dir)],
+        rules=[Rule(name="Locks", extensions=[".lock"], destination=str(temp_dir / "Locks"))],
+    )
+
+    actions = RuleEngine(config=config).process_directories()
+
+    assert [match.source.name for match in actions] == ["notes.lock"]
+
+
+def test_only_the_target_lease_file_is_skipped(temp_dir):
+    (temp_dir / "project").mkdir()
+    (temp_dir / "project" / LEASE_FILE_NAME).touch()
+    config = Config(
+        target_directories=[str(temp_dir)],
+        rules=[Rule(name="Locks", extensions=[".lock"], destination=str(temp_dir / "Locks"))],
+    )
+
+    with TargetLeases() as leases:
+        assert leases.acquire(temp_dir)
+        actions = RuleEngine(config=config).process_directories()
+    assert [match.source for match in actions] == [temp_dir / "project" / LEASE_FILE_NAME]
+    assert not (temp_dir / LEASE_FILE_NAME).exists()
+
+
+def test_lease_file_errors_are_raised(temp_dir):
+    with TargetLeases() as leases:
+        with pytest.raises(OSError):
+            leases.acquire(temp_dir / "missing")
+        assert leases.held == []
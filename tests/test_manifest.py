@@ -0,0 +1,119 @@
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src.history import HistoryStore
+from src.manifest import ManifestWriter
+from src.processor import FileAction
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+@pytest.fixture
+def writer_factory(temp_dir):
+    history = HistoryStore(temp_dir / "history.db")
+
+    def factory(**kwargs):
+        return ManifestWriter(
+            md_path=temp_dir / "index.md",
+            json_path=temp_dir / "index.json",
+            history=history,
+            **kwargs,
+        )
+
+    yield factory
+    history.close()
+
+
+def make_action(i: int) -> FileAction:
+    return FileAction(Path(f"/src/file{i}.txt"), Path(f"/dst/file{i}.txt"), "Docs")
+
+
+def test_nothing_written_without_moves(writer_factory, temp_dir):
+    with writer_factory():
+        pass
+
+    assert not (temp_dir / "index.md").exists()
+    assert not (temp_dir / "index.json").exists()
+
+
+def test_batches_are_visible_before_close(writer_factory, temp_dir):
+    writer = writer_factory(batch_size=2, flush_interval=3600)
+
+    writer.add(make_action(0))
+    writer.add(make_action(1))
+    writer.add(make_action(2))
+
+    # The first batch is on disk and the JSON manifest is valid mid-run.
+    data = json.loads((temp_dir / "index.json").read_text())
+    assert [a["source"] for a in data[0]["actions"]] == ["/src/file0.txt", "/src/file1.txt"]
+    assert "| /src/file1.txt | /dst/file1.txt |" in (temp_dir / "index.md").read_text()
+    assert "/src/file2.txt" not in (temp_dir / "index.md").read_text()
+
+    writer.close()
+
+    data = json.loads((temp_dir / "index.json").read_text())
+    assert len(data[0]["actions"]) == 3
+    assert data[0]["run_id"] == writer.history.get_last_run()["run_id"]
+    assert len(writer.history.get_last_run()["actions"]) == 3
+
+
+def test_runs_are_appended_to_existing_manifest(writer_factory, temp_dir):
+    (temp_dir / "index.json").write_text(json.dumps(
+        [{"timestamp": "2024-03-15T14:30:22", "actions": []}], indent=2
+    ))
+
+    for i in range(2):
+        with writer_factory() as writer:
+            writer.add(make_action(i))
+
+    data = json.loads((temp_dir / "index.json").read_text())
+    assert len(data) == 3
+    assert data[2]["actions"][0]["source"] == "/src/file1.txt"
+    assert (temp_dir / "index.md").read_text().count("## Fylum Run") == 2
+
+
+def test_unreadable_manifest_is_started_afresh(writer_factory, temp_dir):
+    (temp_dir / "index.json").write_text("not json")
+
+    with writer_factory() as writer:
+        writer.add(make_action(0))
+
+    data = json.loads((temp_dir / "index.json").read_text())
+    assert len(data) == 1
+
+
+def test_moves_are_journaled_before_they_are_made(writer_factory, temp_dir):
+    writer = writer_factory(batch_size=100, flush_interval=3600)
+    history = writer.history
+    assert history.get_last_run() is None
+
+    first, discarded = writer.begin([make_action(0), make_action(1)])
+    # The run exists only together with its first moves, as pending actions.
+    assert [(a["source"], a["pending"]) for a in history.select_actions()] == \
+        [("/src/file0.txt", 1), ("/src/file1.txt", 1)]
+    assert history.get_last_run()["run_id"] == writer.run_id
+
+    writer.add(make_action(0), first)
+    writer.discard([discarded])
+    writer.close()
+
+    assert [(a["source"], a["pending"]) for a in history.select_actions()] == [("/src/file0.txt", None)]
+    assert len(json.loads((temp_dir / "index.json").read_text())[0]["actions"]) == 1
+
+
+def test_run_is_dropped_when_its_only_move_is_discarded(writer_factory, temp_dir):
+    writer = writer_factory()
+    writer.discard(writer.begin([make_action(0)]))
+    writer.close()
+
+    assert writer.history.get_last_run() is None
+    assert not (temp_dir / "index.json").exists()
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unicodedata
+from pathlib import Path
+
+import pytest
+
+from src.names import MAX_NAME_BYTES, DestinationNames, collision_key, fit_name, nfc
+from src.processor import FileProcessor
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+DECOMPOSED = unicodedata.normalize("NFD", "Résumé.pdf")
+
+
+def test_nfc_and_collision_keys():
+    assert nfc(DECOMPOSED) == "Résumé.pdf"
+    assert nfc("plain.txt") == "plain.txt"
+    assert collision_key(DECOMPOSED) == collision_key("RÉSUMÉ.PDF") == collision_key("résumé.pdf")
+    assert collision_key("a.txt") != collision_key("b.txt")
+
+
+def test_free_name_treats_case_and_normalization_variants_as_taken(temp_dir):
+    (temp_dir / "Photo.JPG").write_text("existing")
+    (temp_dir / DECOMPOSED).write_text("existing")
+    names = DestinationNames()
+
+    assert names.free_name(temp_dir, "photo.jpg") == temp_dir / "photo_1.jpg"
+    assert names.free_name(temp_dir, "résumé.pdf") == temp_dir / "résumé_1.pdf"
+    # Names placed earlier in the run are taken without touching the disk.
+    assert names.free_name(temp_dir, "photo.jpg") == temp_dir / "photo_2.jpg"
+    assert names.free_name(temp_dir / "missing", "new.txt") == temp_dir / "missing" / "new.txt"
+
+
+def test_free_name_rechecks_the_disk(temp_dir):
+    names = DestinationNames()
+    names.free_name(temp_dir, "first.txt")
+    # Created by someone else after the directory was listed.
+    (temp_dir / "late.txt").write_text("late")
+    assert names.free_name(temp_dir, "late.txt") == temp_dir / "late_1.txt"
+
+
+def test_long_names_are_shortened_to_fit():
+    name = fit_name("é" * 200, "_3.txt")
+    assert len(os.fsencode(name)) <= MAX_NAME_BYTES
+    assert name.endswith("_3.txt") and name.startswith("é")
+    assert fit_name("short", ".txt") == "short.txt"
+
+
+def test_processor_writes_composed_names(temp_dir):
+    source = temp_dir / DECOMPOSED
+    source.write_text("cv")
+    (temp_dir / "out").mkdir()
+    (temp_dir / "out" / "résumé.pdf").write_text("older")
+
+    processor = FileProcessor(rename_format="{original_filename}")
+    processor.manifest_path = temp_dir / "_fylum_index.md"
+    processor.json_manifest_path = temp_dir / "_fylum_index.json"
+    processor.process_actions([(source, temp_dir / "out" / source.name)])
+
+    assert sorted(os.listdir(temp_dir / "out")) == ["Résumé_1.pdf", "résumé.pdf"]
+    assert (temp_dir / "out" / "Résumé_1.pdf").read_text() == "cv"
@@ -0,0 +1,92 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src.config import Config, Rule
+from src.engine import RuleEngine
+from src.history import HistoryStore
+from src.parallel import ParallelRuleEngine, shard_directories
+from src.processor import FileProcessor
+from src.reporting import Reporter
+
+
+@pytest.fixture
+def tree():
+    workspace = Path(tempfile.mkdtemp())
+    downloads = workspace / "Downloads"
+    for i in range(4):
+        for j in range(3):
+            directory = downloads / f"dir{i}" / f"sub{j}"
+            directory.mkdir(parents=True)
+            (directory / f"photo{i}{j}.jpg").write_text("image")
+            (directory / "notes.txt").write_text(f"notes {i} {j}")
+    (downloads / "top.jpg").write_text("image")
+    yield workspace
+    shutil.rmtree(workspace)
+
+
+@pytest.fixture
+def config(tree):
+    return Config(
+        target_directories=[str(tree / "Downloads")],
+        rename_format="{original_filename}",
+        rules=[
+            Rule(name="Images", extensions=[".jpg"], destination=str(tree / "Pictures")),
+            Rule(name="Docs", extensions=[".txt"], destination=str(tree / "Docs")),
+        ],
+    )
+
+
+def test_shards_cover_every_file_once(tree):
+    downloads = tree / "Downloads"
+    engine = RuleEngine(config=Config())
+
+    shards = shard_directories([downloads], min_shards=8)
+    scanned = [
+        path for directory, recursive, _ in shards
+        for path, _ in engine.scan(Path(directory), recursive=recursive)
+    ]
+
+    assert len(shards) >= 8
+    assert sorted(scanned) == sorted(path for path, _ in engine.scan(downloads))
+
+
+def test_parallel_matches_serial_classification(config):
+    serial = RuleEngine(config=config).process_directories()
+    parallel = ParallelRuleEngine(config=config, processes=2).process_directories()
+
+    assert sorted((a.source, a.destination, a.rule) for a in parallel) == \
+        sorted((a.source, a.destination, a.rule) for a in serial)
+    assert all(a.final_name == a.source.name for a in parallel)
+    assert all(a.stat.st_size == a.source.stat().st_size for a in parallel)
+
+
+def test_parallel_clean_resolves_collisions_in_one_manifest(config, tree):
+    history = HistoryStore(tree / "history.db")
+    actions = ParallelRuleEngine(config=config, processes=2).process_directories()
+
+    processed = FileProcessor(rename_format=config.rename_format, history=history).process_actions(actions)
+
+    assert processed == 25
+    docs = list((tree / "Docs").iterdir())
+    assert len(docs) == 12
+    assert len({path.read_text() for path in docs}) == 12
+    assert len(history.get_last_run()["actions"]) == 25
+    history.close()
+
+    Path("_fylum_index.md").unlink(missing_ok=True)
+    Path("_fylum_index.json").unlink(missing_ok=True)
+
+
+def test_worker_warnings_go_to_the_callers_reporter(config, tree):
+    (tree / "Downloads" / "dir1" / ".fylum.yaml").write_text("rules: [{name: Broken}]")
+    reporter = Reporter()
+    warnings = []
+    reporter.warning = warnings.append
+
+    ParallelRuleEngine(config=config, processes=2, reporter=reporter).process_directories()
+
+    assert len(warnings) == 1
+    assert "Ignoring invalid" in warnings[0]
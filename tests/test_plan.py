@@ -0,0 +1,83 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src.config import Config, Rule
+from src.engine import RuleEngine
+from src.history import HistoryStore
+from src.plan import read_plan, unchanged_actions, write_plan
+from src.processor import FileProcessor
+
+
+@pytest.fixture
+def workspace():
+    temp_path = Path(tempfile.mkdtemp())
+    downloads = temp_path / "Downloads"
+    downloads.mkdir()
+    (downloads / "photo.jpg").write_text("image")
+    (downloads / "notes.txt").write_text("notes")
+    (downloads / "gone.txt").write_text("gone")
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+@pytest.fixture
+def config(workspace):
+    return Config(
+        target_directories=[str(workspace / "Downloads")],
+        rename_format="{date:%Y}_{original_filename}",
+        rules=[
+            Rule(name="Images", extensions=[".jpg"], destination=str(workspace / "Pictures")),
+            Rule(name="Docs", extensions=[".txt"], destination=str(workspace / "Docs")),
+        ],
+    )
+
+
+def test_plan_round_trip(config, workspace):
+    actions = RuleEngine(config=config).process_directories()
+    plan_path = workspace / "out.plan"
+
+    write_plan(plan_path, actions, config.rename_format)
+    header, planned = read_plan(plan_path)
+    planned = list(planned)
+
+    assert header["rename_format"] == config.rename_format
+    assert header["actions"] == 3
+    assert [(a.source, a.destination, a.rule) for a in planned] == \
+        [(a.source, a.destination, a.rule) for a in actions]
+    assert [a.stat.st_mtime_ns for a in planned] == [a.stat.st_mtime_ns for a in actions]
+
+
+def test_apply_skips_changed_sources(config, workspace):
+    downloads = workspace / "Downloads"
+    plan_path = workspace / "out.plan"
+    write_plan(plan_path, RuleEngine(config=config).process_directories(), config.rename_format)
+
+    (downloads / "notes.txt").write_text("edited after planning")
+    (downloads / "gone.txt").unlink()
+
+    header, planned = read_plan(plan_path)
+    skipped = []
+    history = HistoryStore(workspace / "history.db")
+    processor = FileProcessor(rename_format=header["rename_format"], history=history)
+    processed = processor.process_actions(unchanged_actions(planned, skipped))
+    history.close()
+
+    assert processed == 1
+    assert sorted(action.source.name for action in skipped) == ["gone.txt", "notes.txt"]
+    assert not (downloads / "photo.jpg").exists()
+    assert len(list((workspace / "Pictures").iterdir())) == 1
+    assert (downloads / "notes.txt").exists()
+
+    Path("_fylum_index.md").unlink(missing_ok=True)
+    Path("_fylum_index.json").unlink(missing_ok=True)
+
+
+def test_read_plan_rejects_other_files(workspace):
+    not_a_plan = workspace / "notes.plan"
+    not_a_plan.write_text("hello\n")
+
+    with pytest.raises(ValueError):
+        read_plan(not_a_plan)
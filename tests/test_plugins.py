@@ -0,0 +1,157 @@
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from src.api import Fylum
+from src.config import Config, Plugin, Rule
+from src.engine import RuleEngine
+from src.history import HistoryStore
+from src.processor import FileProcessor
+from src.reporting import Reporter
+
+
+CALLS = []
+MOVED = []
+LOCK = threading.Lock()
+
+
+def route_by_name(records, options):
+    """Skips files named `skip*` and sends `photo*` files to `options['photos']`."""
+    with LOCK:
+        CALLS.append(len(records))
+    decisions = []
+    for record in records:
+        name = Path(record["path"]).name
+        if name.startswith("skip"):
+            decisions.append(False)
+        elif name.startswith("photo"):
+            decisions.append({"destination": options["photos"], "rule": "Photos"})
+        else:
+            decisions.append(None)
+    return decisions
+
+
+def skip_everything(records, options):
+    return [False] * len(records)
+
+
+def broken(records, options):
+    raise RuntimeError("index is down")
+
+
+def slow_index(records, options):
+    time.sleep(options.get("delay", 0))
+    with LOCK:
+        MOVED.extend(records)
+
+
+class WarningsReporter(Reporter):
+    def __init__(self):
+        super().__init__()
+        self.warnings = []
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+
+@pytest.fixture
+def temp_dir():
+    CALLS.clear()
+    MOVED.clear()
+    temp_path = Path(tempfile.mkdtemp())
+    (temp_path / "inbox").mkdir()
+    for name in ("a.txt", "b.txt", "skip.txt", "photo.txt", "notes.md"):
+        (temp_path / "inbox" / name).write_text(name)
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+def make_config(temp_dir: Path, *plugins: Plugin) -> Config:
+    return Config(
+        target_directories=[str(temp_dir / "inbox")],
+        rename_format="{original_filename}",
+        rules=[
+            Rule(name="Docs", extensions=[".txt"], destination=str(temp_dir / "Docs")),
+            Rule(name="Notes", extensions=[".md"], destination=str(temp_dir / "Notes")),
+        ],
+        plugins=list(plugins),
+    )
+
+
+def destinations(actions) -> dict:
+    return {action.source.name: (action.destination.parent.name, action.rule) for action in actions}
+
+
+def test_classify_hook_skips_and_reroutes_in_batches(temp_dir):
+    plugin = Plugin(
+        hook="tests.test_plugins:route_by_name", stage="classify", batch_size=2, workers=2,
+        rules=["Docs"], options={"photos": str(temp_dir / "Photos")},
+    )
+    actions = RuleEngine(make_config(temp_dir, plugin)).process_directories()
+
+    assert destinations(actions) == {
+        "a.txt": ("Docs", "Docs"),
+        "b.txt": ("Docs", "Docs"),
+        "photo.txt": ("Photos", "Photos"),
+        "notes.md": ("Notes", "Notes"),
+    }
+    # Four Docs files in batches of two; the Notes file is never offered.
+    assert sorted(CALLS) == [2, 2]
+
+
+def test_classify_hook_in_worker_processes(temp_dir):
+    plugin = Plugin(hook="tests.test_plugins:skip_everything", stage="classify", processes=True, workers=2)
+    assert RuleEngine(make_config(temp_dir, plugin)).process_directories() == []
+
+
+def test_failing_classify_hook_keeps_the_rules_decision(temp_dir):
+    reporter = WarningsReporter()
+    plugin = Plugin(hook="tests.test_plugins:broken", stage="classify")
+    actions = RuleEngine(make_config(temp_dir, plugin), reporter=reporter).process_directories()
+
+    assert len(actions) == 5
+    assert "index is down" in reporter.warnings[0]
+
+
+def test_after_move_hooks_run_in_the_background(temp_dir):
+    reporter = WarningsReporter()
+    plugins = [
+        Plugin(hook="tests.test_plugins:slow_index", stage="after_move", batch_size=2, options={"delay": 0.05}),
+        Plugin(hook="tests.test_plugins:broken", stage="after_move"),
+    ]
+    cfg = make_config(temp_dir, *plugins)
+    actions = RuleEngine(cfg).process_directories()
+
+    processor = FileProcessor(rename_format=cfg.rename_format, reporter=reporter, plugins=cfg.plugins)
+    processor.manifest_path = temp_dir / "_fylum_index.md"
+    processor.json_manifest_path = temp_dir / "_fylum_index.json"
+    assert processor.process_actions(actions) == 5
+
+    assert sorted(Path(record["destination"]).name for record in MOVED) == [
+        "a.txt", "b.txt", "notes.md", "photo.txt", "skip.txt",
+    ]
+    assert {record["rule"] for record in MOVED} == {"Docs", "Notes"}
+    assert reporter.warnings == ["Plugin 'tests.test_plugins:broken' failed on 5 moved file(s): index is down"]
+
+
+def test_library_classify_applies_classify_hooks(temp_dir):
+    plugin = Plugin(
+        hook="tests.test_plugins:route_by_name", stage="classify", options={"photos": str(temp_dir / "Photos")},
+    )
+    with Fylum(make_config(temp_dir, plugin), history=HistoryStore(temp_dir / "history.db")) as fylum:
+        matches = fylum.classify(sorted((temp_dir / "inbox").iterdir()))
+
+    assert destinations(matches)["photo.txt"] == ("Photos", "Photos")
+    assert "skip.txt" not in destinations(matches)
+
+
+@pytest.mark.parametrize(
+    "hook", ["no_colon", "tests.test_plugins:missing", "tests.no_such_module:hook", "tests.test_plugins:LOCK"]
+)
+def test_hook_is_checked_when_the_config_is_read(hook):
+    with pytest.raises(ValueError):
+        Plugin(hook=hook, stage="classify")
@@ -77,3 +77,81 @@ def test_handle_duplicate_filename(temp_dir):
     assert processed == 1
     assert (dest_dir / "source_1.txt").exists()
     assert existing_file.exists()
+
+
+def test_moves_are_grouped_and_copies_use_their_own_lane(temp_dir, monkeypatch):
+    from src.reporting import Reporter
+
+    class Recorder(Reporter):
+        def __init__(self):
+            super().__init__()
+            self.moved_to = []
+
+        def moved(self, source, destination, size=None):
+            super().moved(source, destination, size)
+            self.moved_to.append(destination)
+
+    local, remote = temp_dir / "local", temp_dir / "remote"
+    real_device_of = FileProcessor._device_of
+    # Pretend `remote` is another disk, so moves there copy data.
+    monkeypatch.setattr(
+        FileProcessor, "_device_of",
+        lambda self, directory: -1 if directory == remote else real_device_of(self, directory),
+    )
+    actions = []
+    for i, directory in enumerate([local / "a", local / "b", remote, local / "a", local / "b", remote]):
+        source = temp_dir / f"file{i}.txt"
+        source.write_text(str(i))
+        actions.append((source, directory / "x"))
+    (remote / "file2.txt").parent.mkdir(parents=True)
+    (remote / "file2.txt").write_text("already there")
+
+    reporter = Recorder()
+    processor = FileProcessor(rename_format="{original_filename}", reporter=reporter, verify=True)
+    processed = processor.process_actions(actions)
+
+    assert processed == 6
+    renames = [path.parent for path in reporter.moved_to if path.parent != remote]
+    assert renames == [local / "a", local / "a", local / "b", local / "b"]
+    assert sorted(path.name for path in remote.iterdir()) == ["file2.txt", "file2_1.txt", "file5.txt"]
+    assert (remote / "file2_1.txt").read_text() == "2"
+    assert not any(temp_dir.glob("file*.txt"))
+    Path("_fylum_index.md").unlink(missing_ok=True)
+    Path("_fylum_index.json").unlink(missing_ok=True)
+
+
+def test_renames_are_journaled_in_batches(temp_dir, monkeypatch):
+    from src import processor as processor_module
+    from src.history import HistoryStore
+
+    monkeypatch.setattr(processor_module, "RENAME_BATCH", 2)
+    history = HistoryStore(temp_dir / "history.db")
+    journaled = []
+    begin_actions = history.begin_actions
+    monkeypatch.setattr(
+        history, "begin_actions",
+        lambda run_id, actions, timestamp=None: journaled.append(len(actions)) or begin_actions(run_id, actions, timestamp),
+    )
+    real_move = shutil.move
+
+    def move(source, destination):
+        if source.endswith("file2.txt"):
+            raise KeyboardInterrupt
+        return real_move(source, destination)
+
+    monkeypatch.setattr(processor_module.shutil, "move", move)
+    actions = []
+    for i in range(5):
+        (temp_dir / f"file{i}.txt").write_text(str(i))
+        actions.append((temp_dir / f"file{i}.txt", temp_dir / "out" / "x"))
+    processor = FileProcessor(rename_format="{original_filename}", history=history)
+    processor.manifest_path = temp_dir / "index.md"
+    processor.json_manifest_path = temp_dir / "index.json"
+
+    with pytest.raises(KeyboardInterrupt):
+        processor.process_actions(actions)
+
+    # The interrupted batch's unstarted moves are not left journaled.
+    assert journaled == [2, 2]
+    assert [Path(a["source"]).name for a in history.get_last_run()["actions"]] == \
+        ["file0.txt", "file1.txt"]
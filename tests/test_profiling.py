@@ -0,0 +1,44 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src.config import Config, Rule
+from src.engine import RuleEngine
+from src.profiling import RuleProfiler
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+def test_profile_counts_matches_and_flags_dead_rules(temp_dir):
+    for name in ("a.txt", "b.txt", "c.jpg", "d.tmp", "e.tmp.txt"):
+        (temp_dir / name).touch()
+    config = Config(
+        target_directories=[str(temp_dir)],
+        ignore_patterns=["*.tmp", "*.tmp.txt", "*.iso"],
+        rules=[
+            Rule(name="Docs", extensions=[".txt"], destination=str(temp_dir / "Docs")),
+            Rule(name="Text again", extensions=[".txt"], destination=str(temp_dir / "Text")),
+            Rule(name="Images", extensions=[".jpg"], destination=str(temp_dir / "Images")),
+            Rule(name="Videos", extensions=[".mp4"], destination=str(temp_dir / "Videos")),
+        ],
+    )
+
+    profiler = RuleProfiler(RuleEngine(config=config)).profile_directories()
+    results = {stats.name: stats for stats in profiler.results()}
+
+    assert profiler.files == 5
+    assert (results["Docs"].matches, results["Docs"].evaluations) == (2, 2)
+    assert results["Text again"].verdict == "shadowed"
+    assert results["Text again"].shadowed == 3
+    assert results["Videos"].verdict == "dead"
+    assert results["Images"].verdict == ""
+    assert results["*.tmp"].matches == 1
+    assert results["*.tmp.txt"].evaluations == 4
+    assert results["*.iso"].verdict == "dead"
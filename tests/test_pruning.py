@@ -0,0 +1,82 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src.config import Config, Rule
+from src.engine import RuleEngine
+from src.history import HistoryStore
+from src.processor import FileProcessor
+from src.pruning import REMOVED_DIRECTORY, EmptyDirectoryPruner
+from src.undo import UndoManager
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+@pytest.fixture
+def history(temp_dir):
+    store = HistoryStore(temp_dir / "history.db")
+    yield store
+    store.close()
+
+
+def organize(temp_dir: Path, target: Path, history: HistoryStore, before_moves=None) -> FileProcessor:
+    cfg = Config(
+        target_directories=[str(target)],
+        rules=[Rule(name="Docs", extensions=[".txt"], destination=str(temp_dir / "Docs"))],
+    )
+    engine = RuleEngine(cfg)
+    actions = engine.process_directories()
+    if before_moves is not None:
+        before_moves()
+    processor = FileProcessor(rename_format="{original_filename}", history=history)
+    processor.manifest_path = temp_dir / "_fylum_index.md"
+    processor.json_manifest_path = temp_dir / "_fylum_index.json"
+    pruner = EmptyDirectoryPruner(engine.directory_counts, [target])
+    processor.process_actions(actions, pruner=pruner)
+    return processor
+
+
+def test_removes_emptied_directories_and_undo_recreates_them(temp_dir, history):
+    target = temp_dir / "inbox"
+    (target / "a" / "b").mkdir(parents=True)
+    (target / "keep").mkdir()
+    (target / "was_empty").mkdir()
+    (target / "top.txt").write_text("top")
+    (target / "a" / "one.txt").write_text("one")
+    (target / "a" / "b" / "two.txt").write_text("two")
+    (target / "keep" / "three.txt").write_text("three")
+    (target / "keep" / "notes.pdf").write_text("unmatched")
+
+    processor = organize(temp_dir, target, history)
+
+    assert processor.removed_directories == [target / "a" / "b", target / "a"]
+    assert not (target / "a").exists()
+    assert (target / "keep").is_dir()
+    # Only directories emptied by this run are removed, never the target.
+    assert (target / "was_empty").is_dir()
+    assert target.is_dir()
+    removed = [action for action in history.get_last_run()["actions"] if action["mode"] == REMOVED_DIRECTORY]
+    assert [action["source"] for action in removed] == [str(target / "a" / "b"), str(target / "a")]
+
+    assert UndoManager(history=history).revert_last_run() == 4
+    assert (target / "a" / "one.txt").read_text() == "one"
+    assert (target / "a" / "b" / "two.txt").read_text() == "two"
+    assert history.get_last_run() is None
+
+
+def test_directory_written_to_after_the_scan_is_kept(temp_dir, history):
+    target = temp_dir / "inbox"
+    (target / "a").mkdir(parents=True)
+    (target / "a" / "one.txt").write_text("one")
+
+    processor = organize(temp_dir, target, history, lambda: (target / "a" / "new.pdf").write_text("new"))
+
+    assert processor.removed_directories == []
+    assert (target / "a" / "new.pdf").exists()
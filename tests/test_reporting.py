@@ -0,0 +1,104 @@
+import io
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src.history import HistoryStore
+from src.processor import FileProcessor
+from src.reporting import ConsoleReporter, JsonlReporter, Reporter
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+def move_files(temp_dir, reporter, count=3, dry_run=False):
+    actions = []
+    for i in range(count):
+        source = temp_dir / f"file{i}.txt"
+        source.write_text("x" * 10)
+        actions.append((source, temp_dir / "dest" / source.name))
+    history = HistoryStore(temp_dir / "history.db")
+    processed = FileProcessor(
+        rename_format="{original_filename}", dry_run=dry_run, history=history, reporter=reporter
+    ).process_actions(actions)
+    history.close()
+    Path("_fylum_index.md").unlink(missing_ok=True)
+    Path("_fylum_index.json").unlink(missing_ok=True)
+    return processed
+
+
+def test_console_reporter_is_quiet_unless_verbose(temp_dir):
+    stream = io.StringIO()
+
+    move_files(temp_dir, ConsoleReporter(stream=stream))
+
+    assert "Moved:" not in stream.getvalue()
+
+
+def test_console_reporter_verbose_lists_moves(temp_dir):
+    stream = io.StringIO()
+
+    move_files(temp_dir, ConsoleReporter(verbose=True, stream=stream))
+
+    assert stream.getvalue().count("Moved:") == 3
+
+
+def test_console_reporter_always_lists_dry_run(temp_dir):
+    stream = io.StringIO()
+
+    move_files(temp_dir, ConsoleReporter(stream=stream), dry_run=True)
+
+    assert stream.getvalue().count("[DRY RUN] Would move:") == 3
+
+
+def test_console_reporter_buffers_lines():
+    stream = io.StringIO()
+    reporter = ConsoleReporter(verbose=True, stream=stream, interval=3600, buffer_lines=10)
+
+    for i in range(5):
+        reporter.moved(Path(f"/a/{i}"), Path(f"/b/{i}"))
+    assert stream.getvalue() == ""
+
+    reporter.finish()
+    assert stream.getvalue().count("Moved:") == 5
+
+
+def test_console_reporter_progress_text():
+    reporter = ConsoleReporter(stream=io.StringIO())
+    reporter.start(total=10, total_bytes=1000)
+    for i in range(5):
+        reporter.moved(Path(f"/a/{i}"), Path(f"/b/{i}"), size=100)
+
+    text = reporter.progress_text()
+
+    assert text.startswith("5/10 files")
+    assert "ETA" in text
+
+
+def test_jsonl_reporter_events(temp_dir):
+    stream = io.StringIO()
+
+    move_files(temp_dir, JsonlReporter(stream=stream))
+
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    moved = [event for event in events if event["event"] == "moved"]
+    assert len(moved) == 3
+    assert moved[0]["size"] == 10
+    assert events[-1]["event"] == "summary"
+    assert events[-1]["files"] == 3
+    assert events[-1]["bytes"] == 30
+
+
+def test_base_reporter_counts_silently(temp_dir):
+    reporter = Reporter()
+
+    assert move_files(temp_dir, reporter) == 3
+    assert reporter.done == 3
+    assert reporter.errors == 0
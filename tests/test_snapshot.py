@@ -0,0 +1,75 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src.config import Config, Rule
+from src.engine import RuleEngine
+from src.snapshot import Snapshot, SnapshotWriter
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+@pytest.fixture
+def tree(temp_dir):
+    root = temp_dir / "Downloads"
+    for directory in ("", "photos", "photos/2024", "docs"):
+        (root / directory).mkdir(parents=True, exist_ok=True)
+    for name in ("a.txt", "photos/b.jpg", "photos/2024/c.jpg", "docs/d.txt", "docs/naïve résumé.txt"):
+        (root / name).write_text(name)
+    return root
+
+
+def test_snapshot_round_trips_paths_and_stats(tree, temp_dir):
+    engine = RuleEngine(config=Config())
+    scanned = sorted(engine.scan(tree))
+
+    with SnapshotWriter(temp_dir / "tree.bin") as writer:
+        writer.add_all(scanned)
+
+    with Snapshot(temp_dir / "tree.bin") as snapshot:
+        assert len(snapshot) == len(scanned)
+        assert snapshot.directory_count == 4
+        restored = list(snapshot)
+        assert snapshot[2][0] == scanned[2][0]
+
+    assert [path for path, _ in restored] == [path for path, _ in scanned]
+    for (_, original), (_, copy) in zip(scanned, restored):
+        assert (copy.st_size, copy.st_mtime_ns, copy.st_ino, copy.st_dev, copy.st_mode) == \
+            (original.st_size, original.st_mtime_ns, original.st_ino, original.st_dev, original.st_mode)
+
+
+def test_classifying_a_snapshot_matches_a_live_scan(tree, temp_dir):
+    (tree / "photos" / ".fylum.yaml").write_text("ignore_patterns: ['c.jpg']\n")
+    config = Config(
+        target_directories=[str(tree)],
+        rules=[
+            Rule(name="Images", extensions=[".jpg"], destination=str(temp_dir / "Images")),
+            Rule(name="Docs", extensions=[".txt"], destination=str(temp_dir / "Docs")),
+        ],
+    )
+    engine = RuleEngine(config=config)
+    with SnapshotWriter(temp_dir / "tree.bin") as writer:
+        writer.add_all(engine.scan(tree))
+
+    with Snapshot(temp_dir / "tree.bin") as snapshot:
+        from_snapshot = engine.process_files(snapshot)
+    live = engine.process_directories()
+
+    assert sorted((m.source, m.rule) for m in from_snapshot) == sorted((m.source, m.rule) for m in live)
+    assert tree / "photos" / "2024" / "c.jpg" not in [m.source for m in from_snapshot]
+
+
+def test_rejects_other_files(temp_dir):
+    (temp_dir / "plan.jsonl").write_text('{"version": 1}\n' * 10)
+    (temp_dir / "empty.bin").write_bytes(b"")
+
+    for name in ("plan.jsonl", "empty.bin"):
+        with pytest.raises(ValueError):
+            Snapshot(temp_dir / name)
@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from src import stability
+from src.engine import FileMatch
+from src.stability import settled
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+def match(path: Path) -> FileMatch:
+    return FileMatch(path, path.parent / "out" / path.name, "Docs", path.stat())
+
+
+def test_old_files_pass_without_waiting(temp_dir, monkeypatch):
+    old = temp_dir / "old.txt"
+    old.write_text("done")
+    os.utime(old, (time.time() - 60, time.time() - 60))
+    monkeypatch.setattr(stability.time, "sleep", lambda seconds: pytest.fail("should not wait"))
+
+    deferred = []
+    assert list(settled([match(old)], 5, deferred)) == [(old, temp_dir / "out" / "old.txt")]
+    assert deferred == []
+
+
+def test_files_still_written_are_deferred(temp_dir, monkeypatch):
+    old, quiet, growing = temp_dir / "old.txt", temp_dir / "quiet.txt", temp_dir / "growing.part.txt"
+    for path in (old, quiet, growing):
+        path.write_text("x")
+    os.utime(old, (time.time() - 60, time.time() - 60))
+    sleeps = []
+
+    def sleep(seconds):
+        # The writer is still appending while fylum waits.
+        sleeps.append(seconds)
+        with open(growing, "a") as f:
+            f.write("more")
+
+    monkeypatch.setattr(stability.time, "sleep", sleep)
+    deferred = []
+    moved = [action[0] for action in settled([match(quiet), match(old), match(growing)], 5, deferred)]
+
+    # Old files come first, so they can be moved while the rest settle.
+    assert moved == [old, quiet]
+    assert [action[0] for action in deferred] == [growing]
+    assert len(sleeps) == 1 and 0 < sleeps[0] <= 5
+
+
+def test_disabled_by_default(temp_dir):
+    fresh = temp_dir / "fresh.txt"
+    fresh.write_text("x")
+
+    assert len(list(settled([match(fresh)], 0, []))) == 1
@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from src.config import Config, ObjectStorage, Rule
+from src.engine import RuleEngine
+from src.history import HistoryStore
+from src.processor import FileProcessor
+from src.reporting import Reporter
+from src.storage import BACKENDS, LocalObjectStore, StorageBackend, is_remote, open_backend, register_backend, split_remote
+from src.undo import UndoManager
+
+
+@pytest.fixture
+def temp_dir():
+    temp_path = Path(tempfile.mkdtemp())
+    yield temp_path
+    shutil.rmtree(temp_path)
+
+
+@pytest.fixture
+def history(temp_dir):
+    store = HistoryStore(temp_dir / "history.db")
+    yield store
+    store.close()
+
+
+def test_remote_destinations_survive_path_handling():
+    destination = Path("s3://archive/old/docs") / "a.txt"
+    assert is_remote(destination) and is_remote("s3://archive")
+    assert not is_remote(Path("/home/s3/docs"))
+    assert split_remote(destination) == ("archive", "old/docs/a.txt")
+    assert split_remote("s3://archive") == ("archive", "")
+
+
+def test_local_store_uploads_in_parts(temp_dir):
+    source = temp_dir / "big.bin"
+    data = os.urandom(10_500)
+    source.write_bytes(data)
+    os.utime(source, ns=(1_600_000_000_000_000_000, 1_600_000_000_000_000_000))
+
+    store = LocalObjectStore(temp_dir / "store", part_size=1000, max_concurrency=4)
+    store.upload(source, "bucket", "files/big.bin")
+    assert store.size("bucket", "files/big.bin") == len(data)
+    assert list(store.list_names("bucket", "files")) == ["big.bin"]
+
+    restored = temp_dir / "restored.bin"
+    store.download("bucket", "files/big.bin", restored)
+    assert restored.read_bytes() == data
+    assert restored.stat().st_mtime_ns == 1_600_000_000_000_000_000
+
+    store.delete_many("bucket", ["files/big.bin"])
+    assert store.size("bucket", "files/big.bin") is None
+    store.close()
+
+
+def test_clean_to_object_storage_and_undo(temp_dir, history):
+    inbox = temp_dir / "inbox"
+    inbox.mkdir()
+    for name in ("a.txt", "b.txt"):
+        (inbox / name).write_text(name)
+    storage = ObjectStorage(backend="local", root=str(temp_dir / "store"), part_size=4)
+    existing = temp_dir / "store" / "archive" / "docs" / "a.txt"
+    existing.parent.mkdir(parents=True)
+    existing.write_text("already there")
+
+    cfg = Config(
+        target_directories=[str(inbox)],
+        rename_format="{original_filename}",
+        rules=[Rule(name="Docs", extensions=[".txt"], destination="s3://archive/docs")],
+        object_storage=storage,
+    )
+    processor = FileProcessor(rename_format=cfg.rename_format, history=history, object_storage=storage)
+    processor.manifest_path = temp_dir / "_fylum_index.md"
+    processor.json_manifest_path = temp_dir / "_fylum_index.json"
+    assert processor.process_actions(RuleEngine(cfg).process_directories()) == 2
+
+    assert list(inbox.iterdir()) == []
+    assert sorted(os.listdir(existing.parent)) == ["a.txt", "a_1.txt", "b.txt"]
+    assert (existing.parent / "a_1.txt").read_text() == "a.txt"
+    destinations = sorted(action["destination"] for action in history.get_last_run()["actions"])
+    assert destinations == ["s3://archive/docs/a_1.txt", "s3://archive/docs/b.txt"]
+
+    assert UndoManager(history=history, object_storage=storage).revert_last_run() == 2
+    assert (inbox / "a.txt").read_text() == "a.txt"
+    assert (inbox / "b.txt").read_text() == "b.txt"
+    assert sorted(os.listdir(existing.parent)) == ["a.txt"]
+
+
+class TruncatingStore(LocalObjectStore):
+    """Reports every object one byte short, as if the upload was cut off."""
+
+    def size(self, bucket, key):
+        size = super().size(bucket, key)
+        return None if size is None else size - 1
+
+
+def test_source_is_kept_when_the_upload_is_not_confirmed(temp_dir, history):
+    register_backend("truncating", lambda storage: TruncatingStore(storage.root))
+    try:
+        storage = ObjectStorage(backend="truncating", root=str(temp_dir / "store"))
+        source = temp_dir / "a.txt"
+        source.write_text("data")
+        processor = FileProcessor(
+            rename_format="{original_filename}", history=history, reporter=Reporter(), object_storage=storage
+        )
+        processor.manifest_path = temp_dir / "_fylum_index.md"
+        processor.json_manifest_path = temp_dir / "_fylum_index.json"
+
+        assert processor.process_actions([(source, Path("s3://bucket/docs/a.txt"))]) == 0
+        assert source.read_text() == "data"
+        assert not (temp_dir / "store" / "bucket" / "docs" / "a.txt").exists()
+        assert history.get_last_run() is None
+    finally:
+        del BACKENDS["truncating"]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        open_backend(ObjectStorage(backend="nope"))
+
+
+def test_incomplete_backend_fails_when_opened():
+    class UploadOnly(StorageBackend):
+        def upload(self, source, bucket, key):
+            pass
+
+    register_backend("upload-only", lambda storage: UploadOnly())
+    try:
+        with pytest.raises(TypeError):
+            open_backend(ObjectStorage(backend="upload-only"))
+    finally:
+        del BACKENDS["upload-only"]
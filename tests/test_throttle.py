@@ -0,0 +1,64 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from src.config import Config, Rule, Throttle
+from src.engine import RuleEngine
+from src.throttle import IOThrottle, TokenBucket
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, capacity=1)
+
+    start = time.monotonic()
+    for _ in range(21):
+        bucket.acquire()
+    elapsed = time.monotonic() - start
+
+    assert elapsed >= 0.18
+
+
+def test_token_bucket_allows_burst_within_capacity():
+    bucket = TokenBucket(rate=1, capacity=50)
+
+    start = time.monotonic()
+    for _ in range(50):
+        bucket.acquire()
+
+    assert time.monotonic() - start < 0.5
+
+
+def test_token_bucket_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_from_config_is_none_without_limits():
+    assert IOThrottle.from_config(Throttle()) is None
+
+
+def test_from_config_splits_limits_between_workers():
+    throttle = IOThrottle.from_config(Throttle(ops_per_second=100, bytes_per_second=1000), share=4)
+
+    assert throttle.ops.rate == 25
+    assert throttle.bytes.rate == 250
+
+
+def test_engine_scan_is_throttled(tmp_path: Path):
+    for i in range(10):
+        (tmp_path / f"file{i}.txt").write_text("x")
+    config = Config(
+        target_directories=[str(tmp_path)],
+        rules=[Rule(name="Docs", extensions=[".txt"], destination=str(tmp_path / "Docs"))],
+        throttle=Throttle(ops_per_second=50),
+    )
+    engine = RuleEngine(config=config)
+    engine.throttle.ops.tokens = 0
+
+    start = time.monotonic()
+    actions = engine.process_directories()
+
+    # One op for the directory listing plus one per file, at 50 ops/s.
+    assert len(actions) == 10
+    assert time.monotonic() - start >= 0.2